@@ -15,10 +15,14 @@
 # limitations under the License.
 """See docstring for AdobeAcrobatProUpdateInfoProvider class"""
 
+import hashlib
+import os
 import plistlib
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from autopkglib import ProcessorError
+from autopkglib import ProcessorError, get_pref
 from autopkglib.URLGetter import URLGetter
 
 __all__ = ["AdobeAcrobatProUpdateInfoProvider"]
@@ -31,7 +35,12 @@ META_BASE_URL = "https://armmf.adobe.com/arm-manifests/mac"
 MANIFEST_URL_TEMPLATE = META_BASE_URL + "/{MAJREV}/manifest_url_template.txt"
 DL_BASE_URL = "http://armdl.adobe.com"
 
-_URL_VARS = {"PROD": "com_adobe_Acrobat_Pro", "PROD_ARCH": "univ"}
+# Manifests at versioned URLs never change once published
+VERSIONED_MANIFEST_RE = re.compile(r"/\d+\.\d+\.\d+/")
+BASE_VERSION_RE = re.compile(r"\.0+\.0+$")
+MAX_CHAIN_LENGTH = 100
+
+URL_VARS_DEFAULT = {"PROD": "com_adobe_Acrobat_Pro", "PROD_ARCH": "univ"}
 SUPPORTED_VERS = ["9", "10", "11"]
 
 
@@ -45,14 +54,25 @@ class AdobeAcrobatProUpdateInfoProvider(URLGetter):
             "description": ("OS X version. Defaults to %s" % TARGET_DEFAULT),
         },
         "major_version": {
-            "required": True,
+            "required": False,
+            "description": (
+                "Major version. Currently supports: %s. Required unless "
+                "major_versions is set." % ", ".join(SUPPORTED_VERS)
+            ),
+        },
+        "major_versions": {
+            "required": False,
             "description": (
-                "Major version. Currently supports: %s" % ", ".join(SUPPORTED_VERS)
+                "List (or comma-separated string) of major versions to resolve "
+                "at the same time into major_version_updates."
             ),
         },
         "version": {
             "required": False,
-            "description": ("Update version number. Defaults to %s." % VERSION_DEFAULT),
+            "description": (
+                "Update version number. Defaults to %s. Only applies to the "
+                "major version it belongs to." % VERSION_DEFAULT
+            ),
         },
         "munki_update_name": {
             "required": False,
@@ -68,6 +88,18 @@ class AdobeAcrobatProUpdateInfoProvider(URLGetter):
         "additional_pkginfo": {
             "description": "A pkginfo possibly containing additional 'requires' items."
         },
+        "requires_chain": {
+            "description": (
+                "The updates this update requires, down to the base release, "
+                "oldest first. Each is a dict with 'name', 'version' and 'url'."
+            )
+        },
+        "major_version_updates": {
+            "description": (
+                "Dict of each of major_versions to a dict with the 'url', "
+                "'version' and 'prev_version' of its update."
+            )
+        },
     }
 
     def process_target_os(self, os_version):
@@ -89,19 +121,49 @@ class AdobeAcrobatProUpdateInfoProvider(URLGetter):
             raise ProcessorError("OS X Version %s not recognised" % os_version)
         return (major_vers, minor_vers)
 
-    def process_url_vars(self, url):
+    def get_url_vars(self, major_version, target_os):
+        """Returns the values of the keys in URL templates for major_version"""
+        if major_version not in SUPPORTED_VERS:
+            raise ProcessorError(
+                "major_version %s not one of those supported: %s"
+                % (major_version, ", ".join(SUPPORTED_VERS))
+            )
+        # Adobe require a target OS X version to be passed to the URL on more recent
+        # updates
+        target_os_parsed = self.process_target_os(target_os)
+        url_vars = dict(URL_VARS_DEFAULT)
+        url_vars["MAJREV"] = major_version
+        url_vars["OS_VER_MAJ"] = target_os_parsed[0]
+        url_vars["OS_VER_MIN"] = target_os_parsed[1]
+        return url_vars
+
+    def process_url_vars(self, url, url_vars):
         """Substitute keys in URL templates with actual values"""
         # pylint: disable=no-self-use
-        for var in list(_URL_VARS.keys()):
-            subbed_url = url.replace(r"{{{}}}".format(var), _URL_VARS[var])
-            url = subbed_url
-        return subbed_url
+        for var, value in url_vars.items():
+            url = url.replace(r"{{{}}}".format(var), value)
+        return url
 
-    def get_manifest_data(self, manifest_plist_url):
-        """Get manifest(plist) data from a url"""
-        manifest_plist_response = self.download(manifest_plist_url)
+    def get_manifest_cache_path(self, manifest_plist_url):
+        """Returns where the manifest at a versioned url is cached, or None
+        if the url isn't versioned."""
+        if not VERSIONED_MANIFEST_RE.search(manifest_plist_url):
+            return None
+        cache_dir = get_pref("CACHE_DIR") or os.path.expanduser(
+            "~/Library/AutoPkg/Cache"
+        )
+        return os.path.join(
+            cache_dir,
+            "AdobeAcrobatPro",
+            "manifests",
+            "%s.plist" % hashlib.sha1(manifest_plist_url.encode("utf-8")).hexdigest(),
+        )
+
+    def parse_manifest(self, manifest_plist, manifest_plist_url):
+        """Returns the manifest data in manifest_plist"""
+        # pylint: disable=no-self-use
         try:
-            manifest_data = plistlib.loads(manifest_plist_response)
+            manifest_data = plistlib.loads(manifest_plist)
         except Exception as err:
             raise ProcessorError(
                 "Can't parse manifest plist at %s: %s" % (manifest_plist_url, err)
@@ -115,9 +177,75 @@ class AdobeAcrobatProUpdateInfoProvider(URLGetter):
 
         return manifest_data
 
-    def get_acrobat_metadata(self, get_version):
-        """Returns a tuple: (url, version, previous_required_version)"""
-        template_url = self.process_url_vars(MANIFEST_URL_TEMPLATE)
+    def get_manifest_data(self, manifest_plist_url):
+        """Get manifest(plist) data from a url, or from the cache if the url
+        is versioned and was fetched before"""
+        cache_path = self.get_manifest_cache_path(manifest_plist_url)
+        manifest_data = None
+        if cache_path:
+            try:
+                with open(cache_path, "rb") as f:
+                    manifest_data = self.parse_manifest(f.read(), manifest_plist_url)
+                self.output(
+                    "Using cached manifest for %s" % manifest_plist_url, verbose_level=2
+                )
+            except (OSError, ProcessorError):
+                manifest_data = None
+        if manifest_data is None:
+            manifest_plist = self.download(manifest_plist_url)
+            manifest_data = self.parse_manifest(manifest_plist, manifest_plist_url)
+            if cache_path:
+                tmp_path = "%s.%d.%d.tmp" % (
+                    cache_path,
+                    os.getpid(),
+                    threading.get_ident(),
+                )
+                try:
+                    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                    with open(tmp_path, "wb") as f:
+                        f.write(manifest_plist)
+                    os.replace(tmp_path, cache_path)
+                except OSError as err:
+                    self.output("Can't cache %s: %s" % (manifest_plist_url, err))
+        return manifest_data
+
+    def get_previous_manifest_data(self, manifest_data, url_vars):
+        """Returns the manifest data of the release manifest_data requires,
+        or None if it doesn't require one"""
+        prev_template = manifest_data.get("PreviousURLTemplate", "noTemplate")
+        if not prev_template or prev_template == "noTemplate":
+            return None
+        return self.get_manifest_data(
+            self.process_url_vars(META_BASE_URL + prev_template, url_vars)
+        )
+
+    def get_update_chain(self, manifest_data, url_vars):
+        """Returns the manifest data of every release manifest_data requires,
+        directly or not, down to the base release, newest first"""
+        chain = []
+        seen = {manifest_data["BuildNumber"]}
+        prev_manifest_data = self.get_previous_manifest_data(manifest_data, url_vars)
+        while prev_manifest_data is not None:
+            version = prev_manifest_data["BuildNumber"]
+            if version in seen or len(chain) >= MAX_CHAIN_LENGTH:
+                raise ProcessorError(
+                    "Update chain of %s doesn't reach a base release"
+                    % manifest_data["BuildNumber"]
+                )
+            seen.add(version)
+            chain.append(prev_manifest_data)
+            if BASE_VERSION_RE.search(version):
+                break
+            prev_manifest_data = self.get_previous_manifest_data(
+                prev_manifest_data, url_vars
+            )
+        return chain
+
+    def get_acrobat_metadata(self, get_version, url_vars):
+        """Returns a tuple: (url, version, update_chain), where update_chain
+        is a list of (url, version) of the releases this one requires, newest
+        first"""
+        template_url = self.process_url_vars(MANIFEST_URL_TEMPLATE, url_vars)
         template_response = self.download(template_url, text=True)
 
         if get_version != "latest":
@@ -125,58 +253,111 @@ class AdobeAcrobatProUpdateInfoProvider(URLGetter):
             # /{MAJREV}/get_version/{PROD}_{PROD_ARCH}.plist
             template_response = re.sub(r"\d+\.\d+\.\d+", get_version, template_response)
 
-        manifest_url = self.process_url_vars(META_BASE_URL + template_response)
+        manifest_url = self.process_url_vars(
+            META_BASE_URL + template_response, url_vars
+        )
         manifest_data = self.get_manifest_data(manifest_url)
 
         composed_dl_url = DL_BASE_URL + manifest_data["PatchURL"]
         version = manifest_data["BuildNumber"]
-        # If there's a previous required version,
-        # store that version for later use
-        if manifest_data.get("PreviousURLTemplate", "") != "noTemplate":
-            prev_manifest_url = self.process_url_vars(
-                META_BASE_URL + manifest_data["PreviousURLTemplate"]
-            )
-            prev_manifest_data = self.get_manifest_data(prev_manifest_url)
-            prev_version = prev_manifest_data["BuildNumber"]
-        return (composed_dl_url, version, prev_version)
-
-    def main(self):
-        """Do our processor task!"""
-        target_os = self.env.get("target_os", TARGET_DEFAULT)
-        major_version = self.env["major_version"]
-        get_version = self.env.get("version", VERSION_DEFAULT)
-        if major_version not in SUPPORTED_VERS:
-            raise ProcessorError(
-                "major_version %s not one of those supported: %s"
-                % (major_version, ", ".join(SUPPORTED_VERS))
+        update_chain = [
+            (
+                DL_BASE_URL + prev_manifest_data["PatchURL"],
+                prev_manifest_data["BuildNumber"],
             )
+            for prev_manifest_data in self.get_update_chain(manifest_data, url_vars)
+        ]
+        return (composed_dl_url, version, update_chain)
 
-        # Adobe require a target OS X version to be passed to the URL on more recent
-        # updates
-        target_os_parsed = self.process_target_os(target_os)
-        # global _URL_VARS global statement not needed to modify a key/value pair
-        _URL_VARS["MAJREV"] = major_version
-        _URL_VARS["OS_VER_MAJ"] = target_os_parsed[0]
-        _URL_VARS["OS_VER_MIN"] = target_os_parsed[1]
-
+    def get_update_info(self, major_version, get_version, target_os):
+        """Returns a dict with the url, version, prev_version, requires_chain
+        and additional_pkginfo of the update of major_version. Safe to call
+        from several threads at once."""
+        url_vars = self.get_url_vars(major_version, target_os)
         munki_update_name = self.env.get("munki_update_name", "")
         if not munki_update_name:
-            munki_update_name = self.process_url_vars(MUNKI_UPDATE_NAME_DEFAULT)
-        url, version, prev_version = self.get_acrobat_metadata(get_version)
+            munki_update_name = self.process_url_vars(
+                MUNKI_UPDATE_NAME_DEFAULT, url_vars
+            )
+        url, version, update_chain = self.get_acrobat_metadata(get_version, url_vars)
 
         new_pkginfo = {}
 
-        # if our required version is something other than a base version
-        # should match a version ending in '.0.0', '.00.0', '.00.00', etc.
-        if not re.search(r"\.[0]+\.[0]+", prev_version):
-            new_pkginfo["requires"] = ["%s-%s" % (munki_update_name, prev_version)]
-            self.output("Update requires previous version: %s" % prev_version)
+        # Base versions (ending in '.0.0', '.00.0', '.00.00', etc.) come with
+        # the full installer rather than as updates, so they aren't required
+        requires_chain = [
+            {
+                "name": "%s-%s" % (munki_update_name, prev_version),
+                "version": prev_version,
+                "url": prev_url,
+            }
+            for prev_url, prev_version in reversed(update_chain)
+            if not BASE_VERSION_RE.search(prev_version)
+        ]
+        if requires_chain:
+            new_pkginfo["requires"] = [requires_chain[-1]["name"]]
+            self.output(
+                "Update %s requires previous version: %s"
+                % (version, requires_chain[-1]["version"])
+            )
         new_pkginfo["minimum_os_version"] = "%s.0" % target_os
         new_pkginfo["version"] = version
-        self.env["additional_pkginfo"] = new_pkginfo
-        self.env["url"] = url
-        self.env["version"] = version
-        self.output("Found URL %s" % self.env["url"])
+        return {
+            "url": url,
+            "version": version,
+            "prev_version": update_chain[0][1] if update_chain else "",
+            "requires_chain": requires_chain,
+            "additional_pkginfo": new_pkginfo,
+        }
+
+    def get_major_versions(self):
+        """Returns the list of major versions from major_versions"""
+        major_versions = self.env.get("major_versions") or []
+        if isinstance(major_versions, str):
+            major_versions = major_versions.split(",")
+        return [str(major_version).strip() for major_version in major_versions]
+
+    def main(self):
+        """Do our processor task!"""
+        target_os = self.env.get("target_os", TARGET_DEFAULT)
+        major_version = self.env.get("major_version")
+        major_versions = self.get_major_versions()
+        get_version = self.env.get("version", VERSION_DEFAULT)
+        if not major_version and not major_versions:
+            raise ProcessorError("Either major_version or major_versions is required")
+
+        def resolve(major_version):
+            # An explicit version only makes sense for its own major version
+            if get_version.split(".")[0] == major_version:
+                return self.get_update_info(major_version, get_version, target_os)
+            return self.get_update_info(major_version, VERSION_DEFAULT, target_os)
+
+        if major_version:
+            update_info = self.get_update_info(major_version, get_version, target_os)
+            self.env["requires_chain"] = update_info["requires_chain"]
+            self.env["additional_pkginfo"] = update_info["additional_pkginfo"]
+            self.env["url"] = update_info["url"]
+            self.env["version"] = update_info["version"]
+            self.output("Found URL %s" % self.env["url"])
+
+        if major_versions:
+            with ThreadPoolExecutor(max_workers=len(major_versions)) as executor:
+                results = dict(
+                    zip(major_versions, executor.map(resolve, major_versions))
+                )
+            self.env["major_version_updates"] = {
+                major_version: {
+                    "url": update_info["url"],
+                    "version": update_info["version"],
+                    "prev_version": update_info["prev_version"],
+                }
+                for major_version, update_info in results.items()
+            }
+            for major_version, update_info in sorted(results.items()):
+                self.output(
+                    "Found URL %s for major version %s"
+                    % (update_info["url"], major_version)
+                )
 
 
 if __name__ == "__main__":
@@ -17,9 +17,18 @@
 
 from __future__ import absolute_import
 
+import bisect
+import bz2
+import gzip
+import hashlib
+import lzma
 import os
+import plistlib
 import shutil
+import struct
 import subprocess
+import unicodedata
+import zlib
 from xml.etree import ElementTree
 
 from autopkglib import ProcessorError
@@ -27,6 +36,523 @@ from autopkglib.DmgMounter import DmgMounter
 
 __all__ = ["AdobeReaderRepackager"]
 
+APP_PKG = "application_mini_7z.pkg"
+PREINSTALL_SCRIPTS = ["readerdc_preinstall", "reader_preinstall"]
+# Bump this whenever edit_distribution or the way the pkg is patched changes,
+# so earlier results aren't reused
+REPACKAGE_RULES_VERSION = 1
+REPACKAGE_CACHE_NAME = ".repackage_cache.plist"
+
+XAR_MAGIC = b"xar!"
+# magic, header size, version, compressed and uncompressed TOC length,
+# TOC checksum algorithm
+XAR_HEADER = struct.Struct(">4sHHQQI")
+XAR_CHECKSUM_ALGORITHMS = {0: None, 1: "sha1", 2: "md5"}
+XAR_NAMED_CHECKSUM = 3
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# "odc" cpio, as pkgbuild writes Scripts archives: a 76 byte header of
+# octal fields, then the NUL terminated name and the file data
+CPIO_ODC_MAGIC = b"070707"
+CPIO_ODC_HEADER_SIZE = 76
+CPIO_ODC_NAMESIZE = slice(59, 65)
+CPIO_ODC_FILESIZE = slice(65, 76)
+CPIO_TRAILER = b"TRAILER!!!"
+
+# UDIF disk images end with a 512 byte "koly" trailer; of it we need the
+# magic, the data fork offset and the location of the XML partition list
+UDIF_MAGIC = b"koly"
+UDIF_TRAILER = struct.Struct(">4s20xQ184xQQ280x")
+SECTOR_SIZE = 512
+# Each partition's block map ("mish") lists chunks of sectors and how they
+# are stored
+MISH_MAGIC = b"mish"
+MISH_HEADER_SIZE = 204
+MISH_CHUNK = struct.Struct(">IIQQQQ")
+UDIF_CHUNK_TYPES = {
+    0x00000000: "zero",
+    0x00000001: "raw",
+    0x00000002: "zero",
+    0x80000005: "zlib",
+    0x80000006: "bzip2",
+    0x80000008: "lzma",
+}
+UDIF_CHUNK_COMMENT = 0x7FFFFFFE
+UDIF_CHUNK_TERMINATOR = 0xFFFFFFFF
+UDIF_CHUNK_CACHE_SIZE = 4
+
+HFS_VOLUME_HEADER_OFFSET = 1024
+HFS_SIGNATURES = (b"H+", b"HX")
+HFS_ROOT_FOLDER_ID = 2
+HFS_FOLDER_RECORD = 1
+HFS_FILE_RECORD = 2
+HFS_HARD_LINK_TYPE = b"hlnkhfs+"
+BTREE_LEAF_NODE = -1
+UF_COMPRESSED = 0x20
+
+
+class XarError(ProcessorError):
+    """A xar archive this module can't patch."""
+
+
+def replace_cpio_member(archive, name, data):
+    """Returns a copy of an odc cpio archive with the contents of the member
+    called name (or ./name) replaced by data. All other members, and the
+    member's own metadata, are kept as is."""
+    out = bytearray()
+    pos = 0
+    found = False
+    wanted = (name.encode("utf-8"), b"./" + name.encode("utf-8"))
+    while True:
+        header = archive[pos : pos + CPIO_ODC_HEADER_SIZE]
+        if len(header) < CPIO_ODC_HEADER_SIZE or header[:6] != CPIO_ODC_MAGIC:
+            raise XarError("Not an odc cpio archive")
+        namesize = int(header[CPIO_ODC_NAMESIZE], 8)
+        filesize = int(header[CPIO_ODC_FILESIZE], 8)
+        name_start = pos + CPIO_ODC_HEADER_SIZE
+        data_start = name_start + namesize
+        member_name = archive[name_start : data_start - 1]
+        member_data = archive[data_start : data_start + filesize]
+        if member_name in wanted:
+            header = header[: CPIO_ODC_FILESIZE.start] + b"%011o" % len(data)
+            member_data = data
+            found = True
+        out += header + archive[name_start:data_start] + member_data
+        pos = data_start + filesize
+        if member_name == CPIO_TRAILER:
+            # keep any block padding
+            out += archive[pos:]
+            break
+    if not found:
+        raise XarError("%s not found in cpio archive" % name)
+    return bytes(out)
+
+
+class XarArchive:
+    """Reads a xar archive (a flat package) and writes a copy of it with
+    some files replaced, copying the heap data of every other file byte for
+    byte instead of extracting and compressing it again."""
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "rb") as f:
+                header = f.read(XAR_HEADER.size)
+                if len(header) < XAR_HEADER.size:
+                    raise XarError("%s is not a xar archive" % path)
+                (
+                    magic,
+                    header_size,
+                    self.version,
+                    toc_length,
+                    _,
+                    self.checksum_alg,
+                ) = XAR_HEADER.unpack(header)
+                if magic != XAR_MAGIC:
+                    raise XarError("%s is not a xar archive" % path)
+                extra = f.read(header_size - XAR_HEADER.size)
+                if self.checksum_alg == XAR_NAMED_CHECKSUM:
+                    self.checksum_name = extra.split(b"\0")[0].decode("ascii")
+                elif self.checksum_alg in XAR_CHECKSUM_ALGORITHMS:
+                    self.checksum_name = XAR_CHECKSUM_ALGORITHMS[self.checksum_alg]
+                else:
+                    raise XarError(
+                        "Unknown TOC checksum algorithm %d" % self.checksum_alg
+                    )
+                self.toc = ElementTree.fromstring(zlib.decompress(f.read(toc_length)))
+                self.heap_start = header_size + toc_length
+        except (OSError, zlib.error, ElementTree.ParseError, UnicodeError) as err:
+            raise XarError("Can't read %s: %s" % (path, err))
+
+    def find(self, path):
+        """Returns the TOC <file> element at path, like 'a.pkg/Scripts'."""
+        parent = self.toc.find("toc")
+        for name in path.split("/"):
+            for child in parent.findall("file"):
+                if child.findtext("name") == name:
+                    parent = child
+                    break
+            else:
+                raise XarError("%s not found in %s" % (path, self.path))
+        return parent
+
+    def read(self, path):
+        """Returns the extracted contents of the file at path."""
+        data = self.find(path).find("data")
+        if data is None:
+            raise XarError("%s in %s has no data" % (path, self.path))
+        with open(self.path, "rb") as f:
+            f.seek(self.heap_start + int(data.findtext("offset")))
+            archived = f.read(int(data.findtext("length")))
+        encoding = data.find("encoding")
+        style = encoding.get("style") if encoding is not None else ""
+        try:
+            if style == "application/x-gzip":
+                return zlib.decompress(archived)
+            if style == "application/x-bzip2":
+                return bz2.decompress(archived)
+        except (zlib.error, OSError) as err:
+            raise XarError("Can't decompress %s: %s" % (path, err))
+        if style not in ("", "application/octet-stream"):
+            raise XarError("Unsupported encoding %s of %s" % (style, path))
+        return archived
+
+    def write(self, destination, replacements):
+        """Writes a copy of the archive to destination with the contents of
+        the files in the replacements dict of path -> data swapped in,
+        stored uncompressed. Signatures are dropped."""
+        replaced = {}
+        for path, contents in replacements.items():
+            data = self.find(path).find("data")
+            if data is None:
+                raise XarError("%s in %s has no data" % (path, self.path))
+            replaced[data] = contents
+        toc = self.toc.find("toc")
+        for tag in ("signature", "x-signature"):
+            for elem in toc.findall(tag):
+                toc.remove(elem)
+
+        checksum = toc.find("checksum")
+        checksum_size = 0
+        if self.checksum_name:
+            checksum_size = hashlib.new(self.checksum_name).digest_size
+            if checksum is None:
+                checksum = ElementTree.SubElement(toc, "checksum")
+                checksum.set("style", self.checksum_name)
+            self.set_texts(checksum, offset=0, size=checksum_size)
+        elif checksum is not None:
+            toc.remove(checksum)
+
+        # Lay out the new heap: TOC checksum first, then every file's data
+        # (and extended attributes) in their original order
+        heap_items = [
+            elem
+            for elem in toc.iter()
+            if elem.tag in ("data", "ea") and elem.find("offset") is not None
+        ]
+        heap_items.sort(key=lambda elem: int(elem.findtext("offset")))
+        plan = []
+        offset = checksum_size
+        for elem in heap_items:
+            source = (int(elem.findtext("offset")), int(elem.findtext("length")))
+            if elem in replaced:
+                contents = replaced[elem]
+                encoding = elem.find("encoding")
+                if encoding is None:
+                    encoding = ElementTree.SubElement(elem, "encoding")
+                encoding.set("style", "application/octet-stream")
+                for tag in ("archived-checksum", "extracted-checksum"):
+                    sum_elem = elem.find(tag)
+                    if sum_elem is not None:
+                        sum_elem.text = hashlib.new(
+                            sum_elem.get("style", "sha1").lower(), contents
+                        ).hexdigest()
+                self.set_texts(elem, length=len(contents), size=len(contents))
+                source = contents
+            self.set_texts(elem, offset=offset)
+            plan.append(source)
+            offset += int(elem.findtext("length"))
+
+        toc_data = ElementTree.tostring(self.toc, encoding="UTF-8")
+        compressed_toc = zlib.compress(toc_data)
+        header_extra = b""
+        if self.checksum_alg == XAR_NAMED_CHECKSUM:
+            header_extra = self.checksum_name.encode("ascii") + b"\0"
+            header_extra += b"\0" * (-len(header_extra) % 4)
+        header = XAR_HEADER.pack(
+            XAR_MAGIC,
+            XAR_HEADER.size + len(header_extra),
+            self.version,
+            len(compressed_toc),
+            len(toc_data),
+            self.checksum_alg,
+        )
+        with open(self.path, "rb") as src, open(destination, "wb") as dest:
+            dest.write(header + header_extra + compressed_toc)
+            if self.checksum_name:
+                dest.write(hashlib.new(self.checksum_name, compressed_toc).digest())
+            for source in plan:
+                if isinstance(source, bytes):
+                    dest.write(source)
+                    continue
+                src.seek(self.heap_start + source[0])
+                remaining = source[1]
+                while remaining:
+                    chunk = src.read(min(remaining, COPY_CHUNK_SIZE))
+                    if not chunk:
+                        raise XarError("%s is truncated" % self.path)
+                    dest.write(chunk)
+                    remaining -= len(chunk)
+
+    @staticmethod
+    def set_texts(elem, **values):
+        """Sets the text of the named children of elem, adding any missing."""
+        for tag, value in values.items():
+            child = elem.find(tag)
+            if child is None:
+                child = ElementTree.SubElement(elem, tag)
+            child.text = str(value)
+
+
+class DiskImageError(ProcessorError):
+    """A disk image this module can't read without mounting it."""
+
+
+class UDIFImage:
+    """Reads the sectors of one partition of a UDIF (.dmg) disk image,
+    decompressing its chunks on demand."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self._chunks = []
+        self._chunk_starts = []
+        self._cache = {}
+        try:
+            self.file = open(path, "rb")
+            self.file.seek(-UDIF_TRAILER.size, os.SEEK_END)
+            trailer = UDIF_TRAILER.unpack(self.file.read(UDIF_TRAILER.size))
+        except (OSError, struct.error) as err:
+            self.close()
+            raise DiskImageError("Can't read %s: %s" % (path, err))
+        magic, data_fork_offset, xml_offset, xml_length = trailer
+        if magic != UDIF_MAGIC or not xml_length:
+            self.close()
+            raise DiskImageError("%s is not a UDIF disk image" % path)
+        self.data_fork_offset = data_fork_offset
+        try:
+            self.file.seek(xml_offset)
+            resources = plistlib.loads(self.file.read(xml_length))
+            self.blkx = resources["resource-fork"]["blkx"]
+        except (OSError, KeyError, ValueError, plistlib.InvalidFileException) as err:
+            self.close()
+            raise DiskImageError(
+                "Can't read the partition list of %s: %s" % (path, err)
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Closes the image file."""
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def partition_names(self):
+        """Returns the names of the partitions in the image."""
+        return [entry.get("Name") or entry.get("CFName", "") for entry in self.blkx]
+
+    def select_partition(self, index):
+        """Makes read() read from partition index."""
+        data = self.blkx[index]["Data"]
+        if data[:4] != MISH_MAGIC:
+            raise DiskImageError("Bad block map in %s" % self.path)
+        (chunk_count,) = struct.unpack_from(">I", data, MISH_HEADER_SIZE - 4)
+        (mish_data_offset,) = struct.unpack_from(">Q", data, 24)
+        self._chunks = []
+        for i in range(chunk_count):
+            kind, _, sector, sectors, offset, length = MISH_CHUNK.unpack_from(
+                data, MISH_HEADER_SIZE + i * MISH_CHUNK.size
+            )
+            if kind in (UDIF_CHUNK_COMMENT, UDIF_CHUNK_TERMINATOR) or not sectors:
+                continue
+            if kind not in UDIF_CHUNK_TYPES:
+                raise DiskImageError(
+                    "Unsupported chunk type 0x%08x in %s" % (kind, self.path)
+                )
+            self._chunks.append(
+                (
+                    sector * SECTOR_SIZE,
+                    sectors * SECTOR_SIZE,
+                    kind,
+                    self.data_fork_offset + mish_data_offset + offset,
+                    length,
+                )
+            )
+        self._chunks.sort()
+        self._chunk_starts = [chunk[0] for chunk in self._chunks]
+        self._cache = {}
+
+    def _chunk_data(self, index):
+        """Returns the decompressed data of a chunk."""
+        if index in self._cache:
+            return self._cache[index]
+        _, size, kind, offset, length = self._chunks[index]
+        if UDIF_CHUNK_TYPES[kind] == "zero":
+            data = bytes(size)
+        else:
+            self.file.seek(offset)
+            data = self.file.read(length)
+            try:
+                if UDIF_CHUNK_TYPES[kind] == "zlib":
+                    data = zlib.decompress(data)
+                elif UDIF_CHUNK_TYPES[kind] == "bzip2":
+                    data = bz2.decompress(data)
+                elif UDIF_CHUNK_TYPES[kind] == "lzma":
+                    data = lzma.decompress(data)
+            except (zlib.error, OSError, lzma.LZMAError) as err:
+                raise DiskImageError("Corrupt chunk in %s: %s" % (self.path, err))
+        if len(self._cache) >= UDIF_CHUNK_CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[index] = data
+        return data
+
+    def read(self, offset, size):
+        """Returns size bytes at offset in the selected partition."""
+        out = bytearray()
+        while size > 0:
+            index = bisect.bisect_right(self._chunk_starts, offset) - 1
+            if index < 0 or offset >= self._chunks[index][0] + self._chunks[index][1]:
+                raise DiskImageError("Read beyond the end of %s" % self.path)
+            start = offset - self._chunks[index][0]
+            piece = self._chunk_data(index)[start : start + size]
+            if not piece:
+                raise DiskImageError("Short chunk in %s" % self.path)
+            out += piece
+            offset += len(piece)
+            size -= len(piece)
+        return bytes(out)
+
+
+class HFSPlusVolume:
+    """Lists the files in the root folder of an HFS+ volume and reads their
+    data forks, from anything with a read(offset, size) method."""
+
+    def __init__(self, device):
+        self.device = device
+        header = device.read(HFS_VOLUME_HEADER_OFFSET, 512)
+        if header[:2] not in HFS_SIGNATURES:
+            raise DiskImageError("Not an HFS+ volume")
+        (self.block_size,) = struct.unpack_from(">I", header, 40)
+        self.extents_fork = self.parse_fork(header, 192)
+        self.catalog_fork = self.parse_fork(header, 272)
+        self._root_files = None
+
+    @staticmethod
+    def parse_fork(data, offset):
+        """Returns the logical size and extents of an HFSPlusForkData."""
+        (logical_size,) = struct.unpack_from(">Q", data, offset)
+        extents = [
+            struct.unpack_from(">II", data, offset + 16 + 8 * i) for i in range(8)
+        ]
+        return logical_size, [extent for extent in extents if extent[1]]
+
+    def read_fork(self, fork, offset, size):
+        """Returns size bytes at offset of a fork."""
+        out = bytearray()
+        fork_pos = 0
+        for start_block, block_count in fork[1]:
+            extent_size = block_count * self.block_size
+            if offset < fork_pos + extent_size and size > 0:
+                start = offset - fork_pos
+                length = min(size, extent_size - start)
+                out += self.device.read(start_block * self.block_size + start, length)
+                offset += length
+                size -= length
+            fork_pos += extent_size
+        if size > 0:
+            raise DiskImageError("Read beyond the end of a fork")
+        return bytes(out)
+
+    def iter_leaf_records(self, fork):
+        """Yields the (key, data) of every record in the leaf nodes of the
+        B-tree stored in fork."""
+        header = self.read_fork(fork, 0, 512)
+        (first_leaf,) = struct.unpack_from(">I", header, 24)
+        (node_size,) = struct.unpack_from(">H", header, 32)
+        node_number = first_leaf
+        seen = set()
+        while node_number and node_number not in seen:
+            seen.add(node_number)
+            node = self.read_fork(fork, node_number * node_size, node_size)
+            next_node, _, kind, _, num_records = struct.unpack_from(">IIbBH", node)
+            if kind != BTREE_LEAF_NODE:
+                raise DiskImageError("Unexpected B-tree node kind %d" % kind)
+            offsets = struct.unpack_from(
+                ">%dH" % (num_records + 1), node, node_size - 2 * (num_records + 1)
+            )[::-1]
+            for i in range(num_records):
+                record = node[offsets[i] : offsets[i + 1]]
+                (key_length,) = struct.unpack_from(">H", record)
+                yield record[2 : 2 + key_length], record[2 + key_length :]
+            node_number = next_node
+
+    def root_files(self):
+        """Returns a dict of name -> catalog record of the files and folders
+        in the root folder."""
+        if self._root_files is None:
+            self._root_files = {}
+            for key, data in self.iter_leaf_records(self.catalog_fork):
+                (parent_id,) = struct.unpack_from(">I", key)
+                if parent_id != HFS_ROOT_FOLDER_ID:
+                    continue
+                (record_type,) = struct.unpack_from(">h", data)
+                if record_type not in (HFS_FILE_RECORD, HFS_FOLDER_RECORD):
+                    continue
+                (name_length,) = struct.unpack_from(">H", key, 4)
+                name = key[6 : 6 + 2 * name_length].decode("utf-16-be")
+                self._root_files[unicodedata.normalize("NFC", name)] = data
+        return self._root_files
+
+    def list_root(self):
+        """Returns the names of the files and folders in the root folder."""
+        return sorted(self.root_files())
+
+    def get_data_fork(self, name):
+        """Returns the logical size and the complete extent list of the data
+        fork of a file in the root folder."""
+        record = self.root_files()[name]
+        if struct.unpack_from(">h", record)[0] != HFS_FILE_RECORD:
+            raise DiskImageError("%s is a folder" % name)
+        (file_id,) = struct.unpack_from(">I", record, 8)
+        (owner_flags,) = struct.unpack_from(">B", record, 41)
+        if owner_flags & UF_COMPRESSED:
+            raise DiskImageError("%s is HFS+ compressed" % name)
+        if record[48:56] == HFS_HARD_LINK_TYPE:
+            raise DiskImageError("%s is a hard link" % name)
+        logical_size, extents = self.parse_fork(record, 88)
+        (total_blocks,) = struct.unpack_from(">I", record, 88 + 12)
+        if sum(count for _, count in extents) < total_blocks:
+            overflow = []
+            for key, data in self.iter_leaf_records(self.extents_fork):
+                fork_type, _, key_file_id, start_block = struct.unpack_from(
+                    ">BBII", key
+                )
+                if fork_type == 0 and key_file_id == file_id:
+                    overflow.append(
+                        (
+                            start_block,
+                            [
+                                extent
+                                for extent in (
+                                    struct.unpack_from(">II", data, 8 * i)
+                                    for i in range(8)
+                                )
+                                if extent[1]
+                            ],
+                        )
+                    )
+            for _, more in sorted(overflow):
+                extents.extend(more)
+        return logical_size, extents
+
+    def copy_file(self, name, destination):
+        """Streams the data fork of a file in the root folder to
+        destination."""
+        fork = self.get_data_fork(name)
+        remaining = fork[0]
+        offset = 0
+        with open(destination, "wb") as f:
+            while remaining:
+                length = min(remaining, COPY_CHUNK_SIZE)
+                f.write(self.read_fork(fork, offset, length))
+                offset += length
+                remaining -= length
+
 
 class AdobeReaderRepackager(DmgMounter):
 
@@ -56,7 +582,10 @@ class AdobeReaderRepackager(DmgMounter):
     #    of doing the minimum required to make the package work in the required
     #    scenarios.
     #
-    # The basic set of operations:
+    # The pkg is patched in place: the Distribution and the Scripts archive
+    # of application_mini_7z.pkg are rewritten inside a copy of the xar
+    # archive and every other file is copied across unchanged. If that isn't
+    # possible, the basic set of operations is:
     #
     # 1) Expand the pkg with pkgutil --expand
     # 2) Modify the Distribution file to allow install anywhere by removing
@@ -119,47 +648,98 @@ class AdobeReaderRepackager(DmgMounter):
         except subprocess.CalledProcessError as err:
             raise ProcessorError("%s flattening %s" % (err, expanded_pkg))
 
+    def edit_distribution(self, data):
+        """Returns the Distribution data with the <domains> element removed,
+        or None if it has none."""
+        # pylint: disable=no-self-use
+        try:
+            dist_root = ElementTree.fromstring(data)
+        except ElementTree.ParseError as err:
+            raise ProcessorError("Can't read Distribution: %s" % err)
+        if dist_root.tag not in ["installer-script", "installer-gui-script"]:
+            raise ProcessorError("Distribution file is not in the expected format.")
+        domains = dist_root.find("domains")
+        if domains is None:
+            return None
+        dist_root.remove(domains)
+        return ElementTree.tostring(dist_root, encoding="us-ascii")
+
     def modify_distribution(self, expanded_pkg):
         """Modify the package Distribution file so that installation is allowed
         on non-boot volumes."""
-        # pylint: disable=no-self-use
         dist_file = os.path.join(expanded_pkg, "Distribution")
         if not os.path.exists(dist_file):
             raise ProcessorError("%s not found")
         try:
-            dist = ElementTree.parse(dist_file)
-        except (OSError, IOError, ElementTree.ParseError) as err:
+            with open(dist_file, "rb") as f:
+                data = self.edit_distribution(f.read())
+        except (OSError, IOError) as err:
             raise ProcessorError("Can't read %s: %s" % (dist_file, err))
-
-        dist_root = dist.getroot()
-        if dist_root.tag not in ["installer-script", "installer-gui-script"]:
-            raise ProcessorError("Distribution file is not in the expected format.")
-        domains = dist_root.find("domains")
-        if domains is not None:
-            dist_root.remove(domains)
+        if data is not None:
             try:
-                dist.write(dist_file)
+                with open(dist_file, "wb") as f:
+                    f.write(data)
             except (OSError, IOError) as err:
                 raise ProcessorError("Could not write %s: %s" % (dist_file, err))
 
+    def get_script_path(self, name):
+        """Returns the path of one of our package scripts."""
+        # pylint: disable=no-self-use
+        return os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "package_resources/scripts",
+            name,
+        )
+
+    def get_our_preinstall(self, pkg_name):
+        """Returns the path of our preinstall script for a Reader pkg."""
+        if pkg_name.startswith("AcroRdrDC"):
+            our_script = self.get_script_path("readerdc_preinstall")
+        else:
+            our_script = self.get_script_path("reader_preinstall")
+        if not os.path.exists(our_script):
+            raise ProcessorError("%s not found" % our_script)
+        return our_script
+
+    def patch_pkg(self, pkg, destination):
+        """Writes a copy of the flat pkg to destination with the Distribution
+        and the preinstall script of application_mini_7z.pkg modified,
+        without expanding anything else."""
+        our_script = self.get_our_preinstall(os.path.splitext(os.path.basename(pkg))[0])
+        archive = XarArchive(pkg)
+        replacements = {}
+        distribution = self.edit_distribution(archive.read("Distribution"))
+        if distribution is not None:
+            replacements["Distribution"] = distribution
+        scripts_path = APP_PKG + "/Scripts"
+        try:
+            scripts = gzip.decompress(archive.read(scripts_path))
+        except OSError as err:
+            raise XarError("Can't decompress %s: %s" % (scripts_path, err))
+        with open(our_script, "rb") as f:
+            scripts = replace_cpio_member(scripts, "preinstall", f.read())
+        replacements[scripts_path] = gzip.compress(scripts, mtime=0)
+        tmp_path = "%s.%d.tmp" % (destination, os.getpid())
+        try:
+            archive.write(tmp_path, replacements)
+            os.replace(tmp_path, destination)
+        except OSError as err:
+            raise XarError("Can't write %s: %s" % (destination, err))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        self.output(
+            "Replaced pkg preinstall script with our custom script at %s" % our_script
+        )
+
     def replace_app_preinstall(self, expanded_pkg):
         """Replace the preinstall script in application_mini_7z.pkg with our own"""
         pkg_name = os.path.basename(expanded_pkg)
-        app_pkg = os.path.join(expanded_pkg, "application_mini_7z.pkg")
+        app_pkg = os.path.join(expanded_pkg, APP_PKG)
         if not os.path.exists(app_pkg):
             raise ProcessorError("application_mini_7z.pkg not found!")
         preinstall_script = os.path.join(app_pkg, "Scripts/preinstall")
-        if pkg_name.startswith("AcroRdrDC"):
-            our_script = os.path.join(
-                os.path.dirname(__file__),
-                "package_resources/scripts/readerdc_preinstall",
-            )
-        else:
-            our_script = os.path.join(
-                os.path.dirname(__file__), "package_resources/scripts/reader_preinstall"
-            )
-        if not os.path.exists(our_script):
-            raise ProcessorError("%s not found" % our_script)
+        our_script = self.get_our_preinstall(pkg_name)
         try:
             os.unlink(preinstall_script)
         except (OSError, IOError) as err:
@@ -174,28 +754,187 @@ class AdobeReaderRepackager(DmgMounter):
             "Replaced pkg preinstall script with our custom script at %s" % our_script
         )
 
-    def main(self):
-        # Mount the image.
-        mount_point = self.mount(self.env["dmg_path"])
-        # Wrap all other actions in a try/finally so the image is always
-        # unmounted.
-        try:
-            pkg = self.find_pkg(mount_point)
-            pkg_name = os.path.splitext(os.path.basename(pkg))[0]
-            expand_dir = os.path.join(self.env["RECIPE_CACHE_DIR"], pkg_name)
-            modified_pkg = os.path.join(
-                self.env["RECIPE_CACHE_DIR"], os.path.basename(pkg)
-            )
+    def file_digest(self, path, record=None):
+        """Returns a dict of the sha256, size and mtime of the file at path,
+        reusing the digest in record if the size and mtime still match."""
+        # pylint: disable=no-self-use
+        stat = os.stat(path)
+        if (
+            record
+            and record.get("path") == path
+            and record.get("size") == stat.st_size
+            and record.get("mtime") == stat.st_mtime
+        ):
+            return record
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": digest.hexdigest(),
+        }
+
+    def get_repackage_key(self, dmg_record):
+        """Returns the key the repackaged pkg is cached under: the digests
+        of the dmg and of our preinstall scripts, and the version of the
+        patching rules."""
+        key = hashlib.sha256(b"rules %d\n" % REPACKAGE_RULES_VERSION)
+        key.update(dmg_record["sha256"].encode("ascii"))
+        for name in PREINSTALL_SCRIPTS:
+            try:
+                with open(self.get_script_path(name), "rb") as f:
+                    key.update(hashlib.sha256(f.read()).digest())
+            except OSError:
+                key.update(b"missing")
+        return key.hexdigest()
+
+    def read_repackage_cache(self):
+        """Returns the record of the last repackaging."""
+        try:
+            with open(
+                os.path.join(self.env["RECIPE_CACHE_DIR"], REPACKAGE_CACHE_NAME), "rb"
+            ) as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def write_repackage_cache(self, record):
+        """Saves the record of the last repackaging."""
+        cache_path = os.path.join(self.env["RECIPE_CACHE_DIR"], REPACKAGE_CACHE_NAME)
+        # Write to a temporary file first so an interrupted run never leaves
+        # a partial cache.
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(record, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as err:
+            self.output("WARNING: Could not write %s: %s" % (cache_path, err))
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def get_cached_pkg(self, cache, key):
+        """Returns the path of the pkg repackaged under key, if it is still
+        there unchanged."""
+        # pylint: disable=no-self-use
+        pkg_path = cache.get("pkg_path")
+        if cache.get("key") != key or not pkg_path:
+            return None
+        try:
+            stat = os.stat(pkg_path)
+        except OSError:
+            return None
+        if stat.st_size != cache.get("pkg_size") or stat.st_mtime != cache.get(
+            "pkg_mtime"
+        ):
+            return None
+        return pkg_path
+
+    def copy_pkg_from_dmg(self, dmg_path, destination_dir):
+        """Copies the first pkg in an HFS+ dmg to destination_dir without
+        mounting the dmg. Returns the path of the copy."""
+        try:
+            with UDIFImage(dmg_path) as image:
+                names = image.partition_names()
+                # Try the partitions that say they are HFS first
+                for index in sorted(
+                    range(len(names)), key=lambda i: "Apple_HFS" not in names[i]
+                ):
+                    try:
+                        image.select_partition(index)
+                        volume = HFSPlusVolume(image)
+                        break
+                    except DiskImageError:
+                        continue
+                else:
+                    raise DiskImageError("No HFS+ volume in %s" % dmg_path)
+                for name in volume.list_root():
+                    if name.endswith(".pkg"):
+                        pkg = os.path.join(destination_dir, name)
+                        volume.copy_file(name, pkg)
+                        return pkg
+        except (struct.error, IndexError, KeyError, ValueError, UnicodeError) as err:
+            raise DiskImageError("Can't read %s: %s" % (dmg_path, err))
+        except OSError as err:
+            raise DiskImageError("Can't copy from %s: %s" % (dmg_path, err))
+        raise DiskImageError("No package found in %s" % dmg_path)
+
+    def repackage(self, pkg):
+        """Writes the modified copy of pkg to RECIPE_CACHE_DIR and returns
+        its path."""
+        pkg_name = os.path.splitext(os.path.basename(pkg))[0]
+        expand_dir = os.path.join(self.env["RECIPE_CACHE_DIR"], pkg_name)
+        modified_pkg = os.path.join(self.env["RECIPE_CACHE_DIR"], os.path.basename(pkg))
+        try:
+            self.patch_pkg(pkg, modified_pkg)
+        except XarError as err:
+            self.output("Can't patch %s in place (%s); expanding it" % (pkg, err))
             expanded_pkg = self.expand(pkg, expand_dir)
             self.modify_distribution(expanded_pkg)
             self.replace_app_preinstall(expanded_pkg)
             self.flatten(expanded_pkg, modified_pkg)
-            self.env["pkg_path"] = modified_pkg
+        return modified_pkg
 
-        except Exception as err:
-            raise ProcessorError(err)
+    def repackage_without_mounting(self):
+        """Repackages the pkg in the dmg after copying it out of the dmg
+        directly. Raises DiskImageError if the dmg can't be read that way."""
+        copy_dir = os.path.join(
+            self.env["RECIPE_CACHE_DIR"], "dmg_contents.%d" % os.getpid()
+        )
+        os.makedirs(copy_dir, exist_ok=True)
+        try:
+            pkg = self.copy_pkg_from_dmg(self.env["dmg_path"], copy_dir)
+            self.output("Copied %s out of the dmg" % os.path.basename(pkg))
+            return self.repackage(pkg)
         finally:
-            self.unmount(self.env["dmg_path"])
+            shutil.rmtree(copy_dir, ignore_errors=True)
+
+    def main(self):
+        cache = self.read_repackage_cache()
+        try:
+            dmg_record = self.file_digest(self.env["dmg_path"], cache.get("dmg"))
+        except OSError as err:
+            raise ProcessorError("Can't read %s: %s" % (self.env["dmg_path"], err))
+        key = self.get_repackage_key(dmg_record)
+        cached_pkg = self.get_cached_pkg(cache, key)
+        if cached_pkg:
+            self.output("Using %s repackaged from the same dmg earlier" % cached_pkg)
+            if dmg_record is not cache.get("dmg"):
+                # Same content, new mtime; remember it to skip hashing again
+                cache["dmg"] = dmg_record
+                self.write_repackage_cache(cache)
+            self.env["pkg_path"] = cached_pkg
+            return
+
+        try:
+            self.env["pkg_path"] = self.repackage_without_mounting()
+        except DiskImageError as err:
+            self.output("Can't read the dmg directly (%s); mounting it" % err)
+            # Mount the image.
+            mount_point = self.mount(self.env["dmg_path"])
+            # Wrap all other actions in a try/finally so the image is always
+            # unmounted.
+            try:
+                pkg = self.find_pkg(mount_point)
+                self.env["pkg_path"] = self.repackage(pkg)
+            except Exception as err:
+                raise ProcessorError(err)
+            finally:
+                self.unmount(self.env["dmg_path"])
+
+        stat = os.stat(self.env["pkg_path"])
+        self.write_repackage_cache(
+            {
+                "dmg": dmg_record,
+                "key": key,
+                "pkg_path": self.env["pkg_path"],
+                "pkg_size": stat.st_size,
+                "pkg_mtime": stat.st_mtime,
+            }
+        )
 
 
 if __name__ == "__main__":
@@ -17,10 +17,24 @@
 # limitations under the License.
 """See docstring for MSOfficeMacURLandUpdateInfoProvider class"""
 
+import base64
+import datetime
+import fcntl
+import io
+import itertools
+import os
 import plistlib
 import re
+import shutil
+import tempfile
+from xml.etree import ElementTree
 
-from autopkglib import ProcessorError, version_equal_or_greater
+from autopkglib import (
+    APLooseVersion,
+    ProcessorError,
+    get_pref,
+    version_equal_or_greater,
+)
 from autopkglib.URLGetter import URLGetter
 
 __all__ = ["MSOfficeMacURLandUpdateInfoProvider"]
@@ -136,6 +150,8 @@ PROD_DICT = {
 }
 LOCALE_ID_INFO_URL = "https://msdn.microsoft.com/en-us/goglobal/bb964664.aspx"
 SUPPORTED_VERSIONS = ["latest", "latest-delta", "latest-standalone"]
+# A specific version, answered from the local version index
+SPECIFIC_VERSION_RE = r"^\d+(\.\d+)+$"
 DEFAULT_VERSION = "latest"
 CHANNELS = {
     "Production": "C1297A47-86C4-4C1F-97FA-950631F94777",
@@ -144,6 +160,46 @@ CHANNELS = {
 }
 DEFAULT_CHANNEL = "Production"
 NO_TRIGGER_CONDITIONS = ["SkypeForBusiness", "Teams", "Teams2", "Edge", "CompanyPortal"]
+# Add the MAU User-Agent, since MAU feed server seems to explicitly
+# block a User-Agent of 'Python-urllib/2.7' - even a blank User-Agent
+# string passes.
+MAU_HEADERS = {
+    "User-Agent": (
+        "Microsoft%20AutoUpdate/3.6.16080300 CFNetwork/"
+        "760.6.3 Darwin/15.6.0 (x86_64)"
+    )
+}
+# Upper bound on simultaneous feed transfers in batch mode.
+MAX_PARALLEL_FEEDS = 8
+# Feed keys holding the byte size and digest of the package each location
+# points to.
+SIZE_KEYS = {"Location": "Size", "FullUpdaterLocation": "FullUpdaterSize"}
+HASH_KEYS = {"Location": "Hash", "FullUpdaterLocation": "FullUpdaterHash"}
+# Digest algorithm for each digest length in bytes.
+HASH_ALGORITHMS = {16: "md5", 20: "sha1", 32: "sha256", 64: "sha512"}
+# Index of every update seen in the feeds, kept in the AutoPkg cache dir
+VERSION_INDEX_NAME = "mau_version_index.plist"
+# Update entry keys kept in the version index
+VERSION_INDEX_KEYS = [
+    "Title",
+    "Update Version",
+    "Location",
+    "FullUpdaterLocation",
+    "Minimum OS",
+    "Trigger Condition",
+    "Triggers",
+    "Size",
+    "FullUpdaterSize",
+    "Hash",
+    "FullUpdaterHash",
+]
+# Update entry keys read from the feeds. Everything else in an entry, such
+# as release notes, is skipped while parsing.
+FEED_ENTRY_KEYS = VERSION_INDEX_KEYS + ["Short Description", "Localized"]
+# Keys read from each locale of an entry's 'Localized' dict
+LOCALIZED_KEYS = ["Short Description"]
+# The update planner tries every combination of up to this many deltas.
+MAX_EXACT_COVER_DELTAS = 12
 
 
 class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
@@ -160,16 +216,41 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                 "for a list of locale codes. The default is en-US." % LOCALE_ID_INFO_URL
             ),
         },
+        "locale_ids": {
+            "required": False,
+            "description": (
+                "A list of locale IDs to fetch descriptions for. The feeds "
+                "of all of them are fetched at once and the descriptions of "
+                "the resolved update are added to additional_pkginfo as a "
+                "'localized_descriptions' dict keyed by locale ID. Not used "
+                "in batch or multi-channel mode."
+            ),
+        },
         "product": {
-            "required": True,
-            "description": "Name of product to fetch, e.g. Excel.",
+            "required": False,
+            "description": (
+                "Name of product to fetch, e.g. Excel2019. Required unless "
+                "'products' is set."
+            ),
+        },
+        "products": {
+            "required": False,
+            "description": (
+                "Batch mode: a list of product names, or 'all' for every "
+                "product in PROD_DICT. All feeds are fetched at once and the "
+                "results are returned in 'office_updates'. Delta updates "
+                "require the product name unless munki_required_update_name "
+                "is set."
+            ),
         },
         "version": {
             "required": False,
             "default": DEFAULT_VERSION,
             "description": (
                 "Update type to fetch. Supported values are: "
-                "'%s'. Defaults to %s."
+                "'%s'. Defaults to %s. A specific version number, e.g. "
+                "16.79.23111019, is looked up in the local index of updates "
+                "seen in earlier runs, without any network access."
                 % ("', '".join(SUPPORTED_VERSIONS), DEFAULT_VERSION)
             ),
         },
@@ -183,6 +264,14 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                 "for the required item. If unset, NAME will be used."
             ),
         },
+        "installed_versions": {
+            "required": False,
+            "description": (
+                "A dict of installed application version -> number of "
+                "machines. If set, an 'update_plan' is worked out from every "
+                "delta and full updater in the feed. Not used in batch mode."
+            ),
+        },
         "channel": {
             "required": False,
             "default": DEFAULT_CHANNEL,
@@ -192,6 +281,15 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                 "UUID or one of: %s" % (DEFAULT_CHANNEL, ", ".join(CHANNELS))
             ),
         },
+        "channels": {
+            "required": False,
+            "description": (
+                "Multi-channel mode: a list of channels (names or custom "
+                "UUIDs) to check for 'product'. All feeds are fetched at "
+                "once and the results are returned in 'channel_updates' and "
+                "'channel_diff'. Overrides 'channel'."
+            ),
+        },
     }
     output_variables = {
         "additional_pkginfo": {
@@ -222,9 +320,72 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
             )
         },
         "url": {"description": "URL to the latest installer."},
+        "expected_hash": {
+            "description": (
+                "Hex digest of the package at 'url' from the Microsoft "
+                "metadata, or an empty string if it doesn't give one. Can be "
+                "passed to MSOfficeUpdateDownloader."
+            )
+        },
+        "expected_hash_algorithm": {
+            "description": (
+                "hashlib name of the algorithm of expected_hash, e.g. sha256."
+            )
+        },
+        "expected_size": {
+            "description": (
+                "Size in bytes of the package at 'url' from the Microsoft "
+                "metadata, or an empty string if it doesn't give one."
+            )
+        },
+        "office_updates": {
+            "description": (
+                "Batch mode only: a dict keyed by product name. Each value "
+                "holds the 'url', 'version', 'minimum_os_version', "
+                "'minimum_version_for_delta', 'additional_pkginfo', "
+                "'expected_hash', 'expected_hash_algorithm' and "
+                "'expected_size' of that product."
+            )
+        },
+        "channel_updates": {
+            "description": (
+                "Multi-channel mode only: a dict keyed by channel, with the "
+                "same fields per channel as 'office_updates'."
+            )
+        },
+        "channel_diff": {
+            "description": (
+                "Multi-channel mode only: the 'newest_version', the "
+                "'newest_channels' that carry it, and 'ahead_of', mapping "
+                "each channel to the channels with an older version."
+            )
+        },
+        "update_plan": {
+            "description": (
+                "Set when 'installed_versions' is given. A dict with the "
+                "'target_version', the 'packages' (deltas plus the full "
+                "updater fallback, each with its 'url', 'size', the installed "
+                "versions it 'covers' and the number of 'machines'), the "
+                "versions already 'up_to_date', the 'package_bytes' to "
+                "import and the 'fleet_bytes' transferred across all machines."
+            )
+        },
+        "feed_cache_hits": {
+            "description": (
+                "Number of feeds that were unchanged on the server and read "
+                "from the cache in RECIPE_CACHE_DIR."
+            )
+        },
+        "feed_cache_misses": {
+            "description": "Number of feeds that were downloaded and parsed."
+        },
     }
     description = __doc__
-    min_delta_version = ""
+
+    def __init__(self, env=None, infile=None, outfile=None):
+        super().__init__(env, infile, outfile)
+        # Entries seen in this run, to be merged into the version index
+        self.new_index_entries = {}
 
     def sanity_check_expected_triggers(self, item):
         """Raises an exeception if the Trigger Condition or
@@ -239,12 +400,12 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                 % (item["Title"], item["Trigger Condition"])
             )
 
-    def get_installs_items(self, item):
+    def get_installs_items(self, item, product):
         """Attempts to parse the Triggers to create an installs item using
         only manifest data, making the assumption that CFBundleVersion and
         CFBundleShortVersionString are equal. Skip SkypeForBusiness, Teams,
         and Edge as their xml does not contain a 'Trigger Condition'"""
-        if self.env["product"] not in NO_TRIGGER_CONDITIONS:
+        if product not in NO_TRIGGER_CONDITIONS:
             self.sanity_check_expected_triggers(item)
         version = self.get_version(item)
         # Skipping CFBundleShortVersionString because it doesn't contain
@@ -252,7 +413,7 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
         # distinguishing Insider builds for example)
         installs_item = {
             "CFBundleVersion": version,
-            "path": PROD_DICT[self.env["product"]]["path"],
+            "path": PROD_DICT[product]["path"],
             "type": "application",
         }
         return [installs_item]
@@ -268,10 +429,9 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
             )
             return item["Update Version"]
 
-    def get_installer_info(self):
-        """Gets info about an installer from MS metadata."""
-        # Get the channel UUID, matching against a custom UUID if one is given
-        channel_input = self.env.get("channel", DEFAULT_CHANNEL)
+    def get_channel_id(self, channel_input):
+        """Returns the feed UUID for a channel name, or the custom UUID
+        itself if one is given."""
         rex = r"^([0-9a-fA-F]{8}-([0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12})$"
         match_uuid = re.match(rex, channel_input)
         if not match_uuid and channel_input not in CHANNELS:
@@ -280,60 +440,333 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                 "uuid" % (", ".join(CHANNELS))
             )
         if match_uuid:
-            channel = match_uuid.groups()[0]
-        else:
-            channel = CHANNELS[channel_input]
-        base_url = BASE_URL % (
-            channel,
-            CULTURE_CODE + PROD_DICT[self.env["product"]]["id"],
-        )
+            return match_uuid.groups()[0]
+        return CHANNELS[channel_input]
 
-        # Get metadata URL
-        self.output("Requesting xml: %s" % base_url)
-        # Add the MAU User-Agent, since MAU feed server seems to explicitly
-        # block a User-Agent of 'Python-urllib/2.7' - even a blank User-Agent
-        # string passes.
-        headers = {
-            "User-Agent": (
-                "Microsoft%20AutoUpdate/3.6.16080300 CFNetwork/"
-                "760.6.3 Darwin/15.6.0 (x86_64)"
+    def get_feed_url(self, product, channel_id, culture_code=CULTURE_CODE):
+        """Returns the MAU metadata URL for a product in a channel."""
+        if product not in PROD_DICT:
+            raise ProcessorError(
+                "Unknown product '%s'. Supported products are: %s"
+                % (product, ", ".join(PROD_DICT))
             )
-        }
-        data = self.download(base_url, headers)
-
-        metadata = plistlib.loads(data)
-        # Upstream feed has emitted Location values with stray newlines
-        # that break curl; normalize whitespace on all string values.
-        if isinstance(metadata, list):
-            metadata = [
-                {k: v.strip() if isinstance(v, str) else v for k, v in entry.items()}
-                for entry in metadata
-                if isinstance(entry, dict)
-            ]
-        item = {}
+        return BASE_URL % (channel_id, culture_code + PROD_DICT[product]["id"])
+
+    def fetch_feeds(self, feed_requests):
+        """Downloads several feeds with a single curl process.
+
+        feed_requests is a list of (url, headers) tuples. All transfers share
+        one curl invocation, so connections to the CDN are reused, and they
+        run in parallel when there is more than one. Returns a list of
+        (header, data) tuples in the same order, where header is the dict
+        returned by parse_headers()."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            transfer_cmd = self.prepare_curl_cmd()
+            curl_cmd = transfer_cmd[:1]
+            if len(feed_requests) > 1:
+                # --parallel needs curl 7.66 or later
+                curl_cmd.extend(
+                    ["--parallel", "--parallel-max", str(MAX_PARALLEL_FEEDS)]
+                )
+            transfers = []
+            for index, (url, headers) in enumerate(feed_requests):
+                header_path = os.path.join(tmp_dir, "%d.headers" % index)
+                data_path = os.path.join(tmp_dir, "%d.data" % index)
+                if index:
+                    curl_cmd.append("--next")
+                curl_cmd.extend(transfer_cmd[1:])
+                curl_cmd.extend(
+                    [
+                        "--silent",
+                        "--show-error",
+                        "--dump-header",
+                        header_path,
+                        "--output",
+                        data_path,
+                    ]
+                )
+                self.add_curl_headers(curl_cmd, headers)
+                self.add_curl_common_opts(curl_cmd)
+                curl_cmd.append(url)
+                transfers.append((url, header_path, data_path))
+            self.download_with_curl(curl_cmd, text=False)
+
+            results = []
+            for url, header_path, data_path in transfers:
+                try:
+                    with open(header_path, "r", errors="ignore") as f:
+                        header = self.parse_headers(f.read(), url)
+                except OSError:
+                    raise ProcessorError("No response received for %s" % url)
+                try:
+                    with open(data_path, "rb") as f:
+                        data = f.read()
+                except OSError:
+                    data = b""
+                results.append((header, data))
+            return results
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get_feed_cache_path(self, url):
+        """Returns the path of the cache file for a feed url, or None if
+        there is no RECIPE_CACHE_DIR to keep it in."""
+        if not self.env.get("RECIPE_CACHE_DIR"):
+            return None
+        name = re.sub(r"[^0-9A-Za-z._-]", "_", url.split("://")[-1])
+        return os.path.join(self.env["RECIPE_CACHE_DIR"], "mau_feeds", name + ".plist")
+
+    def read_feed_cache(self, url):
+        """Returns the cached validators and update entries for a feed url,
+        or an empty dict if it isn't cached."""
+        cache_path = self.get_feed_cache_path(url)
+        if not cache_path:
+            return {}
+        try:
+            with open(cache_path, "rb") as f:
+                cached = plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+        if cached.get("url") != url or "entries" not in cached:
+            return {}
+        return cached
+
+    def write_feed_cache(self, url, header, entries):
+        """Stores the validators and the parsed update entries of a feed
+        url, so an unchanged feed isn't parsed again."""
+        cache_path = self.get_feed_cache_path(url)
+        if not cache_path or not (header.get("etag") or header.get("last-modified")):
+            return
+        cached = {"url": url, "entries": entries}
+        if header.get("etag"):
+            cached["etag"] = header["etag"]
+        if header.get("last-modified"):
+            cached["last_modified"] = header["last-modified"]
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write to a temporary file first so concurrent runs never read
+            # a partial cache.
+            tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(cached, f, fmt=plistlib.FMT_BINARY)
+            os.replace(tmp_path, cache_path)
+        except OSError as err:
+            self.output(
+                "WARNING: Could not write feed cache %s: %s" % (cache_path, err)
+            )
+
+    def get_feed_metadata(self, feed_urls):
+        """Fetches the metadata for each feed url. Returns a dict mapping
+        each url to the list of its update entries.
+
+        Feeds are requested conditionally against the entries cached in
+        RECIPE_CACHE_DIR; a 304 response returns the cached entries without
+        parsing anything."""
+        feed_requests = []
+        caches = []
+        for url in feed_urls:
+            self.output("Requesting xml: %s" % url)
+            cached = self.read_feed_cache(url)
+            headers = dict(MAU_HEADERS)
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+            feed_requests.append((url, headers))
+            caches.append(cached)
+        responses = self.fetch_feeds(feed_requests)
+
+        feeds = {}
+        for url, cached, (header, data) in zip(feed_urls, caches, responses):
+            if header.get("http_result_code") == "304" and cached:
+                self.output("Feed unchanged, using cached metadata: %s" % url, 2)
+                self.env["feed_cache_hits"] += 1
+                feeds[url] = cached["entries"]
+                continue
+            if header.get("http_result_code") != "200":
+                raise ProcessorError(
+                    "Unexpected response for %s: %s %s"
+                    % (
+                        url,
+                        header.get("http_result_code"),
+                        header.get("http_result_description"),
+                    )
+                )
+            self.env["feed_cache_misses"] += 1
+            feeds[url] = self.parse_feed(data)
+            self.write_feed_cache(url, header, feeds[url])
+        return feeds
+
+    def plist_element_value(self, elem):
+        """Converts an element of an xml plist into its Python value."""
+        tag = elem.tag
+        if tag == "string":
+            return elem.text or ""
+        if tag == "dict":
+            children = list(elem)
+            return {
+                children[i].text or "": self.plist_element_value(children[i + 1])
+                for i in range(0, len(children) - 1, 2)
+            }
+        if tag == "array":
+            return [self.plist_element_value(child) for child in elem]
+        if tag == "integer":
+            return int(elem.text)
+        if tag == "real":
+            return float(elem.text)
+        if tag == "true":
+            return True
+        if tag == "false":
+            return False
+        if tag == "date":
+            return datetime.datetime.strptime(elem.text, "%Y-%m-%dT%H:%M:%SZ")
+        if tag == "data":
+            return base64.b64decode(elem.text or "")
+        raise ProcessorError("Unexpected element in update metadata: %s" % tag)
+
+    def plist_dict_items(self, elem):
+        """Yields the key and value element of each item of an xml plist dict
+        element, leaving the values unconverted."""
+        # pylint: disable=no-self-use
+        children = list(elem)
+        for i in range(0, len(children) - 1, 2):
+            yield children[i].text or "", children[i + 1]
+
+    def parse_feed_entry(self, elem):
+        """Converts the dict element of an update entry into a dict holding
+        only FEED_ENTRY_KEYS. Nothing else in the entry is converted."""
+        entry = {}
+        for key, value_elem in self.plist_dict_items(elem):
+            if key not in FEED_ENTRY_KEYS:
+                continue
+            if key == "Localized" and value_elem.tag == "dict":
+                # Only the descriptions are read from the localized text
+                entry[key] = {
+                    locale_id: {
+                        k: self.plist_element_value(v)
+                        for k, v in self.plist_dict_items(localized)
+                        if k in LOCALIZED_KEYS
+                    }
+                    for locale_id, localized in self.plist_dict_items(value_elem)
+                    if localized.tag == "dict"
+                }
+                continue
+            value = self.plist_element_value(value_elem)
+            # Upstream feed has emitted Location values with stray newlines
+            # that break curl; normalize whitespace on the string values.
+            entry[key] = value.strip() if isinstance(value, str) else value
+        return entry
+
+    def iter_feed(self, data):
+        """Yields the update entries of a feed one at a time as they are
+        parsed. Each entry is dropped from the parse tree once yielded, so
+        only the entries a caller keeps stay in memory."""
+        depth = 0
+        entries = None
+        try:
+            for event, elem in ElementTree.iterparse(
+                io.BytesIO(data), events=("start", "end")
+            ):
+                if event == "start":
+                    depth += 1
+                    if depth == 2:
+                        entries = elem
+                    continue
+                depth -= 1
+                # Entries are the dicts in the top level array of the plist
+                if depth == 2 and elem.tag == "dict":
+                    entry = self.parse_feed_entry(elem)
+                    entries.clear()
+                    yield entry
+        except ElementTree.ParseError as err:
+            raise ProcessorError("Can't parse update metadata: %s" % err)
+
+    def parse_feed(self, data):
+        """Parses the xml of an update feed into a list of update entries."""
+        return list(self.iter_feed(data))
+
+    def get_delta_source_version(self, item):
+        """Returns the minimum application version a delta update can be
+        applied to, taken from the '>=' bound of its VersionsRelative
+        triggers, or None if there isn't one."""
+        # pylint: disable=no-self-use
+        try:
+            rel_versions = item["Triggers"]["Registered File"]["VersionsRelative"]
+        except (KeyError, TypeError):
+            return None
+        for expression in rel_versions:
+            try:
+                operator, ver_eval = expression.split()
+            except ValueError:
+                continue
+            if operator == ">=":
+                return ver_eval
+        return None
+
+    def index_deltas(self, metadata):
+        """Builds an index of the delta entries in a feed. Returns a dict
+        mapping each target 'Update Version' to a dict of minimum source
+        version -> entry."""
+        index = {}
+        for item in metadata:
+            if not item.get("FullUpdaterLocation") or not item.get("Update Version"):
+                continue
+            source_version = self.get_delta_source_version(item)
+            if not source_version:
+                self.output(
+                    "Skipping delta '%s' with no minimum source version"
+                    % item.get("Title"),
+                    2,
+                )
+                continue
+            index.setdefault(item["Update Version"], {})[source_version] = item
+        return index
+
+    def select_latest_delta(self, metadata):
+        """Returns the delta entry with the highest target version and,
+        among those, the one that applies to the oldest installed version."""
+        index = self.index_deltas(metadata)
+        if not index:
+            return None
+        target_version = max(index, key=APLooseVersion)
+        deltas = index[target_version]
+        source_version = min(deltas, key=APLooseVersion)
+        self.output(
+            "Selected delta to %s from %s out of %d deltas"
+            % (target_version, source_version, sum(len(d) for d in index.values()))
+        )
+        return deltas[source_version]
+
+    def select_update(self, metadata, version):
+        """Returns the update entry of the feed matching the requested
+        update type."""
+        item = []
         # Update feeds for a given 'channel' will have either combo or delta
         # pkg urls, with delta's additionally having a 'FullUpdaterLocation'
         # key.
         # We populate the item dict with the appropriate section of the metadata
         # output
-        if (
-            self.env["version"] == "latest"
-            or self.env["version"] == "latest-standalone"
-        ):
-            item = [u for u in metadata if not u.get("FullUpdaterLocation")]
-        elif self.env["version"] == "latest-delta":
-            item = [u for u in metadata if u.get("FullUpdaterLocation")]
+        if version == "latest" or version == "latest-standalone":
+            # Stop reading the feed at the first full updater
+            full_updater = next(
+                (u for u in metadata if not u.get("FullUpdaterLocation")), None
+            )
+            item = [full_updater] if full_updater else []
+        elif version == "latest-delta":
+            # The feed order says nothing about which delta is newest, so
+            # pick from an index of all of them.
+            delta = self.select_latest_delta(metadata)
+            item = [delta] if delta else []
         if not item:
             raise ProcessorError(
                 "Could not find an applicable update in " "update metadata."
             )
 
-        # this just returns the first item; in the case of delta updates this
-        # is not guaranteed to be the "latest" delta. Does anybody actually
-        # use this?
-        item = item[0]
+        # Copy it, as the Location may be rewritten below.
+        item = dict(item[0])
 
-        if self.env["version"] == "latest-standalone":
+        if version == "latest-standalone":
             # do string replacement on the pattern of the URL in the
             # case of a Standalone app request.
             url = item["Location"]
@@ -345,96 +778,654 @@ class MSOfficeMacURLandUpdateInfoProvider(URLGetter):
                     "Updater URL in unexpected format; cannot "
                     "determine standalone URL."
                 )
+        return item
 
-        self.env["url"] = item["Location"]
-        self.output("Found URL %s" % self.env["url"])
+    def get_update_info(self, product, item, version, required_update_name):
+        """Extracts the url, version and pkginfo fields of a product from its
+        update entry. Returns a dict of results."""
+        self.output("Found URL %s" % item["Location"])
         self.output("Got update: '%s'" % item["Title"])
         # now extract useful info from the rest of the metadata that could
         # be used in a pkginfo
         pkginfo = {}
+        min_delta_version = ""
 
         # Minimum OS version key should exist!
         pkginfo["minimum_os_version"] = (
-            item.get("Minimum OS")
-            or PROD_DICT[self.env["product"]].get("minimum_os")
-            or "10.10.5"
+            item.get("Minimum OS") or PROD_DICT[product].get("minimum_os") or "10.10.5"
         )
 
         # Make sure that the minimum_os_version is at least higher than the pre defined value
         if not version_equal_or_greater(
             pkginfo["minimum_os_version"],
-            PROD_DICT[self.env["product"]].get("minimum_os", "10.10.5"),
+            PROD_DICT[product].get("minimum_os", "10.10.5"),
         ):
-            pkginfo["minimum_os_version"] = PROD_DICT[self.env["product"]].get(
+            pkginfo["minimum_os_version"] = PROD_DICT[product].get(
                 "minimum_os", "10.10.5"
             )
 
-        installs_items = self.get_installs_items(item)
+        installs_items = self.get_installs_items(item, product)
         if installs_items:
             pkginfo["installs"] = installs_items
 
         # If bundle_id is defined
-        if PROD_DICT[self.env["product"]].get("bundle_id"):
+        if PROD_DICT[product].get("bundle_id"):
             # Add to pkginfo
-            pkginfo["installs"][0]["CFBundleIdentifier"] = PROD_DICT[
-                self.env["product"]
-            ].get("bundle_id")
+            pkginfo["installs"][0]["CFBundleIdentifier"] = PROD_DICT[product].get(
+                "bundle_id"
+            )
 
         # Extra work to do if this is a delta updater
-        if self.env["version"] == "latest-delta":
-            try:
-                rel_versions = item["Triggers"]["Registered File"]["VersionsRelative"]
-            except KeyError:
-                raise ProcessorError(
-                    "Can't find expected VersionsRelative"
-                    "keys for determining minimum update "
-                    "required for delta update."
-                )
-            for expression in rel_versions:
-                operator, ver_eval = expression.split()
-                if operator == ">=":
-                    self.min_delta_version = ver_eval
-                    break
-            if not self.min_delta_version:
+        if version == "latest-delta":
+            min_delta_version = self.get_delta_source_version(item) or ""
+            if not min_delta_version:
                 raise ProcessorError(
                     "Not able to determine minimum required "
                     "version for delta update."
                 )
             # Put minimum_update_version into installs item
-            self.output("Adding minimum required version: %s" % self.min_delta_version)
-            pkginfo["installs"][0]["minimum_update_version"] = self.min_delta_version
-            required_update_name = self.env["NAME"]
-            if self.env["munki_required_update_name"]:
-                required_update_name = self.env["munki_required_update_name"]
+            self.output("Adding minimum required version: %s" % min_delta_version)
+            pkginfo["installs"][0]["minimum_update_version"] = min_delta_version
             # Add 'requires' array
-            pkginfo["requires"] = [
-                "%s-%s" % (required_update_name, self.min_delta_version)
-            ]
-        elif PROD_DICT[self.env["product"]].get("minimum_update_version"):
+            pkginfo["requires"] = ["%s-%s" % (required_update_name, min_delta_version)]
+        elif PROD_DICT[product].get("minimum_update_version"):
             # Put minimum_update_version into installs item as it is specified in PROD_DICT
             self.output(
                 "Adding minimum required version: %s"
-                % PROD_DICT[self.env["product"]].get("minimum_update_version")
+                % PROD_DICT[product].get("minimum_update_version")
             )
-            pkginfo["installs"][0]["minimum_update_version"] = PROD_DICT[
-                self.env["product"]
-            ].get("minimum_update_version")
+            pkginfo["installs"][0]["minimum_update_version"] = PROD_DICT[product].get(
+                "minimum_update_version"
+            )
+
+        # The feed only describes the updater, not the standalone installer
+        # derived from it.
+        expected_hash, expected_hash_algorithm = ("", "")
+        expected_size = None
+        if version != "latest-standalone":
+            expected_hash, expected_hash_algorithm = self.get_package_hash(item)
+            expected_size = self.get_package_size(item)
 
-        self.env["version"] = self.get_version(item)
-        self.env["minimum_os_version"] = pkginfo["minimum_os_version"]
-        self.env["minimum_version_for_delta"] = self.min_delta_version
-        self.env["additional_pkginfo"] = pkginfo
-        self.env["url"] = item["Location"]
+        return {
+            "url": item["Location"],
+            "version": self.get_version(item),
+            "minimum_os_version": pkginfo["minimum_os_version"],
+            "minimum_version_for_delta": min_delta_version,
+            "additional_pkginfo": pkginfo,
+            "expected_hash": expected_hash,
+            "expected_hash_algorithm": expected_hash_algorithm,
+            "expected_size": "" if expected_size is None else str(expected_size),
+        }
+
+    def get_package_size(self, item, location_key="Location"):
+        """Returns the size in bytes of the package at one of the locations
+        of an update entry, or None if the feed doesn't say."""
+        # pylint: disable=no-self-use
+        try:
+            return int(item[SIZE_KEYS[location_key]])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def get_package_hash(self, item, location_key="Location"):
+        """Returns a tuple of (hex digest, algorithm) for the package at one of
+        the locations of an update entry. The feed may give the digest in hex
+        or base64; the algorithm follows from its length. Returns empty
+        strings if there is no usable digest."""
+        # pylint: disable=no-self-use
+        value = item.get(HASH_KEYS[location_key])
+        if isinstance(value, bytes):
+            digest = value
+        elif isinstance(value, str) and re.match(r"^[0-9a-fA-F]+$", value.strip()):
+            digest = bytes.fromhex(value.strip())
+        elif isinstance(value, str):
+            try:
+                digest = base64.b64decode(value.strip(), validate=True)
+            except ValueError:
+                return ("", "")
+        else:
+            return ("", "")
+        algorithm = HASH_ALGORITHMS.get(len(digest))
+        if not algorithm:
+            return ("", "")
+        return (digest.hex(), algorithm)
+
+    def delta_applies_to(self, item, installed_version):
+        """Returns True if every VersionsRelative expression of a delta entry
+        holds for installed_version."""
+        # pylint: disable=no-self-use
+        try:
+            rel_versions = item["Triggers"]["Registered File"]["VersionsRelative"]
+        except (KeyError, TypeError):
+            return False
+        installed = APLooseVersion(installed_version)
+        for expression in rel_versions:
+            try:
+                operator, ver_eval = expression.split()
+            except ValueError:
+                return False
+            bound = APLooseVersion(ver_eval)
+            if not {
+                ">=": installed >= bound,
+                ">": installed > bound,
+                "<=": installed <= bound,
+                "<": installed < bound,
+                "==": installed == bound,
+            }.get(operator, False):
+                return False
+        return True
+
+    def cover_versions(self, deltas, outdated):
+        """Returns the smallest list of deltas that together apply to every
+        installed version any of them applies to. Among covers of the same
+        size, the one moving the fewest bytes across the fleet wins.
+        outdated is a dict of installed version -> number of machines."""
+        # pylint: disable=no-self-use
+        coverable = set().union(*(d["applies_to"] for d in deltas))
+
+        def fleet_bytes(cover):
+            total = 0
+            for version in coverable:
+                sizes = [d["size"] or 0 for d in cover if version in d["applies_to"]]
+                total += min(sizes) * outdated[version]
+            return total
+
+        if len(deltas) <= MAX_EXACT_COVER_DELTAS:
+            for size in range(len(deltas) + 1):
+                covers = [
+                    list(cover)
+                    for cover in itertools.combinations(deltas, size)
+                    if set().union(*(d["applies_to"] for d in cover)) == coverable
+                ]
+                if covers:
+                    return min(covers, key=fleet_bytes)
+        # Too many deltas to try every combination; fall back to the greedy
+        # approximation.
+        cover = []
+        uncovered = set(coverable)
+        while uncovered:
+            best = max(
+                deltas,
+                key=lambda d: (len(d["applies_to"] & uncovered), -(d["size"] or 0)),
+            )
+            cover.append(best)
+            uncovered -= best["applies_to"]
+        return cover
+
+    def plan_fleet_updates(self, metadata, installed_versions):
+        """Works out which packages bring every installed version in
+        installed_versions (a dict of version -> number of machines) up to
+        the newest version in the feed.
+
+        Versions that some delta applies to are covered by the smallest set
+        of deltas; everything else falls back to the full updater, which is
+        always part of the plan. Returns a dict describing the plan."""
+        full_updaters = [u for u in metadata if not u.get("FullUpdaterLocation")]
+        if not full_updaters:
+            raise ProcessorError("No full updater found in update metadata.")
+        full = max(full_updaters, key=lambda u: APLooseVersion(u["Update Version"]))
+        target_version = full["Update Version"]
+        candidates = [
+            {
+                "type": "full",
+                "url": full["Location"],
+                "minimum_version": "",
+                "size": self.get_package_size(full),
+                "entry": full,
+            }
+        ]
+        for item in metadata:
+            if (
+                item.get("FullUpdaterLocation")
+                and item.get("Update Version") == target_version
+            ):
+                candidates.append(
+                    {
+                        "type": "delta",
+                        "url": item["Location"],
+                        "minimum_version": self.get_delta_source_version(item) or "",
+                        "size": self.get_package_size(item),
+                        "entry": item,
+                    }
+                )
+
+        up_to_date = []
+        outdated = {}
+        for version, count in installed_versions.items():
+            if APLooseVersion(version) >= APLooseVersion(target_version):
+                up_to_date.append(version)
+            else:
+                outdated[version] = int(count)
+
+        # Which installed versions each package applies to.
+        for candidate in candidates:
+            if candidate["type"] == "full":
+                candidate["applies_to"] = set(outdated)
+            else:
+                candidate["applies_to"] = {
+                    v for v in outdated if self.delta_applies_to(candidate["entry"], v)
+                }
+        deltas = [c for c in candidates if c["type"] == "delta" and c["applies_to"]]
+        chosen = self.cover_versions(deltas, outdated)
+
+        def transfer_size(candidate):
+            # Unknown sizes sort after every known size.
+            return (candidate["size"] is None, candidate["size"] or 0)
+
+        # Every version goes to the smallest chosen delta that applies to
+        # it, or to the full updater if none does.
+        assignment = {}
+        for version in outdated:
+            applicable = [c for c in chosen if version in c["applies_to"]]
+            if applicable:
+                assignment[version] = min(applicable, key=transfer_size)
+            else:
+                assignment[version] = candidates[0]
+
+        packages = []
+        for candidate in candidates:
+            covers = sorted(
+                (v for v, c in assignment.items() if c is candidate), key=APLooseVersion
+            )
+            if not covers and candidate["type"] != "full":
+                continue
+            packages.append(
+                {
+                    "type": candidate["type"],
+                    "url": candidate["url"],
+                    "minimum_version": candidate["minimum_version"],
+                    "size": candidate["size"] or 0,
+                    "covers": covers,
+                    "machines": sum(outdated[v] for v in covers),
+                }
+            )
+
+        return {
+            "target_version": target_version,
+            "packages": packages,
+            "up_to_date": sorted(up_to_date, key=APLooseVersion),
+            "package_bytes": sum(p["size"] for p in packages),
+            "fleet_bytes": sum(p["size"] * p["machines"] for p in packages),
+        }
+
+    def get_culture_code(self, locale_id):
+        """Returns the feed culture code for a decimal locale id, e.g.
+        '0409' for 1033."""
+        # pylint: disable=no-self-use
+        try:
+            return "%04X" % int(locale_id)
+        except (TypeError, ValueError):
+            raise ProcessorError(
+                "Invalid locale id '%s'. See %s for a list of locale codes."
+                % (locale_id, LOCALE_ID_INFO_URL)
+            )
+
+    def get_description(self, item, locale_id):
+        """Returns the description of an update entry in the language of
+        locale_id, falling back to its unlocalized description or title."""
+        # pylint: disable=no-self-use
+        localized = item.get("Localized")
+        if isinstance(localized, dict) and isinstance(localized.get(locale_id), dict):
+            description = localized[locale_id].get("Short Description")
+            if description:
+                return description.strip()
+        return item.get("Short Description") or item.get("Title", "")
+
+    def get_update_key(self, item):
+        """Returns a tuple identifying the same update entry across the
+        feeds of different locales."""
+        return (
+            item.get("Update Version"),
+            bool(item.get("FullUpdaterLocation")),
+            self.get_delta_source_version(item),
+        )
+
+    def get_locale_ids(self):
+        """Returns the list of locale ids to fetch descriptions for."""
+        # pylint: disable=no-self-use
+        locale_ids = self.env["locale_ids"]
+        if isinstance(locale_ids, str):
+            locale_ids = [
+                locale_id.strip()
+                for locale_id in locale_ids.split(",")
+                if locale_id.strip()
+            ]
+        return [str(locale_id) for locale_id in locale_ids]
+
+    def get_localized_descriptions(self, product, channel_id, item, locale_ids):
+        """Returns a dict of locale id -> description of the update entry,
+        read from the feeds of every locale at once."""
+        feed_urls = {}
+        for locale_id in locale_ids:
+            culture_code = self.get_culture_code(locale_id)
+            if culture_code != CULTURE_CODE:
+                feed_urls[locale_id] = self.get_feed_url(
+                    product, channel_id, culture_code
+                )
+        feeds = self.get_feed_metadata(list(feed_urls.values())) if feed_urls else {}
+
+        descriptions = {}
+        for locale_id in locale_ids:
+            if locale_id not in feed_urls:
+                descriptions[locale_id] = self.get_description(item, locale_id)
+                continue
+            localized_item = next(
+                (
+                    u
+                    for u in feeds[feed_urls[locale_id]]
+                    if self.get_update_key(u) == self.get_update_key(item)
+                ),
+                None,
+            )
+            if localized_item is None:
+                self.output(
+                    "WARNING: Update %s not found in the feed for locale %s"
+                    % (item.get("Update Version"), locale_id)
+                )
+                continue
+            descriptions[locale_id] = self.get_description(localized_item, locale_id)
+        return descriptions
+
+    def get_version_index_path(self):
+        """Returns the path of the local version index."""
+        # pylint: disable=no-self-use
+        cache_dir = get_pref("CACHE_DIR") or os.path.expanduser(
+            "~/Library/AutoPkg/Cache"
+        )
+        return os.path.join(cache_dir, VERSION_INDEX_NAME)
+
+    def read_version_index(self):
+        """Returns the local version index: a dict of product -> channel
+        UUID -> version -> {'full': entry, 'deltas': {source version:
+        entry}}."""
+        try:
+            with open(self.get_version_index_path(), "rb") as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def index_entry(self, product, channel_id, item):
+        """Records an update entry to be added to the version index."""
+        if not item.get("Update Version") or not item.get("Location"):
+            return
+        source_version = None
+        if item.get("FullUpdaterLocation"):
+            source_version = self.get_delta_source_version(item)
+            if not source_version:
+                # A delta is indexed by the version it applies to
+                return
+        entry = {k: item[k] for k in VERSION_INDEX_KEYS if k in item}
+        record = (
+            self.new_index_entries.setdefault(product, {})
+            .setdefault(channel_id, {})
+            .setdefault(item["Update Version"], {})
+        )
+        if source_version:
+            record.setdefault("deltas", {})[source_version] = entry
+        else:
+            record["full"] = entry
+
+    def index_feed(self, product, channel_id, metadata):
+        """Adds every entry of a feed to the version index, not just the
+        ones the update selection looks at."""
+        for item in metadata:
+            self.index_entry(product, channel_id, item)
+
+    def save_version_index(self):
+        """Merges the entries seen in this run into the local version index."""
+        if not self.new_index_entries:
+            return
+        index_path = self.get_version_index_path()
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            # Hold a lock so concurrent runs don't drop each other's entries
+            with open(index_path + ".lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                index = self.read_version_index()
+                for product, channels in self.new_index_entries.items():
+                    for channel_id, versions in channels.items():
+                        known = index.setdefault(product, {}).setdefault(channel_id, {})
+                        for version, record in versions.items():
+                            known_record = known.setdefault(version, {})
+                            if "full" in record:
+                                known_record["full"] = record["full"]
+                            known_record.setdefault("deltas", {}).update(
+                                record.get("deltas", {})
+                            )
+                tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+                with open(tmp_path, "wb") as f:
+                    plistlib.dump(index, f, fmt=plistlib.FMT_BINARY)
+                os.replace(tmp_path, index_path)
+        except OSError as err:
+            self.output(
+                "WARNING: Could not write version index %s: %s" % (index_path, err)
+            )
+
+    def lookup_version(self, product, channel_id, version):
+        """Returns the full updater entry of a specific version from the
+        local version index."""
+        record = (
+            self.read_version_index().get(product, {}).get(channel_id, {}).get(version)
+        )
+        if not record:
+            raise ProcessorError(
+                "Version %s of %s is not in the local version index at %s. "
+                "It only holds updates seen in earlier runs."
+                % (version, product, self.get_version_index_path())
+            )
+        if record.get("full"):
+            return dict(record["full"])
+        # Only deltas were seen, but they name the full updater too.
+        delta = next(iter(record["deltas"].values()))
+        item = {
+            k: v
+            for k, v in delta.items()
+            if k not in ("FullUpdaterLocation", "FullUpdaterSize", "FullUpdaterHash")
+        }
+        item["Location"] = delta["FullUpdaterLocation"]
+        for key in ("Size", "Hash"):
+            item.pop(key, None)
+            if delta.get("FullUpdater" + key):
+                item[key] = delta["FullUpdater" + key]
+        return item
+
+    def get_installer_info(self):
+        """Gets info about an installer from MS metadata."""
+        # Get the channel UUID, matching against a custom UUID if one is given
+        channel = self.get_channel_id(self.env.get("channel", DEFAULT_CHANNEL))
+        product = self.env["product"]
+        if re.match(SPECIFIC_VERSION_RE, self.env["version"]):
+            self.output(
+                "Looking up %s in the local version index" % self.env["version"]
+            )
+            metadata = []
+            item = self.lookup_version(product, channel, self.env["version"])
+        else:
+            base_url = self.get_feed_url(product, channel)
+            metadata = self.get_feed_metadata([base_url])[base_url]
+            self.index_feed(product, channel, metadata)
+            item = self.select_update(metadata, self.env["version"])
+
+        required_update_name = self.env["NAME"]
+        if self.env["munki_required_update_name"]:
+            required_update_name = self.env["munki_required_update_name"]
+        info = self.get_update_info(
+            product, item, self.env["version"], required_update_name
+        )
+
+        self.env["version"] = info["version"]
+        self.env["minimum_os_version"] = info["minimum_os_version"]
+        self.env["minimum_version_for_delta"] = info["minimum_version_for_delta"]
+        self.env["additional_pkginfo"] = info["additional_pkginfo"]
+        self.env["url"] = info["url"]
+        self.env["expected_hash"] = info["expected_hash"]
+        self.env["expected_hash_algorithm"] = info["expected_hash_algorithm"]
+        self.env["expected_size"] = info["expected_size"]
+        self.env["description"] = self.get_description(item, self.env["locale_id"])
+        if self.env.get("locale_ids"):
+            info["additional_pkginfo"]["localized_descriptions"] = (
+                self.get_localized_descriptions(
+                    product, channel, item, self.get_locale_ids()
+                )
+            )
         self.output("Additional pkginfo: %s" % self.env["additional_pkginfo"])
 
+        if self.env.get("installed_versions"):
+            plan = self.plan_fleet_updates(metadata, self.env["installed_versions"])
+            self.env["update_plan"] = plan
+            self.output(
+                "Update plan to %s: %d packages, %d bytes to import, %d bytes "
+                "across the fleet"
+                % (
+                    plan["target_version"],
+                    len(plan["packages"]),
+                    plan["package_bytes"],
+                    plan["fleet_bytes"],
+                )
+            )
+
+    def get_products(self):
+        """Returns the list of products requested in batch mode."""
+        products = self.env["products"]
+        if isinstance(products, str):
+            products = [p.strip() for p in products.split(",") if p.strip()]
+        if products == ["all"]:
+            products = list(PROD_DICT)
+        unknown = [p for p in products if p not in PROD_DICT]
+        if unknown:
+            raise ProcessorError(
+                "Unknown products: %s. Supported products are: %s"
+                % (", ".join(unknown), ", ".join(PROD_DICT))
+            )
+        return products
+
+    def get_batch_installer_info(self):
+        """Gets info about the installers of several products, fetching all of
+        their feeds at once."""
+        channel = self.get_channel_id(self.env.get("channel", DEFAULT_CHANNEL))
+        products = self.get_products()
+        feed_urls = [self.get_feed_url(product, channel) for product in products]
+        feeds = self.get_feed_metadata(feed_urls)
+
+        results = {}
+        for product, feed_url in zip(products, feed_urls):
+            self.output("Processing %s" % product)
+            self.index_feed(product, channel, feeds[feed_url])
+            item = self.select_update(feeds[feed_url], self.env["version"])
+            # There's no single NAME in batch mode, so deltas require the
+            # product name unless told otherwise.
+            required_update_name = self.env["munki_required_update_name"] or product
+            results[product] = self.get_update_info(
+                product, item, self.env["version"], required_update_name
+            )
+        self.env["office_updates"] = results
+        self.output("Resolved %d products" % len(results))
+
+    def get_channels(self):
+        """Returns the list of channels requested in multi-channel mode."""
+        # pylint: disable=no-self-use
+        channels = self.env["channels"]
+        if isinstance(channels, str):
+            channels = [c.strip() for c in channels.split(",") if c.strip()]
+        return channels
+
+    def diff_channels(self, results):
+        """Compares the versions resolved for each channel. Returns a dict
+        with the newest version, the channels carrying it, and for each
+        channel the list of channels it is ahead of. Channels whose update
+        has no version are left out of the comparison."""
+        # pylint: disable=no-self-use
+        versions = {
+            channel: APLooseVersion(info["version"])
+            for channel, info in results.items()
+            if info["version"]
+        }
+        newest = max(versions.values()) if versions else None
+        return {
+            "newest_version": str(newest) if versions else "",
+            "newest_channels": [c for c, v in versions.items() if v == newest],
+            "ahead_of": {
+                channel: [
+                    c
+                    for c, v in versions.items()
+                    if channel in versions and versions[channel] > v
+                ]
+                for channel in results
+            },
+        }
+
+    def get_channel_installer_info(self):
+        """Gets info about the installer of one product in several channels,
+        fetching all of their feeds at once."""
+        product = self.env["product"]
+        channels = []
+        channel_ids = []
+        feed_urls = []
+        for channel in self.get_channels():
+            channel_id = self.get_channel_id(channel)
+            feed_url = self.get_feed_url(product, channel_id)
+            # A channel may be given both by name and by its UUID
+            if feed_url in feed_urls:
+                self.output(
+                    "Skipping %s channel, the same feed as %s"
+                    % (channel, channels[feed_urls.index(feed_url)])
+                )
+                continue
+            channels.append(channel)
+            channel_ids.append(channel_id)
+            feed_urls.append(feed_url)
+        feeds = self.get_feed_metadata(feed_urls)
+
+        required_update_name = self.env["NAME"]
+        if self.env["munki_required_update_name"]:
+            required_update_name = self.env["munki_required_update_name"]
+        results = {}
+        for channel, channel_id, feed_url in zip(channels, channel_ids, feed_urls):
+            self.output("Processing %s channel" % channel)
+            self.index_feed(product, channel_id, feeds[feed_url])
+            item = self.select_update(feeds[feed_url], self.env["version"])
+            results[channel] = self.get_update_info(
+                product, item, self.env["version"], required_update_name
+            )
+        self.env["channel_updates"] = results
+        self.env["channel_diff"] = self.diff_channels(results)
+        self.output(
+            "Newest version %s is in: %s"
+            % (
+                self.env["channel_diff"]["newest_version"],
+                ", ".join(self.env["channel_diff"]["newest_channels"]),
+            )
+        )
+
     def main(self):
         """Get information about an update"""
-        if self.env["version"] not in SUPPORTED_VERSIONS:
+        self.env["feed_cache_hits"] = 0
+        self.env["feed_cache_misses"] = 0
+        specific_version = re.match(SPECIFIC_VERSION_RE, self.env["version"])
+        if self.env["version"] not in SUPPORTED_VERSIONS and not specific_version:
             raise ProcessorError(
-                "Invalid 'version': supported values are '%s'"
-                % "', '".join(SUPPORTED_VERSIONS)
+                "Invalid 'version': supported values are '%s' or a specific "
+                "version number" % "', '".join(SUPPORTED_VERSIONS)
             )
-        self.get_installer_info()
+        if self.env.get("products") and self.env.get("channels"):
+            raise ProcessorError("'products' and 'channels' can't be used together.")
+        if specific_version and (
+            self.env.get("products")
+            or self.env.get("channels")
+            or self.env.get("installed_versions")
+        ):
+            raise ProcessorError(
+                "A specific 'version' can't be used with 'products', "
+                "'channels' or 'installed_versions'."
+            )
+        if self.env.get("products"):
+            self.get_batch_installer_info()
+        elif self.env.get("product") and self.env.get("channels"):
+            self.get_channel_installer_info()
+        elif self.env.get("product"):
+            self.get_installer_info()
+        else:
+            raise ProcessorError("One of 'product' or 'products' must be set.")
+        self.save_version_index()
 
 
 if __name__ == "__main__":
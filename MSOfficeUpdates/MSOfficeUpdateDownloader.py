@@ -0,0 +1,306 @@
+#!/usr/local/autopkg/python
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""See docstring for MSOfficeUpdateDownloader class"""
+
+import fcntl
+import hashlib
+import os
+import plistlib
+import subprocess
+
+from autopkglib import ProcessorError
+from autopkglib.URLGetter import URLGetter
+
+__all__ = ["MSOfficeUpdateDownloader"]
+
+CHUNK_SIZE = 1024 * 1024
+VERIFIED_DOWNLOADS_PLIST = ".verified_downloads.plist"
+
+
+class MSOfficeUpdateDownloader(URLGetter):
+    """Downloads a Microsoft Office package and verifies it against the digest
+    and size from the MAU metadata while it streams to disk. Meant to follow
+    MSOfficeMacURLandUpdateInfoProvider in place of URLDownloader. When there
+    is no digest to check, the download is requested conditionally like
+    URLDownloader does, so an unchanged package isn't downloaded again."""
+
+    description = __doc__
+    input_variables = {
+        "url": {"required": True, "description": "The URL to download."},
+        "filename": {
+            "required": False,
+            "description": (
+                "Filename to save the download as. Defaults to the last "
+                "component of the url."
+            ),
+        },
+        "download_dir": {
+            "required": False,
+            "description": (
+                "Directory to download to. Defaults to RECIPE_CACHE_DIR/downloads."
+            ),
+        },
+        "expected_hash": {
+            "required": False,
+            "default": "",
+            "description": (
+                "Expected hex digest of the download. If empty, the digest "
+                "is not checked and the server's ETag and Last-Modified "
+                "headers decide whether to download again."
+            ),
+        },
+        "expected_hash_algorithm": {
+            "required": False,
+            "default": "sha256",
+            "description": "hashlib name of the algorithm of expected_hash.",
+        },
+        "expected_size": {
+            "required": False,
+            "default": "",
+            "description": (
+                "Expected size of the download in bytes. If empty, the size "
+                "is not checked."
+            ),
+        },
+    }
+    output_variables = {
+        "pathname": {"description": "Path to the downloaded file."},
+        "download_changed": {
+            "description": (
+                "Boolean indicating if the download has changed since the "
+                "last time it was downloaded."
+            )
+        },
+    }
+
+    def get_verified_downloads(self, download_dir):
+        """Returns the dict of filename -> digest, size, mtime and server
+        validators of the files downloaded to download_dir."""
+        # pylint: disable=no-self-use
+        try:
+            with open(os.path.join(download_dir, VERIFIED_DOWNLOADS_PLIST), "rb") as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def record_verified_download(self, download_dir, pathname, digest, header):
+        """Remembers the digest of the file at pathname and the validators the
+        server sent with it. Holds a lock while doing so, so concurrent
+        downloads to download_dir don't drop each other's records."""
+        plist_path = os.path.join(download_dir, VERIFIED_DOWNLOADS_PLIST)
+        stat = os.stat(pathname)
+        record = {"digest": digest, "size": stat.st_size, "mtime": stat.st_mtime}
+        if header.get("etag"):
+            record["etag"] = header["etag"]
+        if header.get("last-modified"):
+            record["last_modified"] = header["last-modified"]
+        with open(plist_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            verified = self.get_verified_downloads(download_dir)
+            verified[os.path.basename(pathname)] = record
+            tmp_path = "%s.%d.tmp" % (plist_path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(verified, f)
+            os.replace(tmp_path, plist_path)
+
+    def get_download_record(self, download_dir, pathname, size):
+        """Returns the record of the download at pathname, or an empty dict
+        if there is none or the file changed since, or doesn't have the
+        expected size."""
+        if not os.path.exists(pathname):
+            return {}
+        record = self.get_verified_downloads(download_dir).get(
+            os.path.basename(pathname), {}
+        )
+        stat = os.stat(pathname)
+        if size is not None and stat.st_size != size:
+            return {}
+        if record.get("size") != stat.st_size or record.get("mtime") != (stat.st_mtime):
+            return {}
+        return record
+
+    def read_response_header(self, stream, url):
+        """Reads the header blocks curl writes ahead of the body and returns
+        the parsed header of the final response, or None if curl stopped
+        before one arrived."""
+        while True:
+            lines = []
+            while True:
+                line = stream.readline()
+                if not line:
+                    return None
+                line = line.decode("iso-8859-1").rstrip("\r\n")
+                if not line:
+                    break
+                lines.append(line)
+            header = self.parse_headers("\n".join(lines), url)
+            # Redirects and informational responses are followed by another
+            # header block.
+            code = header.get("http_result_code", "")
+            if code == "304" or not (code.startswith("1") or code.startswith("3")):
+                return header
+
+    def stream_download(self, url, tmp_path, hash_algorithm, expected_size, headers):
+        """Streams url to tmp_path, hashing the bytes on the way. Aborts as
+        soon as the download can't match expected_size. Returns a tuple of
+        the hex digest, or None if the server answered 304 Not Modified, and
+        the response header."""
+        curl_cmd = [
+            self.curl_binary(),
+            "--location",
+            "--silent",
+            "--show-error",
+            "--fail",
+            "--dump-header",
+            "-",
+        ]
+        if expected_size is not None:
+            # curl refuses up front when the server announces a larger file
+            curl_cmd.extend(["--max-filesize", str(expected_size)])
+        self.add_curl_headers(curl_cmd, headers)
+        self.add_curl_common_opts(curl_cmd)
+        curl_cmd.append(url)
+        self.output("Curl command: %s" % curl_cmd, verbose_level=4)
+
+        digest = hashlib.new(hash_algorithm)
+        received = 0
+        try:
+            proc = subprocess.Popen(
+                curl_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as err:
+            raise ProcessorError("curl execution failed: %s" % err)
+        try:
+            header = self.read_response_header(proc.stdout, url) or {}
+            # A 304 Not Modified response has no body
+            not_modified = header.get("http_result_code") == "304"
+            content_length = header.get("content-length")
+            if (
+                not not_modified
+                and expected_size is not None
+                and content_length
+                and int(content_length) != expected_size
+            ):
+                raise ProcessorError(
+                    "Size mismatch for %s: server announced %s bytes, expected %s"
+                    % (url, content_length, expected_size)
+                )
+            if not not_modified:
+                with open(tmp_path, "wb") as f:
+                    while True:
+                        chunk = proc.stdout.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        received += len(chunk)
+                        if expected_size is not None and received > expected_size:
+                            raise ProcessorError(
+                                "Size mismatch for %s: received more than %s bytes"
+                                % (url, expected_size)
+                            )
+                        digest.update(chunk)
+                        f.write(chunk)
+            _, err_out = proc.communicate()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.communicate()
+        if proc.returncode:
+            curl_err = self.parse_curl_error(err_out.decode("utf-8", "ignore"))
+            raise ProcessorError(
+                "Curl failure: %s (exit code %s)" % (curl_err, proc.returncode)
+            )
+        if not_modified:
+            return None, header
+        if expected_size is not None and received != expected_size:
+            raise ProcessorError(
+                "Size mismatch for %s: received %s bytes, expected %s"
+                % (url, received, expected_size)
+            )
+        return digest.hexdigest(), header
+
+    def main(self):
+        """Download and verify the package"""
+        url = self.env["url"]
+        download_dir = self.env.get("download_dir") or os.path.join(
+            self.env["RECIPE_CACHE_DIR"], "downloads"
+        )
+        filename = self.env.get("filename") or os.path.basename(url.split("?")[0])
+        pathname = os.path.join(download_dir, filename)
+        expected_hash = self.env.get("expected_hash", "").lower()
+        hash_algorithm = self.env.get("expected_hash_algorithm") or "sha256"
+        if hash_algorithm not in hashlib.algorithms_available:
+            raise ProcessorError("Unsupported hash algorithm: %s" % hash_algorithm)
+        try:
+            expected_size = (
+                int(self.env["expected_size"])
+                if self.env.get("expected_size")
+                else None
+            )
+        except ValueError:
+            raise ProcessorError(
+                "Invalid expected_size: %s" % self.env["expected_size"]
+            )
+
+        self.env["pathname"] = pathname
+        try:
+            os.makedirs(download_dir, exist_ok=True)
+        except OSError as err:
+            raise ProcessorError("Can't create %s: %s" % (download_dir, err))
+
+        record = self.get_download_record(download_dir, pathname, expected_size)
+        if expected_hash and record.get("digest") == expected_hash:
+            self.output("Item at %s already verified, skipping download" % pathname)
+            self.env["download_changed"] = False
+            return
+        headers = {}
+        if not expected_hash:
+            # Nothing to verify against, so ask the server whether the file
+            # we have is still current.
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+
+        tmp_path = "%s.%d.download" % (pathname, os.getpid())
+        try:
+            digest, header = self.stream_download(
+                url, tmp_path, hash_algorithm, expected_size, headers
+            )
+            if digest is None:
+                self.output("Item at %s unchanged on the server" % pathname)
+                self.env["download_changed"] = False
+                return
+            if expected_hash and digest != expected_hash:
+                raise ProcessorError(
+                    "%s mismatch for %s: got %s, expected %s"
+                    % (hash_algorithm, url, digest, expected_hash)
+                )
+            os.replace(tmp_path, pathname)
+        except (OSError, ProcessorError) as err:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise ProcessorError(err)
+
+        if expected_hash:
+            self.output("Verified %s digest %s" % (hash_algorithm, digest))
+        self.record_verified_download(download_dir, pathname, digest, header)
+        self.env["download_changed"] = True
+        self.output("Downloaded %s" % pathname)
+
+
+if __name__ == "__main__":
+    PROCESSOR = MSOfficeUpdateDownloader()
+    PROCESSOR.execute_shell()
@@ -18,10 +18,16 @@
 from __future__ import absolute_import
 
 import json
+import os
 import re
-from typing import List, Tuple
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urljoin
 
-from autopkglib import URLGetter
+from autopkglib import ProcessorError, URLGetter, get_pref
 
 __all__: List[str] = ["MozillaURLProvider"]
 
@@ -35,6 +41,26 @@ MOZ_PRODUCT_VERSIONS_URL: str = (
     "https://product-details.mozilla.org/1.0/{product}_versions.json"
 )
 
+# Seconds a downloaded product versions document is reused by later runs.
+DEFAULT_VERSIONS_CACHE_TTL: int = 3600
+
+# Upper bound on simultaneous redirect lookups.
+MAX_PARALLEL_REQUESTS: int = 8
+
+MOZ_SHA512SUMS_URL: str = (
+    "https://releases.mozilla.org/pub/{product}/releases/{version}/SHA512SUMS"
+)
+
+# Directory of each platform in the release tree, and the pattern of the
+# installer name in it. {name} is the capitalized product name.
+MOZ_RELEASE_PLATFORMS: Dict[str, Tuple[str, str]] = {
+    "osx": ("mac", r"{name} {version}\.dmg"),
+    "win": ("win32", r"{name} Setup {version}\.{ext}"),
+    "win64": ("win64", r"{name} Setup {version}\.{ext}"),
+    "linux": ("linux-i686", r"{product}-{version}\.tar\.(?:bz2|xz)"),
+    "linux64": ("linux-x86_64", r"{product}-{version}\.tar\.(?:bz2|xz)"),
+}
+
 # As of July/2020 here are the known supported products, releases, and platforms:
 # For linux, linux64, osx, win, and win64:
 #  Product            Release
@@ -115,6 +141,61 @@ class MozillaURLProvider(URLGetter):
             ),
             "default": MOZ_PRODUCT_VERSIONS_URL,
         },
+        "versions_cache_ttl": {
+            "required": False,
+            "description": (
+                "Seconds that product release version information is cached "
+                "in the AutoPkg cache dir and shared by every recipe using "
+                "this processor. All firefox products read the same document, "
+                "as do all thunderbird products. Set to 0 to always download "
+                f"it. Default is {DEFAULT_VERSIONS_CACHE_TTL}."
+            ),
+            "default": str(DEFAULT_VERSIONS_CACHE_TTL),
+        },
+        "resolve_redirects": {
+            "required": False,
+            "description": (
+                "If not false or empty or undefined, follow the "
+                "download.mozilla.org redirect once and output the final CDN "
+                "url as 'url', so the download step can check it for changes "
+                "without going through the redirect again."
+            ),
+        },
+        "sha512sums": {
+            "required": False,
+            "description": (
+                "If not false or empty or undefined, look up the SHA-512 "
+                "digest of the installer in the SHA512SUMS file of the "
+                "release and output it as 'moz_sha512'. 'url' then points at "
+                "that installer in the release directory instead of the "
+                "download.mozilla.org redirect, which may already lead to a "
+                "newer release. Not available for nightly builds."
+            ),
+        },
+        "sha512sums_url": {
+            "required": False,
+            "description": (
+                f"(Advanced) URL of the SHA512SUMS file. Default is "
+                f"'{MOZ_SHA512SUMS_URL}'."
+            ),
+            "default": MOZ_SHA512SUMS_URL,
+        },
+        "locales": {
+            "required": False,
+            "description": (
+                "Matrix mode: a list of localizations, crossed with "
+                "'platforms'. The release version is resolved once and a "
+                "record for every combination is returned in 'moz_matrix'. "
+                "Defaults to the single 'locale'."
+            ),
+        },
+        "platforms": {
+            "required": False,
+            "description": (
+                "Matrix mode: a list of platforms, crossed with 'locales'. "
+                "Defaults to the single 'platform'."
+            ),
+        },
     }
     output_variables = {
         "url": {"description": "URL to the latest Mozilla product release."},
@@ -129,6 +210,34 @@ class MozillaURLProvider(URLGetter):
                 "Pre-normalized version number from the product versions information."
             )
         },
+        "moz_matrix": {
+            "description": (
+                "Matrix mode only: a list of dicts with the 'locale', "
+                "'platform', download 'url', the 'final_url' it redirects to, "
+                "and the 'content_length' and 'last_modified' of the download."
+            )
+        },
+        "moz_sha512": {
+            "description": (
+                "With sha512sums: hex SHA-512 digest of the installer at "
+                "'url', to be checked by MozillaVerifiedDownloader."
+            )
+        },
+        "moz_bouncer_url": {
+            "description": (
+                "With resolve_redirects: the download.mozilla.org url of the "
+                "installer. With sha512sums too, 'url' is resolved from the "
+                "release directory url instead."
+            )
+        },
+        "content_length": {
+            "description": "With resolve_redirects: the size of the download."
+        },
+        "last_modified": {
+            "description": (
+                "With resolve_redirects: the Last-Modified header of the download."
+            )
+        },
     }
 
     def fixup_locale(self, locale: str) -> str:
@@ -157,6 +266,58 @@ class MozillaURLProvider(URLGetter):
         norm_version = norm_version.replace("-msi", "")
         return norm_version
 
+    def get_versions_cache_path(self, versions_url: str) -> str:
+        """Returns the path of the cache file for a product versions url."""
+        cache_dir = get_pref("CACHE_DIR") or os.path.expanduser(
+            "~/Library/AutoPkg/Cache"
+        )
+        name = re.sub(r"[^0-9A-Za-z._-]", "_", versions_url.split("://")[-1])
+        return os.path.join(cache_dir, "mozilla_product_details", name)
+
+    def read_versions_cache(self, versions_url: str, ttl: int) -> Optional[str]:
+        """Returns the cached product versions document for a url if it is
+        younger than ttl seconds, or None."""
+        if ttl <= 0:
+            return None
+        cache_path = self.get_versions_cache_path(versions_url)
+        try:
+            if time.time() - os.path.getmtime(cache_path) > ttl:
+                return None
+            with open(cache_path, "r") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_versions_cache(self, versions_url: str, json_data: str) -> None:
+        """Caches a product versions document for later runs."""
+        cache_path = self.get_versions_cache_path(versions_url)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write to a temporary file first so concurrent runs never read
+            # a partial document.
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(json_data)
+            os.replace(tmp_path, cache_path)
+        except OSError as err:
+            self.output(f"WARNING: Could not cache {versions_url}: {err}")
+
+    def get_product_versions(self, versions_url: str) -> str:
+        """Returns the product versions document at versions_url, from the
+        cache if a recent enough copy is there."""
+        try:
+            ttl = int(self.env.get("versions_cache_ttl", DEFAULT_VERSIONS_CACHE_TTL))
+        except ValueError:
+            ttl = DEFAULT_VERSIONS_CACHE_TTL
+        json_data = self.read_versions_cache(versions_url, ttl)
+        if json_data is not None:
+            self.output(f"Using cached product versions from {versions_url}", 2)
+            return json_data
+        json_data = self.download(versions_url, text=True)
+        if ttl > 0:
+            self.write_versions_cache(versions_url, json_data)
+        return json_data
+
     def resolve_product_release_version(
         self, base_url: str, product: str, release: str
     ) -> Tuple[str, str]:
@@ -186,11 +347,184 @@ class MozillaURLProvider(URLGetter):
             # releases more or less untouched.
             return (self.normalize_version(release), release)
 
-        json_data = self.download(base_url.format(product=simple_product))
+        json_data = self.get_product_versions(base_url.format(product=simple_product))
         release_data = json.loads(json_data)
         orig_version = release_data[release_key]
         return (self.normalize_version(orig_version), orig_version)
 
+    def resolve_redirects(self, urls: List[str]) -> List[Dict[str, Any]]:
+        """Follows the redirects of several urls with HEAD requests in a
+        single curl process, so connections are reused and requests run in
+        parallel. Returns, in the same order, the header of each final
+        response as returned by parse_headers(), with the final url added as
+        'final_url'."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            curl_cmd = [self.curl_binary()]
+            if len(urls) > 1:
+                # --parallel needs curl 7.66 or later
+                curl_cmd.extend(
+                    ["--parallel", "--parallel-max", str(MAX_PARALLEL_REQUESTS)]
+                )
+            header_paths = []
+            for index, url in enumerate(urls):
+                header_path = os.path.join(tmp_dir, f"{index}.headers")
+                if index:
+                    curl_cmd.append("--next")
+                curl_cmd.extend(
+                    [
+                        "--head",
+                        "--location",
+                        "--silent",
+                        "--show-error",
+                        "--dump-header",
+                        header_path,
+                        "--output",
+                        os.devnull,
+                    ]
+                )
+                self.add_curl_common_opts(curl_cmd)
+                curl_cmd.append(url)
+                header_paths.append(header_path)
+            self.download_with_curl(curl_cmd)
+
+            results = []
+            for url, header_path in zip(urls, header_paths):
+                try:
+                    with open(header_path, "r", errors="ignore") as f:
+                        raw_headers = f.read()
+                except OSError:
+                    raise ProcessorError(f"No response received for {url}")
+                # One header block per response; follow the Location of each
+                # redirect to find the final url.
+                final_url = url
+                header: Dict[str, Any] = {}
+                for block in re.split(r"\r?\n\r?\n", raw_headers.strip()):
+                    header = self.parse_headers(block, url)
+                    if header.get("location") and header.get(
+                        "http_result_code", ""
+                    ).startswith("3"):
+                        final_url = urljoin(final_url, header["location"])
+                header["final_url"] = final_url
+                results.append(header)
+            return results
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def find_sha512(self, sums_url: str, path_pattern: str) -> Tuple[str, str]:
+        """Streams the SHA512SUMS file at sums_url and returns the (digest,
+        path) of the first line whose path fully matches path_pattern. Stops
+        downloading as soon as it is found."""
+        curl_cmd = self.prepare_curl_cmd()
+        curl_cmd.extend(["--silent", "--show-error", "--fail"])
+        self.add_curl_common_opts(curl_cmd)
+        curl_cmd.append(sums_url)
+        self.output(f"Curl command: {curl_cmd}", verbose_level=4)
+        try:
+            proc = subprocess.Popen(
+                curl_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as err:
+            raise ProcessorError(f"curl execution failed: {err}")
+        try:
+            for line in proc.stdout:
+                # "<digest>  <platform>/<locale>/<file>"
+                digest, _, path = line.decode("utf-8", "ignore").strip().partition(" ")
+                path = path.strip()
+                if re.fullmatch(path_pattern, path):
+                    return (digest, path)
+            _, err_out = proc.communicate()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.communicate()
+        if proc.returncode:
+            curl_err = self.parse_curl_error(err_out.decode("utf-8", "ignore"))
+            raise ProcessorError(
+                f"Curl failure: {curl_err} (exit code {proc.returncode})"
+            )
+        raise ProcessorError(f"No SHA512SUMS entry matching {path_pattern}")
+
+    def get_sha512(
+        self, product: str, orig_version: str, release: str, platform: str, locale: str
+    ) -> Tuple[str, str]:
+        """Returns the digest of the installer from the SHA512SUMS file of a
+        release, and the url of that installer in the release directory."""
+        if "nightly" in product or platform not in MOZ_RELEASE_PLATFORMS:
+            raise ProcessorError(
+                f"SHA512SUMS lookup is not supported for {product} on {platform}."
+            )
+        simple_product = "thunderbird" if "thunderbird" in product else "firefox"
+        platform_dir, file_pattern = MOZ_RELEASE_PLATFORMS[platform]
+        version = orig_version.replace("-msi", "")
+        file_pattern = file_pattern.format(
+            name=simple_product.capitalize(),
+            product=simple_product,
+            version=re.escape(version),
+            ext="msi" if "msi" in release else "exe",
+        )
+        path_pattern = f"{re.escape(platform_dir)}/{re.escape(locale)}/{file_pattern}"
+        sums_url = self.env.get("sha512sums_url", MOZ_SHA512SUMS_URL).format(
+            product=simple_product, version=version
+        )
+        self.output(f"Looking up SHA-512 in {sums_url}", 2)
+        digest, path = self.find_sha512(sums_url, path_pattern)
+        # Paths in SHA512SUMS are relative to the directory it is in
+        return (digest, urljoin(sums_url, quote(path)))
+
+    def check_response(self, url: str, header: Dict[str, Any]) -> None:
+        """Raises an error unless the final response for url was a 200."""
+        if header.get("http_result_code") != "200":
+            raise ProcessorError(
+                f"Unexpected response for {url}: "
+                f"{header.get('http_result_code')} "
+                f"{header.get('http_result_description')}"
+            )
+
+    def get_list(self, key: str, default: str) -> List[str]:
+        """Returns a list input that may also be given as a comma separated
+        string, defaulting to a single item."""
+        value = self.env.get(key) or [default]
+        if isinstance(value, str):
+            value = [v.strip() for v in value.split(",") if v.strip()]
+        return value
+
+    def build_matrix(
+        self, base_url: str, product_release: str, locale: str, platform: str
+    ) -> List[Dict[str, Any]]:
+        """Returns a record for every combination of the requested locales
+        and platforms, with the redirects of their download urls resolved."""
+        combinations = [
+            (self.fixup_locale(matrix_locale), matrix_platform)
+            for matrix_locale in self.get_list("locales", locale)
+            for matrix_platform in self.get_list("platforms", platform)
+        ]
+        urls = [
+            base_url.format(
+                product_release=product_release,
+                platform=matrix_platform,
+                locale=matrix_locale,
+            )
+            for matrix_locale, matrix_platform in combinations
+        ]
+        headers = self.resolve_redirects(urls)
+        matrix = []
+        for (matrix_locale, matrix_platform), url, header in zip(
+            combinations, urls, headers
+        ):
+            self.check_response(url, header)
+            matrix.append(
+                {
+                    "locale": matrix_locale,
+                    "platform": matrix_platform,
+                    "url": url,
+                    "final_url": header["final_url"],
+                    "content_length": header.get("content-length", ""),
+                    "last_modified": header.get("last-modified", ""),
+                }
+            )
+        return matrix
+
     def main(self):
         """Provide a Mozilla download URL"""
         # Determine product_name, release, locale, and base_url.
@@ -213,6 +547,38 @@ class MozillaURLProvider(URLGetter):
         )
         self.env["moz_locale"] = locale
         self.output(f"Found URL {self.env['url']}")
+        bouncer_url = self.env["url"]
+
+        if self.env.get("sha512sums"):
+            # The redirect may move on to a newer release than the one the
+            # versions document named, so download exactly the file the
+            # digest is for.
+            self.env["moz_sha512"], self.env["url"] = self.get_sha512(
+                product_name,
+                self.env["moz_original_version"],
+                release,
+                platform,
+                locale,
+            )
+            self.output(f"Found SHA-512 for {self.env['url']}")
+
+        if self.env.get("resolve_redirects"):
+            header = self.resolve_redirects([self.env["url"]])[0]
+            self.check_response(self.env["url"], header)
+            self.env["moz_bouncer_url"] = bouncer_url
+            self.env["url"] = header["final_url"]
+            self.env["content_length"] = header.get("content-length", "")
+            self.env["last_modified"] = header.get("last-modified", "")
+            self.output(f"Resolved to {self.env['url']}")
+
+        if self.env.get("locales") or self.env.get("platforms"):
+            self.env["moz_matrix"] = self.build_matrix(
+                base_url,
+                self.fixup_product_release(product_name, release),
+                locale,
+                platform,
+            )
+            self.output(f"Resolved {len(self.env['moz_matrix'])} downloads")
 
 
 if __name__ == "__main__":
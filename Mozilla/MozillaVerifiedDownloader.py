@@ -0,0 +1,286 @@
+#!/usr/local/autopkg/python
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""See docstring for MozillaVerifiedDownloader class"""
+
+import fcntl
+import hashlib
+import os
+import plistlib
+import subprocess
+from typing import Any, Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+from autopkglib import ProcessorError, URLGetter
+
+__all__: List[str] = ["MozillaVerifiedDownloader"]
+
+CHUNK_SIZE: int = 1024 * 1024
+# Not the .verified_downloads.plist of MSOfficeUpdateDownloader, whose
+# records also hold the server's validators
+VERIFIED_DOWNLOADS_PLIST: str = ".mozilla_verified_downloads.plist"
+
+
+class MozillaVerifiedDownloader(URLGetter):
+    """Downloads a Mozilla installer and checks it against the SHA-512 digest
+    from MozillaURLProvider while it streams to disk, instead of reading the
+    file again afterwards."""
+
+    description = __doc__
+    input_variables = {
+        "url": {"required": True, "description": "The URL to download."},
+        "expected_sha512": {
+            "required": False,
+            "description": (
+                "Expected hex SHA-512 digest of the download. Defaults to "
+                "'moz_sha512' as set by MozillaURLProvider with sha512sums."
+            ),
+        },
+        "expected_size": {
+            "required": False,
+            "description": (
+                "Expected size of the download in bytes. Defaults to "
+                "'content_length' as set by MozillaURLProvider with "
+                "resolve_redirects. If empty, the size is not checked."
+            ),
+        },
+        "filename": {
+            "required": False,
+            "description": (
+                "Filename to save the download as. Defaults to the last "
+                "component of the url path."
+            ),
+        },
+        "download_dir": {
+            "required": False,
+            "description": (
+                "Directory to download to. Defaults to RECIPE_CACHE_DIR/downloads."
+            ),
+        },
+    }
+    output_variables = {
+        "pathname": {"description": "Path to the downloaded file."},
+        "download_changed": {
+            "description": (
+                "Boolean indicating if the download has changed since the "
+                "last time it was downloaded."
+            )
+        },
+    }
+
+    def get_verified_downloads(self, download_dir: str) -> Dict[str, Any]:
+        """Returns the dict of filename -> digest, size and mtime of the files
+        downloaded to download_dir."""
+        try:
+            with open(os.path.join(download_dir, VERIFIED_DOWNLOADS_PLIST), "rb") as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def record_verified_download(
+        self, download_dir: str, pathname: str, digest: str
+    ) -> None:
+        """Remembers the verified digest of the file at pathname. Holds a
+        lock while doing so, so concurrent downloads to download_dir don't
+        drop each other's records."""
+        plist_path = os.path.join(download_dir, VERIFIED_DOWNLOADS_PLIST)
+        stat = os.stat(pathname)
+        with open(f"{plist_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            verified = self.get_verified_downloads(download_dir)
+            verified[os.path.basename(pathname)] = {
+                "digest": digest,
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+            tmp_path = f"{plist_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(verified, f)
+            os.replace(tmp_path, plist_path)
+
+    def is_already_downloaded(
+        self,
+        download_dir: str,
+        pathname: str,
+        expected_sha512: str,
+        expected_size: Optional[int],
+    ) -> bool:
+        """Returns True if the file at pathname was verified against the
+        expected digest before and hasn't changed since."""
+        if not os.path.exists(pathname):
+            return False
+        record = self.get_verified_downloads(download_dir).get(
+            os.path.basename(pathname), {}
+        )
+        stat = os.stat(pathname)
+        if expected_size is not None and stat.st_size != expected_size:
+            return False
+        return (
+            record.get("digest") == expected_sha512
+            and record.get("size") == stat.st_size
+            and record.get("mtime") == stat.st_mtime
+        )
+
+    def read_response_header(self, stream, url: str) -> Optional[Dict[str, Any]]:
+        """Reads the header blocks curl writes ahead of the body and returns
+        the parsed header of the final response, or None if curl stopped
+        before one arrived."""
+        while True:
+            lines = []
+            while True:
+                line = stream.readline()
+                if not line:
+                    return None
+                line = line.decode("iso-8859-1").rstrip("\r\n")
+                if not line:
+                    break
+                lines.append(line)
+            header = self.parse_headers("\n".join(lines), url)
+            # Redirects and informational responses are followed by another
+            # header block.
+            code = header.get("http_result_code", "")
+            if not (code.startswith("1") or code.startswith("3")):
+                return header
+
+    def stream_download(
+        self, url: str, tmp_path: str, expected_size: Optional[int]
+    ) -> str:
+        """Streams url to tmp_path and returns the hex SHA-512 digest of the
+        bytes written. Aborts as soon as the download can't match
+        expected_size."""
+        curl_cmd = [
+            self.curl_binary(),
+            "--location",
+            "--silent",
+            "--show-error",
+            "--fail",
+            "--dump-header",
+            "-",
+        ]
+        if expected_size is not None:
+            # curl refuses up front when the server announces a larger file
+            curl_cmd.extend(["--max-filesize", str(expected_size)])
+        self.add_curl_common_opts(curl_cmd)
+        curl_cmd.append(url)
+        self.output(f"Curl command: {curl_cmd}", verbose_level=4)
+
+        digest = hashlib.sha512()
+        received = 0
+        try:
+            proc = subprocess.Popen(
+                curl_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        except OSError as err:
+            raise ProcessorError(f"curl execution failed: {err}")
+        try:
+            header = self.read_response_header(proc.stdout, url) or {}
+            content_length = header.get("content-length")
+            if (
+                expected_size is not None
+                and content_length
+                and int(content_length) != expected_size
+            ):
+                raise ProcessorError(
+                    f"Size mismatch for {url}: server announced "
+                    f"{content_length} bytes, expected {expected_size}"
+                )
+            with open(tmp_path, "wb") as f:
+                while True:
+                    chunk = proc.stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if expected_size is not None and received > expected_size:
+                        raise ProcessorError(
+                            f"Size mismatch for {url}: received more than "
+                            f"{expected_size} bytes"
+                        )
+                    digest.update(chunk)
+                    f.write(chunk)
+            _, err_out = proc.communicate()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+                proc.communicate()
+        if proc.returncode:
+            curl_err = self.parse_curl_error(err_out.decode("utf-8", "ignore"))
+            raise ProcessorError(
+                f"Curl failure: {curl_err} (exit code {proc.returncode})"
+            )
+        if expected_size is not None and received != expected_size:
+            raise ProcessorError(
+                f"Size mismatch for {url}: received {received} bytes, "
+                f"expected {expected_size}"
+            )
+        return digest.hexdigest()
+
+    def main(self):
+        """Download and verify the installer"""
+        url = self.env["url"]
+        expected_sha512 = (
+            self.env.get("expected_sha512") or self.env.get("moz_sha512") or ""
+        ).lower()
+        if not expected_sha512:
+            raise ProcessorError(
+                "No expected_sha512 given; run MozillaURLProvider with "
+                "sha512sums first."
+            )
+        size = self.env.get("expected_size") or self.env.get("content_length")
+        try:
+            expected_size = int(size) if size else None
+        except ValueError:
+            raise ProcessorError(f"Invalid expected_size: {size}")
+        download_dir = self.env.get("download_dir") or os.path.join(
+            self.env["RECIPE_CACHE_DIR"], "downloads"
+        )
+        filename = self.env.get("filename") or os.path.basename(
+            unquote(urlparse(url).path)
+        )
+        pathname = os.path.join(download_dir, filename)
+        self.env["pathname"] = pathname
+        try:
+            os.makedirs(download_dir, exist_ok=True)
+        except OSError as err:
+            raise ProcessorError(f"Can't create {download_dir}: {err}")
+
+        if self.is_already_downloaded(
+            download_dir, pathname, expected_sha512, expected_size
+        ):
+            self.output(f"Item at {pathname} already verified, skipping download")
+            self.env["download_changed"] = False
+            return
+
+        tmp_path = f"{pathname}.{os.getpid()}.download"
+        try:
+            digest = self.stream_download(url, tmp_path, expected_size)
+            if digest != expected_sha512:
+                raise ProcessorError(
+                    f"SHA-512 mismatch for {url}: got {digest}, "
+                    f"expected {expected_sha512}"
+                )
+            os.replace(tmp_path, pathname)
+        except (OSError, ProcessorError) as err:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise ProcessorError(err)
+
+        self.record_verified_download(download_dir, pathname, digest)
+        self.env["download_changed"] = True
+        self.output(f"Downloaded and verified {pathname}")
+
+
+if __name__ == "__main__":
+    PROCESSOR = MozillaVerifiedDownloader()
+    PROCESSOR.execute_shell()
@@ -15,14 +15,285 @@
 # limitations under the License.
 """autopkg processor to run makecatalogs on a Munki repo"""
 
+import fcntl
+import hashlib
+import json
+import mmap
 import os.path
 import plistlib
+import re
+import struct
 import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
 
 from autopkglib import Processor, ProcessorError, get_pref
 
 __all__ = ["MakeCatalogsProcessor"]
 
+# installer_types without an installer item in the repo
+NO_INSTALLER_ITEM_TYPES = ["nopkg", "apple_update_metadata"]
+ICON_HASHES_NAME = "_icon_hashes.plist"
+# Written by MunkiImportJournaler, relative to the makecatalogs cache dir
+JOURNAL_NAME = "import_journal.jsonl"
+# Below this many pkginfos to parse, starting worker processes costs more
+# than it saves
+MIN_PARALLEL_PARSE = 256
+# Where the Munki tools install munkilib
+MUNKI_LIB_DIR = "/usr/local/munki"
+DEFAULT_REPO_WORKERS = 4
+# How many of the slowest pkginfos makecatalogs_timings lists
+SLOWEST_PKGINFOS = 10
+
+
+def parse_pkginfo(data, path, sha256=None):
+    """Parses the contents of a pkginfo file, whose sha256 is computed
+    unless given. Returns an index record."""
+    record = {"sha256": sha256 or hashlib.sha256(data).hexdigest()}
+    try:
+        record["pkginfo"] = plistlib.loads(data)
+    except Exception as err:  # pylint: disable=broad-except
+        record["error"] = "Unexpected error for %s: %s" % (path, err)
+    return record
+
+
+def read_pkginfo(path, repo_ref, known_sha256=None):
+    """Reads and parses a pkginfo file, naming it repo_ref in errors like
+    makecatalogs does. Returns an index record, or None without parsing
+    the file if its sha256 is known_sha256. Module level so worker
+    processes can run it."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError as err:
+        return {"error": "Unexpected IO error for %s: %s" % (repo_ref, err)}
+    sha256 = hashlib.sha256(data).hexdigest()
+    if sha256 == known_sha256:
+        return None
+    return parse_pkginfo(data, repo_ref, sha256)
+
+
+def add_to_path(module_dir):
+    """Worker process initializer: lets it import this module by name to
+    unpickle the calls it gets."""
+    if module_dir not in sys.path:
+        sys.path.append(module_dir)
+
+
+def read_pkginfo_timed(path, repo_ref, known_sha256=None):
+    """Returns what read_pkginfo returns for a pkginfo file and the seconds
+    it took."""
+    start = time.perf_counter()
+    record = read_pkginfo(path, repo_ref, known_sha256)
+    return record, time.perf_counter() - start
+
+
+# Catalog index file layout, all little-endian:
+#   header: magic, format version, bytes of catalog membership mask per
+#           record, record count, catalog count, size and sha256 of the
+#           'all' catalog the offsets point into, offset of the string table
+#   catalog table: catalog count x (string offset, length), in mask bit order
+#   records: record count x (name offset, name length, version offset,
+#            version length, item offset in 'all', item length, raw
+#            installer_item_hash, membership mask), sorted by name, version
+#   string table: UTF-8
+CATALOG_INDEX_MAGIC = b"MCIX"
+CATALOG_INDEX_VERSION = 1
+CATALOG_INDEX_HEADER = struct.Struct("<4sHHIIQ32sQ")
+CATALOG_INDEX_STRING = struct.Struct("<II")
+CATALOG_INDEX_RECORD = struct.Struct("<IIIIQI32s")
+# plistlib writes each item of a top level array between these lines
+PLIST_ITEM_START = b"\n\t<dict>\n"
+PLIST_ITEM_END = b"\n\t</dict>\n"
+
+
+def plist_item_spans(data):
+    """Returns (offset, length) of each top level dict in an array plist
+    written by plistlib, without parsing it."""
+    spans = []
+    pos = data.find(PLIST_ITEM_START)
+    while pos != -1:
+        start = pos + 1
+        end = data.index(PLIST_ITEM_END, start) + len(PLIST_ITEM_END) - 1
+        spans.append((start, end - start))
+        pos = data.find(PLIST_ITEM_START, end - 1)
+    return spans
+
+
+def build_catalog_index(catalogs, all_data):
+    """Returns the catalog index of the catalogs, where all_data is the
+    'all' catalog as written to the repo."""
+    names = sorted(name for name in catalogs if name != "all")
+    mask_bytes = (len(names) + 7) // 8
+    masks = {id(item): 0 for item in catalogs["all"]}
+    for bit, name in enumerate(names):
+        for item in catalogs[name]:
+            masks[id(item)] |= 1 << bit
+    spans = plist_item_spans(all_data)
+    if len(spans) != len(catalogs["all"]):
+        raise ValueError("Unexpected layout of the 'all' catalog")
+
+    strings = bytearray()
+    string_refs = {}
+
+    def add_string(value):
+        encoded = str(value).encode("utf-8")
+        if encoded not in string_refs:
+            string_refs[encoded] = (len(strings), len(encoded))
+            strings.extend(encoded)
+        return string_refs[encoded]
+
+    catalog_table = b"".join(
+        CATALOG_INDEX_STRING.pack(*add_string(name)) for name in names
+    )
+    rows = []
+    for item, span in zip(catalogs["all"], spans):
+        name = add_string(item["name"])
+        version = add_string(item.get("version", ""))
+        try:
+            item_hash = bytes.fromhex(item.get("installer_item_hash", ""))
+        except (TypeError, ValueError):
+            item_hash = b""
+        rows.append(
+            (
+                str(item["name"]).encode("utf-8"),
+                str(item.get("version", "")).encode("utf-8"),
+                CATALOG_INDEX_RECORD.pack(*name, *version, *span, item_hash)
+                + masks[id(item)].to_bytes(mask_bytes, "little"),
+            )
+        )
+    rows.sort(key=lambda row: row[:2])
+    records = b"".join(row[2] for row in rows)
+    strings_offset = CATALOG_INDEX_HEADER.size + len(catalog_table) + len(records)
+    header = CATALOG_INDEX_HEADER.pack(
+        CATALOG_INDEX_MAGIC,
+        CATALOG_INDEX_VERSION,
+        mask_bytes,
+        len(rows),
+        len(names),
+        len(all_data),
+        hashlib.sha256(all_data).digest(),
+        strings_offset,
+    )
+    return header + catalog_table + records + bytes(strings)
+
+
+class CatalogIndex:
+    """Reads a catalog index written by MakeCatalogsProcessor, memory
+    mapped, to look up items by name and version without parsing the
+    catalogs.
+
+    index = CatalogIndex("/path/to/index", "/path/to/repo/catalogs/all")
+    for entry in index.lookup("Firefox"):
+        print(entry["version"], entry["catalogs"], index.get_pkginfo(entry))
+    """
+
+    def __init__(self, index_path, all_catalog_path=None):
+        with open(index_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic,
+            version,
+            self._mask_bytes,
+            self._count,
+            catalog_count,
+            self.all_size,
+            self.all_sha256,
+            self._strings_offset,
+        ) = CATALOG_INDEX_HEADER.unpack_from(self._map)
+        if magic != CATALOG_INDEX_MAGIC or version != CATALOG_INDEX_VERSION:
+            raise ValueError("%s is not a catalog index" % index_path)
+        self._records_offset = (
+            CATALOG_INDEX_HEADER.size + catalog_count * CATALOG_INDEX_STRING.size
+        )
+        self._record_size = CATALOG_INDEX_RECORD.size + self._mask_bytes
+        self.catalog_names = [
+            self._string(
+                *CATALOG_INDEX_STRING.unpack_from(
+                    self._map,
+                    CATALOG_INDEX_HEADER.size + i * CATALOG_INDEX_STRING.size,
+                )
+            )
+            for i in range(catalog_count)
+        ]
+        self.all_catalog_path = all_catalog_path
+
+    def __len__(self):
+        return self._count
+
+    def _raw_string(self, offset, length):
+        start = self._strings_offset + offset
+        return self._map[start : start + length]
+
+    def _string(self, offset, length):
+        return self._raw_string(offset, length).decode("utf-8")
+
+    def _key(self, i):
+        fields = CATALOG_INDEX_RECORD.unpack_from(
+            self._map, self._records_offset + i * self._record_size
+        )
+        return self._raw_string(*fields[0:2]), self._raw_string(*fields[2:4])
+
+    def _entry(self, i):
+        pos = self._records_offset + i * self._record_size
+        fields = CATALOG_INDEX_RECORD.unpack_from(self._map, pos)
+        mask = int.from_bytes(
+            self._map[pos + CATALOG_INDEX_RECORD.size : pos + self._record_size],
+            "little",
+        )
+        return {
+            "name": self._string(*fields[0:2]),
+            "version": self._string(*fields[2:4]),
+            "offset": fields[4],
+            "length": fields[5],
+            "installer_item_hash": fields[6].hex() if any(fields[6]) else "",
+            "catalogs": [
+                name for bit, name in enumerate(self.catalog_names) if mask & (1 << bit)
+            ],
+        }
+
+    def _first(self, key):
+        """Returns the index of the first record not sorting before key."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle)[: len(key)] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def lookup(self, name, version=None):
+        """Returns the entries for name, or for name and version."""
+        key = (name.encode("utf-8"),)
+        if version is not None:
+            key += (version.encode("utf-8"),)
+        entries = []
+        i = self._first(key)
+        while i < self._count and self._key(i)[: len(key)] == key:
+            entries.append(self._entry(i))
+            i += 1
+        return entries
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._entry(i)
+
+    def get_pkginfo(self, entry):
+        """Returns the catalog item of an entry, parsing only its slice of
+        the 'all' catalog."""
+        with open(self.all_catalog_path, "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read(entry["length"])
+        return plistlib.loads(b'<plist version="1.0">' + data + b"</plist>")
+
+    def close(self):
+        """Unmaps the index."""
+        self._map.close()
+
 
 class MakeCatalogsProcessor(Processor):
     """Runs makecatalogs on a munki repo"""
@@ -36,7 +307,69 @@ class MakeCatalogsProcessor(Processor):
         "force_rebuild": {
             "required": False,
             "description": (
-                "If not false or empty or undefined, force a makecatalogs run."
+                "If not false or empty or undefined, force a makecatalogs run. "
+                "In incremental mode, every pkginfo is read and parsed again "
+                "instead of going by the index, and the catalogs are compared "
+                "with the copies in the repo."
+            ),
+        },
+        "incremental": {
+            "required": False,
+            "description": (
+                "If not false or empty or undefined, build the catalogs here "
+                "instead of running makecatalogs. An index of every "
+                "pkginfo's mtime, size, hash and contents is kept in the "
+                "AutoPkg cache dir, so only changed pkginfos are read and "
+                "parsed again. Repos that aren't a local path are accessed "
+                "through munkilib's repo plugins, and only the catalogs "
+                "that changed since they were last published, or are missing "
+                "from the repo, are uploaded."
+            ),
+        },
+        "import_journal": {
+            "required": False,
+            "description": (
+                "Path of the journal MunkiImportJournaler writes. Defaults "
+                "to CACHE_DIR/makecatalogs/import_journal.jsonl. Its entries "
+                "for MUNKI_REPO since the last run count as repo changes. In "
+                "incremental mode, a repo accessed through a plugin only has "
+                "the pkginfos they name and new ones fetched, unless "
+                "force_rebuild is set; local repos are always checked in "
+                "full."
+            ),
+        },
+        "repo_workers": {
+            "required": False,
+            "description": (
+                "Number of concurrent requests to make to a repo accessed "
+                "through a plugin in incremental mode. Defaults to %d."
+                % DEFAULT_REPO_WORKERS
+            ),
+        },
+        "catalog_index_path": {
+            "required": False,
+            "description": (
+                "In incremental mode, also write a binary index of the "
+                "catalogs to this path, mapping name and version to the "
+                "item's offset in the 'all' catalog, its installer_item_hash "
+                "and the catalogs it is in. It can be read with the "
+                "CatalogIndex class in this module."
+            ),
+        },
+        "timing_report_path": {
+            "required": False,
+            "description": (
+                "If set, also write makecatalogs_timings to this path as JSON."
+            ),
+        },
+        "catalog_workers": {
+            "required": False,
+            "description": (
+                "Number of processes to parse pkginfos with in incremental "
+                "mode when many of them changed. Defaults to the number of "
+                "CPUs. At most one process is started per %d pkginfos to "
+                "parse, so small changes are parsed serially; 1 always "
+                "parses serially." % MIN_PARALLEL_PARSE
             ),
         },
     }
@@ -47,71 +380,888 @@ class MakeCatalogsProcessor(Processor):
         "makecatalogs_stderr": {
             "description": "Error output (if any) from makecatalogs."
         },
+        "catalog_uploads": {
+            "description": (
+                "List of the catalogs uploaded to a repo accessed through a "
+                "plugin in incremental mode, each a dict with the 'catalog' "
+                "path in the repo, 'bytes' sent and upload 'seconds'."
+            )
+        },
+        "makecatalogs_timings": {
+            "description": (
+                "Dict with the seconds spent in each 'phases' of the run "
+                "(results_scan, lock_wait, discovery, parse, assemble, "
+                "catalog_write, upload, makecatalogs, total), 'counts' of "
+                "pkginfos checked, read and parsed, catalogs and errors, and "
+                "the 'slowest_pkginfos' to read and parse."
+            )
+        },
+        "journal_changes": {
+            "description": (
+                "List of the journal entries read in this run, each a dict "
+                "with the 'pkginfo' path relative to pkgsinfo, its "
+                "'catalogs', 'name' and 'version'."
+            )
+        },
     }
 
     description = __doc__
 
-    def main(self):
-        """Rebuild Munki catalogs in repo_path"""
+    def get_local_repo_path(self):
+        """Returns the local path of MUNKI_REPO, or None if it isn't a file
+        based repo."""
+        if self.env.get("MUNKI_REPO_PLUGIN", "FileRepo") != "FileRepo":
+            return None
+        repo = self.env["MUNKI_REPO"]
+        if repo.startswith("/"):
+            return repo
+        url = urlparse(repo)
+        if url.scheme == "file":
+            return unquote(url.path)
+        return None
 
+    def get_cache_dir(self):
+        """Returns the directory holding the indexes and the journal."""
+        # pylint: disable=no-self-use
         cache_dir = get_pref("CACHE_DIR") or os.path.expanduser(
             "~/Library/AutoPkg/Cache"
         )
-        current_run_results_plist = os.path.join(cache_dir, "autopkg_results.plist")
+        return os.path.join(cache_dir, "makecatalogs")
+
+    def get_index_path(self, repo_path):
+        """Returns the path of the pkginfo index of a repo."""
+        name = re.sub(r"[^0-9A-Za-z._-]", "_", os.path.abspath(repo_path))
+        return os.path.join(self.get_cache_dir(), name + ".plist")
+
+    def get_repo_file_path(self, extension):
+        """Returns the path of a file in the cache dir that belongs to
+        MUNKI_REPO."""
+        name = re.sub(r"[^0-9A-Za-z._-]", "_", self.env["MUNKI_REPO"])
+        return os.path.join(self.get_cache_dir(), name + extension)
+
+    def get_checkpoint_path(self):
+        """Returns the path of the file holding how far the journal has been
+        read for MUNKI_REPO."""
+        return self.get_repo_file_path(".checkpoint")
+
+    def read_state(self):
+        """Returns the rebuild state of MUNKI_REPO: the 'requested' and
+        'built' generations, the generations that last asked for a full scan
+        and for a forced rebuild, and the result of the last rebuild."""
         try:
-            with open(current_run_results_plist, "rb") as f:
-                run_results = plistlib.load(f)
-        except (IOError, OSError):
-            run_results = []
+            with open(self.get_repo_file_path(".state.plist"), "rb") as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def update_state(self, update):
+        """Calls update with the rebuild state dict under a lock, saves the
+        changes it made and returns the new state."""
+        state_path = self.get_repo_file_path(".state.plist")
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+        with open(state_path + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self.read_state()
+            update(state)
+            tmp_path = "%s.%d.tmp" % (state_path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(state, f)
+            os.replace(tmp_path, state_path)
+        return state
+
+    def read_journal(self):
+        """Returns the entries MunkiImportJournaler added for MUNKI_REPO
+        since the last checkpoint, and the journal offset after them."""
+        journal = self.env.get("import_journal") or os.path.join(
+            self.get_cache_dir(), JOURNAL_NAME
+        )
+        try:
+            with open(self.get_checkpoint_path(), "r") as f:
+                offset = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            offset = 0
+        entries = []
+        try:
+            with open(journal, "rb") as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                if os.fstat(f.fileno()).st_size < offset:
+                    # The journal was replaced; start over
+                    offset = 0
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Not completely written yet
+                        break
+                    offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        self.output("WARNING: Skipping bad journal entry %r" % line)
+                        continue
+                    if entry.get("repo") == self.env["MUNKI_REPO"]:
+                        entries.append(entry)
+        except OSError:
+            pass
+        return entries, offset
+
+    def save_checkpoint(self, offset):
+        """Records that the journal has been read up to offset."""
+        checkpoint_path = self.get_checkpoint_path()
+        try:
+            os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (checkpoint_path, os.getpid())
+            with open(tmp_path, "w") as f:
+                f.write("%d\n" % offset)
+            os.replace(tmp_path, checkpoint_path)
+        except OSError as err:
+            self.output("WARNING: Could not write %s: %s" % (checkpoint_path, err))
+
+    def load_index(self, index_path):
+        """Returns the pkginfo index: a dict of pkginfo path relative to
+        pkgsinfo -> dict of 'mtime', 'size', 'sha256' and either the parsed
+        'pkginfo' or the 'error' reading it gave."""
+        # pylint: disable=no-self-use
+        try:
+            with open(index_path, "rb") as f:
+                return plistlib.load(f)
+        except (OSError, plistlib.InvalidFileException, ValueError):
+            return {}
+
+    def save_index(self, index_path, index):
+        """Writes the pkginfo index."""
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                plistlib.dump(index, f, fmt=plistlib.FMT_BINARY)
+            os.replace(tmp_path, index_path)
+        except OSError as err:
+            self.output("WARNING: Could not write %s: %s" % (index_path, err))
+
+    def list_items(self, repo_path, kind):
+        """Returns the sorted paths relative to repo_path/kind of every file
+        in it, skipping names starting with a period like makecatalogs."""
+        # pylint: disable=no-self-use
+        search_dir = os.path.join(repo_path, kind)
+        items = []
+        for dirpath, dirnames, filenames in os.walk(search_dir, followlinks=True):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                if not name.startswith("."):
+                    items.append(
+                        os.path.relpath(os.path.join(dirpath, name), search_dir)
+                    )
+        return sorted(items)
+
+    def get_worker_count(self):
+        """Returns the number of processes to parse pkginfos with."""
+        try:
+            workers = int(self.env.get("catalog_workers") or os.cpu_count() or 1)
+        except ValueError:
+            raise ProcessorError(
+                "Invalid catalog_workers: %s" % self.env["catalog_workers"]
+            )
+        return max(workers, 1)
 
-        repo_changed = False
+    def read_pkginfos(self, pkgsinfo_dir, pkginfo_refs, known_hashes):
+        """Reads the pkginfo files at pkginfo_refs in pkgsinfo_dir and parses
+        the ones whose sha256 isn't the one at the same position in
+        known_hashes, with a pool of worker processes when there are enough
+        of them. Returns the index records, or None for files that weren't
+        parsed, in the order of pkginfo_refs, and records how long each
+        took."""
+        paths = [os.path.join(pkgsinfo_dir, ref) for ref in pkginfo_refs]
+        repo_refs = ["pkgsinfo/" + ref for ref in pkginfo_refs]
+        workers = min(self.get_worker_count(), len(paths) // MIN_PARALLEL_PARSE)
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=add_to_path,
+                    initargs=(os.path.dirname(os.path.abspath(__file__)),),
+                ) as executor:
+                    results = list(
+                        executor.map(
+                            read_pkginfo_timed,
+                            paths,
+                            repo_refs,
+                            known_hashes,
+                            chunksize=max(len(paths) // (workers * 4), 1),
+                        )
+                    )
+            except Exception as err:  # pylint: disable=broad-except
+                results = None
+                self.output(
+                    "Parallel parsing failed (%s); parsing serially" % err,
+                    verbose_level=2,
+                )
+        else:
+            results = None
+        if results is None:
+            results = list(map(read_pkginfo_timed, paths, repo_refs, known_hashes))
+        for repo_ref, (_, seconds) in zip(repo_refs, results):
+            self.pkginfo_times.append((seconds, repo_ref))
+        return [record for record, _ in results]
+
+    def update_index(self, repo_path, index):
+        """Brings the pkginfo index up to date with the repo, re-reading
+        only the pkginfo files whose mtime or size changed, and parsing only
+        those whose sha256 changed too. Every pkginfo is checked, so changes
+        made outside of AutoPkg are picked up too. Returns the new index and
+        the number of files parsed."""
+        pkgsinfo_dir = os.path.join(repo_path, "pkgsinfo")
+        with self.timed("discovery"):
+            new_index = {}
+            candidates = self.list_items(repo_path, "pkgsinfo")
+            stale = {}
+            for pkginfo_ref in candidates:
+                path = os.path.join(pkgsinfo_dir, pkginfo_ref)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Removed since it was listed
+                    continue
+                except OSError as err:
+                    new_index[pkginfo_ref] = {
+                        "error": "Unexpected IO error for pkgsinfo/%s: %s"
+                        % (pkginfo_ref, err)
+                    }
+                    continue
+                record = index.get(pkginfo_ref)
+                if (
+                    record
+                    and record.get("mtime") == stat.st_mtime
+                    and record.get("size") == stat.st_size
+                ):
+                    new_index[pkginfo_ref] = record
+                    continue
+                stale[pkginfo_ref] = stat
+
+        refs = sorted(stale)
+        known_hashes = [index.get(ref, {}).get("sha256") for ref in refs]
+        with self.timed("parse"):
+            records = self.read_pkginfos(pkgsinfo_dir, refs, known_hashes)
+        parsed = 0
+        for pkginfo_ref, new_record in zip(refs, records):
+            if new_record is None:
+                # Touched but not changed
+                new_record = dict(index[pkginfo_ref])
+            else:
+                parsed += 1
+            new_record["mtime"] = stale[pkginfo_ref].st_mtime
+            new_record["size"] = stale[pkginfo_ref].st_size
+            new_index[pkginfo_ref] = new_record
+        self.counts.update(
+            pkginfos_checked=len(candidates),
+            pkginfos_read=len(refs),
+            pkginfos_parsed=parsed,
+        )
+        return new_index, parsed
+
+    def hash_icons(self, repo_path):
+        """Returns a dict of icon name -> sha256 of every icon in the repo."""
+        icons = {}
+        for icon_ref in self.list_items(repo_path, "icons"):
+            if icon_ref == ICON_HASHES_NAME:
+                continue
+            try:
+                with open(os.path.join(repo_path, "icons", icon_ref), "rb") as f:
+                    icons[icon_ref] = hashlib.sha256(f.read()).hexdigest()
+            except OSError as err:
+                self.output("WARNING: IO error for %s: %s" % (icon_ref, err))
+        return icons
+
+    def verify_pkginfo(self, repo_ref, pkginfo, pkgs, errors):
+        """Returns True if the installer items a pkginfo refers to are in the
+        repo, the same checks makecatalogs does. pkgs maps the lowercase
+        path of each repo pkg to its path. Adds any problems to errors,
+        naming the pkginfo repo_ref."""
+        # pylint: disable=no-self-use
+        if pkginfo.get("installer_type") in NO_INSTALLER_ITEM_TYPES:
+            return True
+        if pkginfo.get("PackageCompleteURL") or pkginfo.get("PackageURL"):
+            # installer item may be on a different server
+            return True
+        if "installer_item_location" not in pkginfo:
+            errors.append("WARNING: %s is missing installer_item_location" % repo_ref)
+            return False
+
+        for key, kind in (
+            ("installer_item_location", "installer item"),
+            ("uninstaller_item_location", "uninstaller item"),
+        ):
+            if key not in pkginfo:
+                if key == "uninstaller_item_location" and pkginfo.get(
+                    "uninstall_method"
+                ) in ["AdobeCCPUninstaller"]:
+                    errors.append(
+                        "WARNING: %s is missing uninstaller_item_location" % repo_ref
+                    )
+                    return False
+                continue
+            try:
+                item_path = os.path.join("pkgs", pkginfo[key])
+            except TypeError:
+                errors.append("WARNING: invalid %s in info file %s" % (key, repo_ref))
+                return False
+            repo_item = pkgs.get(item_path.lower())
+            if repo_item is None:
+                errors.append(
+                    "WARNING: %s refers to missing %s: %s"
+                    % (repo_ref, kind, pkginfo[key])
+                )
+                return False
+            if repo_item != item_path:
+                errors.append(
+                    "WARNING: %s refers to %s: %s. The pathname of the item in "
+                    "the repo has different case: %s. This may cause issues "
+                    "depending on the case-sensitivity of the underlying "
+                    "filesystem." % (repo_ref, kind, pkginfo[key], repo_item)
+                )
+        return True
+
+    def assemble_catalogs(self, index, pkgs, icons, errors):
+        """Assembles the catalogs from the parsed pkginfos in the index, the
+        same way makecatalogs does. Returns a dict of catalog name -> list
+        of items."""
+        catalogs = {"all": []}
+        for pkginfo_ref in sorted(index):
+            record = index[pkginfo_ref]
+            # Messages name pkginfos by their path in the repo, like
+            # makecatalogs
+            repo_ref = "pkgsinfo/" + pkginfo_ref
+            if "error" in record:
+                errors.append(record["error"])
+                continue
+            pkginfo = dict(record["pkginfo"])
+            if "name" not in pkginfo:
+                errors.append("WARNING: %s is missing name" % repo_ref)
+                continue
+            # don't copy admin notes to catalogs.
+            if pkginfo.get("notes"):
+                del pkginfo["notes"]
+            # strip out any keys that start with "_"
+            for key in list(pkginfo.keys()):
+                if key.startswith("_"):
+                    del pkginfo[key]
+            icon_name = pkginfo.get("icon_name") or pkginfo["name"]
+            if not os.path.splitext(icon_name)[1]:
+                icon_name += ".png"
+            if icon_name in icons:
+                pkginfo["icon_hash"] = icons[icon_name]
+            if not self.verify_pkginfo(repo_ref, pkginfo, pkgs, errors):
+                continue
+            catalogs["all"].append(pkginfo)
+            for catalogname in pkginfo.get("catalogs", []):
+                if not catalogname:
+                    errors.append(
+                        "WARNING: Info file %s has an empty catalog name!" % repo_ref
+                    )
+                    continue
+                catalogs.setdefault(catalogname, []).append(pkginfo)
+
+        self.counts["catalogs"] = len(catalogs)
+        lower_names = [name.lower() for name in catalogs]
+        duplicate_catalogs = [
+            name for name in catalogs if lower_names.count(name.lower()) > 1
+        ]
+        if duplicate_catalogs:
+            errors.append(
+                "WARNING: There are catalogs with names that differ only by "
+                "case. This may cause issues depending on the case-sensitivity "
+                "of the underlying filesystem: %s" % duplicate_catalogs
+            )
+        return catalogs
+
+    def write_file(self, path, data):
+        """Writes data to path unless it already holds exactly that. Returns
+        True if the file was written."""
+        # pylint: disable=no-self-use
+        try:
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+        except OSError:
+            pass
+        tmp_path = os.path.join(
+            os.path.dirname(path), ".%s.%d.tmp" % (os.path.basename(path), os.getpid())
+        )
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def serialize_catalogs(self, catalogs):
+        """Returns a dict of catalog name -> catalog plist data, and writes
+        the catalog index from the same data if catalog_index_path is set."""
+        catalog_data = {name: plistlib.dumps(items) for name, items in catalogs.items()}
+        index_path = self.env.get("catalog_index_path")
+        if index_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+                self.write_file(
+                    index_path, build_catalog_index(catalogs, catalog_data["all"])
+                )
+            except (OSError, ValueError) as err:
+                raise ProcessorError("Could not write %s: %s" % (index_path, err))
+        return catalog_data
+
+    def write_catalogs(self, repo_path, catalogs, icons):
+        """Writes the catalog data and icon hashes to the repo and removes
+        catalogs that no longer have any items. Returns the names of the
+        catalogs that changed."""
+        catalogs_dir = os.path.join(repo_path, "catalogs")
+        os.makedirs(catalogs_dir, exist_ok=True)
+        for catalog_name in self.list_items(repo_path, "catalogs"):
+            if catalog_name not in catalogs:
+                os.unlink(os.path.join(catalogs_dir, catalog_name))
+                self.output("Removed catalogs/%s" % catalog_name)
+        changed = []
+        for name, data in catalogs.items():
+            if self.write_file(os.path.join(catalogs_dir, name), data):
+                changed.append(name)
+                self.output("Created catalogs/%s" % name)
+        if icons:
+            self.write_file(
+                os.path.join(repo_path, "icons", ICON_HASHES_NAME),
+                plistlib.dumps(icons),
+            )
+        return changed
+
+    def build_catalogs(self, repo_path, force=False):
+        """Rebuilds the catalogs of a file based repo from the pkginfo index.
+        With force, the index is ignored and every pkginfo is parsed again.
+        Returns a list of errors, like makecatalogs prints."""
+        index_path = self.get_index_path(repo_path)
+        index = {} if force else self.load_index(index_path)
+        index, parsed = self.update_index(repo_path, index)
+        self.output(
+            "Parsed %d of %d pkginfo files" % (parsed, len(index)), verbose_level=2
+        )
+        with self.timed("discovery"):
+            pkgs = {
+                os.path.join("pkgs", item).lower(): os.path.join("pkgs", item)
+                for item in self.list_items(repo_path, "pkgs")
+            }
+            icons = self.hash_icons(repo_path)
+        errors = []
+        with self.timed("assemble"):
+            catalogs = self.assemble_catalogs(index, pkgs, icons, errors)
+        with self.timed("catalog_write"):
+            try:
+                self.write_catalogs(repo_path, self.serialize_catalogs(catalogs), icons)
+            except OSError as err:
+                raise ProcessorError("Could not write catalogs: %s" % err)
+            self.save_index(index_path, index)
+        return errors
+
+    def connect_repo(self):
+        """Returns a munkilib repo plugin connection to MUNKI_REPO."""
+        add_path = MUNKI_LIB_DIR not in sys.path
+        if add_path:
+            sys.path.append(MUNKI_LIB_DIR)
+        try:
+            # pylint: disable=import-error,import-outside-toplevel
+            from munkilib import munkirepo
+        except ImportError as err:
+            raise ProcessorError(
+                "Incremental builds of %s need munkilib from the Munki tools: %s"
+                % (self.env["MUNKI_REPO"], err)
+            )
+        finally:
+            # munkirepo loads its plugins when it is imported, so the path
+            # isn't needed afterwards
+            if add_path:
+                sys.path.remove(MUNKI_LIB_DIR)
+        try:
+            return munkirepo.connect(
+                self.env["MUNKI_REPO"], self.env.get("MUNKI_REPO_PLUGIN") or "FileRepo"
+            )
+        except munkirepo.RepoError as err:
+            raise ProcessorError(
+                "Could not connect to %s: %s" % (self.env["MUNKI_REPO"], err)
+            )
+
+    def get_repo_workers(self):
+        """Returns the number of concurrent requests to make to a repo."""
+        try:
+            workers = int(self.env.get("repo_workers") or DEFAULT_REPO_WORKERS)
+        except ValueError:
+            raise ProcessorError("Invalid repo_workers: %s" % self.env["repo_workers"])
+        return max(workers, 1)
+
+    def fetch_pkginfos(self, repo, index, pkginfo_refs=None):
+        """Brings the pkginfo index of a repo accessed through a plugin up to
+        date. There are no mtimes to go by, so every pkginfo is fetched
+        again, unless pkginfo_refs is given: then only those and the ones
+        missing from the index are. Only the ones whose content changed
+        are parsed. Returns the new index and the number of files parsed."""
+        with self.timed("discovery"):
+            listed = repo.itemlist("pkgsinfo")
+        if pkginfo_refs is None:
+            refs = listed
+        else:
+            wanted = set(pkginfo_refs)
+            refs = [ref for ref in listed if ref in wanted or ref not in index]
+
+        def fetch(pkginfo_ref):
+            start = time.perf_counter()
+            path = "pkgsinfo/" + pkginfo_ref
+            try:
+                data = repo.get(path)
+            except Exception as err:  # pylint: disable=broad-except
+                record = {"error": "Unexpected error for %s: %s" % (path, err)}
+                return record, False, time.perf_counter() - start
+            record = index.get(pkginfo_ref)
+            sha256 = hashlib.sha256(data).hexdigest()
+            if record and record.get("sha256") == sha256:
+                return record, False, time.perf_counter() - start
+            return parse_pkginfo(data, path, sha256), True, time.perf_counter() - start
+
+        with self.timed("parse"):
+            with ThreadPoolExecutor(max_workers=self.get_repo_workers()) as executor:
+                results = dict(zip(refs, executor.map(fetch, refs)))
+        new_index = {}
+        parsed = 0
+        for pkginfo_ref in sorted(listed):
+            if pkginfo_ref in results:
+                new_index[pkginfo_ref], changed, seconds = results[pkginfo_ref]
+                parsed += changed
+                self.pkginfo_times.append((seconds, "pkgsinfo/" + pkginfo_ref))
+            elif pkginfo_ref in index:
+                new_index[pkginfo_ref] = index[pkginfo_ref]
+        self.counts.update(
+            pkginfos_checked=len(refs), pkginfos_read=len(refs), pkginfos_parsed=parsed
+        )
+        return new_index, parsed
+
+    def hash_repo_icons(self, repo, full_scan):
+        """Returns a dict of icon name -> sha256 of every icon in a repo
+        accessed through a plugin. Unless full_scan is set, the hashes
+        already in the repo are trusted and only new icons are fetched."""
+        icons = {}
+        if not full_scan:
+            try:
+                icons = plistlib.loads(repo.get("icons/" + ICON_HASHES_NAME))
+            except Exception:  # pylint: disable=broad-except
+                icons = {}
+        icon_list = [ref for ref in repo.itemlist("icons") if ref != ICON_HASHES_NAME]
+        icons = {ref: icons[ref] for ref in icon_list if ref in icons}
+
+        def fetch(icon_ref):
+            try:
+                return hashlib.sha256(repo.get("icons/" + icon_ref)).hexdigest()
+            except Exception as err:  # pylint: disable=broad-except
+                self.output("WARNING: Error for %s: %s" % (icon_ref, err))
+                return None
+
+        missing = [ref for ref in icon_list if ref not in icons]
+        with ThreadPoolExecutor(max_workers=self.get_repo_workers()) as executor:
+            for icon_ref, digest in zip(missing, executor.map(fetch, missing)):
+                if digest:
+                    icons[icon_ref] = digest
+        return icons
+
+    def publish_catalogs(self, repo, catalogs, icons, force=False):
+        """Uploads the catalog data and icon hashes whose content differs from
+        what was last published, several at a time, and removes catalogs
+        that no longer have any items. The sha256 of everything published
+        is kept in the AutoPkg cache dir; the repo's copy is only fetched to
+        compare with when there is none, or for all of them with force.
+        Returns a list of errors."""
+        published_path = self.get_repo_file_path(".published.plist")
+        published = {} if force else self.load_index(published_path)
+        uploads = {"catalogs/" + name: data for name, data in catalogs.items()}
+        if icons:
+            uploads["icons/" + ICON_HASHES_NAME] = plistlib.dumps(icons)
+        digests = {
+            ref: hashlib.sha256(data).hexdigest() for ref, data in uploads.items()
+        }
+        repo_catalogs = repo.itemlist("catalogs")
+
+        def is_current(ref):
+            if ref.startswith("catalogs/") and ref[9:] not in repo_catalogs:
+                # Removed from the repo since it was published
+                return False
+            if ref in published:
+                return published[ref] == digests[ref]
+            try:
+                return repo.get(ref) == uploads[ref]
+            except Exception:  # pylint: disable=broad-except
+                return False
+
+        refs = sorted(uploads)
+        with ThreadPoolExecutor(max_workers=self.get_repo_workers()) as executor:
+            current = dict(zip(refs, executor.map(is_current, refs)))
+        changed = [ref for ref in refs if not current[ref]]
+        published = {ref: digests[ref] for ref in refs if current[ref]}
+
+        def upload(ref):
+            start = time.time()
+            try:
+                repo.put(ref, uploads[ref])
+            except Exception as err:  # pylint: disable=broad-except
+                return "Could not upload %s: %s" % (ref, err)
+            return time.time() - start
+
+        errors = []
+        reports = []
+        with ThreadPoolExecutor(max_workers=self.get_repo_workers()) as executor:
+            for ref, result in zip(changed, executor.map(upload, changed)):
+                if isinstance(result, str):
+                    errors.append(result)
+                    continue
+                published[ref] = digests[ref]
+                reports.append(
+                    {"catalog": ref, "bytes": len(uploads[ref]), "seconds": result}
+                )
+                self.output(
+                    "Uploaded %s (%d bytes, %.2fs)" % (ref, len(uploads[ref]), result)
+                )
+        for catalog_name in repo_catalogs:
+            if catalog_name not in catalogs:
+                try:
+                    repo.delete("catalogs/" + catalog_name)
+                except Exception as err:  # pylint: disable=broad-except
+                    errors.append("Could not remove %s: %s" % (catalog_name, err))
+                    continue
+                self.output("Removed catalogs/%s" % catalog_name)
+        self.save_index(published_path, published)
+        self.env["catalog_uploads"] = reports
+        return errors
+
+    def build_repo_catalogs(self, pkginfo_refs=None, force=False):
+        """Rebuilds the catalogs of a repo accessed through a plugin from the
+        pkginfo index, fetching only pkginfo_refs and new pkginfos if given.
+        With force, the index is ignored and every pkginfo is parsed again.
+        Returns a list of errors, like makecatalogs prints."""
+        repo = self.connect_repo()
+        index_path = self.get_repo_file_path(".plist")
+        index = {} if force else self.load_index(index_path)
+        if not index:
+            pkginfo_refs = None
+        try:
+            index, parsed = self.fetch_pkginfos(repo, index, pkginfo_refs)
+            self.output(
+                "Parsed %d of %d pkginfo files" % (parsed, len(index)), verbose_level=2
+            )
+            with self.timed("discovery"):
+                pkgs = {
+                    os.path.join("pkgs", item).lower(): os.path.join("pkgs", item)
+                    for item in repo.itemlist("pkgs")
+                }
+                icons = self.hash_repo_icons(repo, pkginfo_refs is None)
+        except Exception as err:  # pylint: disable=broad-except
+            raise ProcessorError(
+                "Could not read %s: %s" % (self.env["MUNKI_REPO"], err)
+            )
+        errors = []
+        with self.timed("assemble"):
+            catalogs = self.assemble_catalogs(index, pkgs, icons, errors)
+        with self.timed("catalog_write"):
+            catalog_data = self.serialize_catalogs(catalogs)
+            self.save_index(index_path, index)
+        with self.timed("upload"):
+            publish_errors = self.publish_catalogs(repo, catalog_data, icons, force)
+        if publish_errors:
+            raise ProcessorError("\n".join(publish_errors))
+        return errors
+
+    def run_makecatalogs(self):
+        """Runs makecatalogs on MUNKI_REPO. Returns its exit code and error
+        output."""
+        # Generate arguments for makecatalogs.
+        args = ["/usr/local/munki/makecatalogs"]
+        if self.env["MUNKI_REPO"].startswith("/"):
+            # looks a file path instead of a URL
+            args.append(self.env["MUNKI_REPO"])
+        else:
+            args.extend(["--repo-url", self.env["MUNKI_REPO"]])
+
+        if self.env.get("MUNKI_REPO_PLUGIN"):
+            args.extend(["--plugin", self.env["MUNKI_REPO_PLUGIN"]])
+
+        # Call makecatalogs.
+        try:
+            proc = subprocess.Popen(
+                args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+            _, err_out = proc.communicate()
+        except OSError as err:
+            raise ProcessorError(
+                "makecatalog execution failed with error code %d: %s"
+                % (err.errno, err.strerror)
+            )
+
+        return proc.returncode, err_out.decode("utf-8")
+
+    def get_imported_refs(self, run_results):
+        """Returns the set of pkginfo paths, relative to pkgsinfo, that this
+        autopkg run's results say were imported, or None if nothing was."""
+        imported = None
         # run_results is an array of autopackager.results,
         # which is itself an array.
         # look through all the results for evidence that
         # something was imported
-        # this could probably be done as an array comprehension
-        # but might be harder to grasp...
         for result in run_results:
             for item in result:
                 if "Output" in item and item["Output"].get("munki_repo_changed", False):
-                    repo_changed = True
-                    break
+                    imported = imported or set()
+                    path = item["Output"].get("pkginfo_repo_path", "")
+                    imported.add(path.replace(os.sep, "/").rpartition("pkgsinfo/")[2])
+        return imported
+
+    def rebuild(self, full_scan, force=False):
+        """Rebuilds the catalogs, consuming the journal. With force, the
+        pkginfo index isn't used. Returns the result code and error
+        output."""
+        journal_entries, journal_offset = self.read_journal()
+        self.env["journal_changes"] = [
+            {key: entry.get(key) for key in ("pkginfo", "catalogs", "name", "version")}
+            for entry in journal_entries
+        ]
+        if self.env.get("incremental"):
+            if self.get_local_repo_path():
+                # Checking every mtime and size is cheap locally, and catches
+                # edits the journal doesn't know about
+                errors = self.build_catalogs(self.get_local_repo_path(), force)
+            else:
+                pkginfo_refs = None
+                if journal_entries and not full_scan:
+                    pkginfo_refs = sorted(
+                        {entry["pkginfo"] for entry in journal_entries}
+                    )
+                errors = self.build_repo_catalogs(pkginfo_refs, force)
+            self.counts["errors"] = len(errors)
+            # makecatalogs writes the catalogs, then exits with -1 if
+            # there were any errors
+            result = (255 if errors else 0, "\n".join(errors))
+        else:
+            with self.timed("makecatalogs"):
+                result = self.run_makecatalogs()
+        self.save_checkpoint(journal_offset)
+        return result
+
+    @contextmanager
+    def timed(self, phase):
+        """Adds the time spent in the block to phase in the timings."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = (
+                self.timings.get(phase, 0) + time.perf_counter() - start
+            )
+
+    def report_timings(self):
+        """Sets makecatalogs_timings and writes the timing report."""
+        slowest = sorted(self.pkginfo_times, reverse=True)[:SLOWEST_PKGINFOS]
+        timings = {
+            "phases": {phase: round(secs, 6) for phase, secs in self.timings.items()},
+            "counts": self.counts,
+            "slowest_pkginfos": [
+                {"pkginfo": path, "seconds": round(secs, 6)} for secs, path in slowest
+            ],
+        }
+        self.env["makecatalogs_timings"] = timings
+        report_path = self.env.get("timing_report_path")
+        if report_path:
+            try:
+                with open(report_path, "w") as f:
+                    json.dump(timings, f, indent=2, sort_keys=True)
+            except OSError as err:
+                self.output("WARNING: Could not write %s: %s" % (report_path, err))
 
-        if not repo_changed and not self.env.get("force_rebuild"):
+    def main(self):
+        """Rebuild Munki catalogs in repo_path"""
+        self.timings = {}
+        self.counts = {}
+        self.pkginfo_times = []
+        try:
+            with self.timed("total"):
+                self.make_catalogs()
+        finally:
+            self.report_timings()
+
+    def scan_for_changes(self):
+        """Returns the pkginfos this autopkg run's results say were imported
+        (None if nothing was) and the ones in the journal."""
+        cache_dir = get_pref("CACHE_DIR") or os.path.expanduser(
+            "~/Library/AutoPkg/Cache"
+        )
+        current_run_results_plist = os.path.join(cache_dir, "autopkg_results.plist")
+        try:
+            with open(current_run_results_plist, "rb") as f:
+                run_results = plistlib.load(f)
+        except (IOError, OSError):
+            run_results = []
+
+        imported = self.get_imported_refs(run_results)
+        journaled = {entry["pkginfo"] for entry in self.read_journal()[0]}
+        return imported, journaled
+
+    def make_catalogs(self):
+        """Rebuilds the catalogs if anything changed"""
+        with self.timed("results_scan"):
+            imported, journaled = self.scan_for_changes()
+        self.env["journal_changes"] = []
+        if imported is None and not journaled and not self.env.get("force_rebuild"):
             self.output("No need to rebuild catalogs.")
             self.env["makecatalogs_resultcode"] = 0
             self.env["makecatalogs_stderr"] = ""
-        else:
-            # Generate arguments for makecatalogs.
-            args = ["/usr/local/munki/makecatalogs"]
-            if self.env["MUNKI_REPO"].startswith("/"):
-                # looks a file path instead of a URL
-                args.append(self.env["MUNKI_REPO"])
-            else:
-                args.extend(["--repo-url", self.env["MUNKI_REPO"]])
+            return
 
-            if self.env.get("MUNKI_REPO_PLUGIN"):
-                args.extend(["--plugin", self.env["MUNKI_REPO_PLUGIN"]])
+        # For repos accessed through a plugin, the journal can stand in for
+        # a full scan only if it covers everything this run imported.
+        full_scan = self.env.get("force_rebuild") or not (
+            journaled and (imported or set()) <= journaled
+        )
 
-            # Call makecatalogs.
-            try:
-                proc = subprocess.Popen(
-                    args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        # Concurrent runs against the same repo each request a new
+        # generation; whichever gets the build lock first rebuilds once for
+        # all generations requested so far, and the others find their
+        # generation built when they get the lock.
+        def request(state):
+            state["requested"] = state.get("requested", 0) + 1
+            if full_scan:
+                state["full_scan_generation"] = state["requested"]
+            if self.env.get("force_rebuild"):
+                state["force_generation"] = state["requested"]
+
+        generation = self.update_state(request)["requested"]
+        with open(self.get_repo_file_path(".build.lock"), "a") as lock:
+            with self.timed("lock_wait"):
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self.output(
+                        "Waiting for another run to finish rebuilding catalogs..."
+                    )
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+            state = self.read_state()
+            if state.get("built", 0) >= generation:
+                self.output("Catalogs were rebuilt by another run.")
+                resultcode = state.get("resultcode", 0)
+                stderr = state.get("stderr", "")
+            else:
+                target = state["requested"]
+                built = state.get("built", 0)
+                resultcode, stderr = self.rebuild(
+                    state.get("full_scan_generation", 0) > built,
+                    state.get("force_generation", 0) > built,
                 )
-                _, err_out = proc.communicate()
-            except OSError as err:
-                raise ProcessorError(
-                    "makecatalog execution failed with error code %d: %s"
-                    % (err.errno, err.strerror)
+                self.update_state(
+                    lambda state: state.update(
+                        built=target, resultcode=resultcode, stderr=stderr
+                    )
                 )
+                if not resultcode:
+                    self.output("Munki catalogs rebuilt!")
 
-            self.env["makecatalogs_resultcode"] = proc.returncode
-            self.env["makecatalogs_stderr"] = err_out.decode("utf-8")
-            if proc.returncode != 0:
-                error_text = "makecatalogs failed: \n" + self.env["makecatalogs_stderr"]
-                raise ProcessorError(error_text)
-            else:
-                self.output("Munki catalogs rebuilt!")
+        self.env["makecatalogs_resultcode"] = resultcode
+        self.env["makecatalogs_stderr"] = stderr
+        if resultcode != 0:
+            raise ProcessorError("makecatalogs failed: \n" + stderr)
 
 
 if __name__ == "__main__":
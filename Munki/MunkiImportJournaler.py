@@ -0,0 +1,116 @@
+#!/usr/local/autopkg/python
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""See docstring for MunkiImportJournaler class"""
+
+import fcntl
+import json
+import os.path
+import time
+
+from autopkglib import Processor, ProcessorError, get_pref
+
+__all__ = ["MunkiImportJournaler"]
+
+
+class MunkiImportJournaler(Processor):
+    """Appends what MunkiImporter just imported to a journal that
+    MakeCatalogsProcessor reads to learn exactly which pkginfos changed.
+    Use it as a postprocessor, e.g.
+    autopkg run --post com.github.autopkg.munki.makecatalogs/MunkiImportJournaler
+    or as a step after MunkiImporter. Concurrent autopkg runs may share the
+    journal."""
+
+    input_variables = {
+        "MUNKI_REPO": {
+            "description": "Path to the Munki repo (or repo URL).",
+            "required": True,
+        },
+        "munki_repo_changed": {
+            "required": False,
+            "description": "Set by MunkiImporter when it imported something.",
+        },
+        "munki_importer_summary_result": {
+            "required": False,
+            "description": "Set by MunkiImporter when it imported something.",
+        },
+        "pkginfo_repo_path": {
+            "required": False,
+            "description": "Set by MunkiImporter when it imported something.",
+        },
+        "import_journal": {
+            "required": False,
+            "description": (
+                "Path of the journal. Defaults to "
+                "CACHE_DIR/makecatalogs/import_journal.jsonl, which is where "
+                "MakeCatalogsProcessor looks for it."
+            ),
+        },
+    }
+    output_variables = {}
+
+    description = __doc__
+
+    def get_pkginfo_ref(self):
+        """Returns the path of the imported pkginfo relative to pkgsinfo."""
+        data = (self.env.get("munki_importer_summary_result") or {}).get("data", {})
+        if data.get("pkginfo_path"):
+            return data["pkginfo_path"]
+        pkginfo_repo_path = self.env.get("pkginfo_repo_path") or ""
+        _, sep, ref = pkginfo_repo_path.replace(os.sep, "/").rpartition("pkgsinfo/")
+        if not sep:
+            raise ProcessorError(
+                "Can't tell which pkginfo was imported from %s" % pkginfo_repo_path
+            )
+        return ref
+
+    def main(self):
+        if not self.env.get("munki_repo_changed"):
+            self.output("Nothing imported; nothing to journal.", verbose_level=2)
+            return
+        data = (self.env.get("munki_importer_summary_result") or {}).get("data", {})
+        catalogs = data.get("catalogs") or []
+        if isinstance(catalogs, str):
+            catalogs = [catalog.strip() for catalog in catalogs.split(",")]
+        entry = {
+            "time": time.time(),
+            "repo": self.env["MUNKI_REPO"],
+            "pkginfo": self.get_pkginfo_ref(),
+            "catalogs": catalogs,
+            "name": data.get("name", ""),
+            "version": data.get("version", ""),
+        }
+
+        journal = self.env.get("import_journal") or os.path.join(
+            get_pref("CACHE_DIR") or os.path.expanduser("~/Library/AutoPkg/Cache"),
+            "makecatalogs",
+            "import_journal.jsonl",
+        )
+        try:
+            os.makedirs(os.path.dirname(journal), exist_ok=True)
+            with open(journal, "a") as f:
+                # Each entry is a single write of a whole line under an
+                # exclusive lock, so readers never see half of one.
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(json.dumps(entry, sort_keys=True) + "\n")
+                f.flush()
+        except OSError as err:
+            raise ProcessorError("Could not write to %s: %s" % (journal, err))
+        self.output("Journaled %s in %s" % (entry["pkginfo"], journal))
+
+
+if __name__ == "__main__":
+    PROCESSOR = MunkiImportJournaler()
+    PROCESSOR.execute_shell()
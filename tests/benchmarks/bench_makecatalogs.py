@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the wall time and peak memory of a forced incremental build by
+MakeCatalogsProcessor of synthetic Munki repos, by number of catalog_workers.
+
+Usage: bench_makecatalogs.py [--sizes 1000 10000 50000] [--workers 1 2 4 0]
+
+Workers 0 leaves catalog_workers unset, for the default of one per CPU.
+
+Each build runs in a process of its own, so the peak RSS reported is that of
+the build alone: the larger of the main process and any one of its workers.
+Set AUTOPKG_DIR if autopkglib isn't installed in /Library/AutoPkg."""
+
+import argparse
+import os
+import plistlib
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_repo(repo_path, count):
+    """Writes count pkginfos of typical size, each with an installer item,
+    to a new repo at repo_path."""
+    for kind in ("pkgsinfo", "pkgs", "icons"):
+        os.makedirs(os.path.join(repo_path, kind))
+    for i in range(count):
+        name = "App%03d" % (i % 500)
+        version = "%d.%d" % (i // 500 + 1, i % 7)
+        location = "apps/%s-%s.dmg" % (name, version)
+        pkginfo = {
+            "_metadata": {"created_by": "autopkg", "munki_version": "6.3.0"},
+            "name": name,
+            "version": version,
+            "display_name": "Application %s" % name,
+            "description": "Synthetic application for benchmarks. " * 4,
+            "catalogs": ["testing", "production"] if i % 3 else ["testing"],
+            "category": "Productivity",
+            "developer": "Example Corp",
+            "installer_item_location": location,
+            "installer_item_hash": "%064x" % i,
+            "installer_item_size": 100000 + i,
+            "installed_size": 300000 + i,
+            "minimum_os_version": "11.0",
+            "unattended_install": True,
+            "installs": [
+                {
+                    "CFBundleIdentifier": "com.example.%s" % name.lower(),
+                    "CFBundleShortVersionString": version,
+                    "path": "/Applications/%s.app" % name,
+                    "type": "application",
+                    "version_comparison_key": "CFBundleShortVersionString",
+                }
+            ],
+            "receipts": [
+                {
+                    "packageid": "com.example.%s.pkg.%d" % (name.lower(), j),
+                    "version": version,
+                    "installed_size": 1000 * j,
+                }
+                for j in range(4)
+            ],
+        }
+        with open(
+            os.path.join(repo_path, "pkgsinfo", "%s-%s.plist" % (name, version)), "wb"
+        ) as f:
+            plistlib.dump(pkginfo, f)
+        item_path = os.path.join(repo_path, "pkgs", location)
+        os.makedirs(os.path.dirname(item_path), exist_ok=True)
+        open(item_path, "wb").close()
+
+
+def peak_rss_mb():
+    """Returns the peak RSS of this process and of its waited for children,
+    whichever is larger, in MB."""
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def build(repo_path, cache_dir, workers):
+    """Runs a forced incremental build and prints its timings as a line of
+    wall seconds, parse seconds and peak RSS."""
+    sys.path.append(os.environ.get("AUTOPKG_DIR", "/Library/AutoPkg"))
+    sys.path.insert(0, os.path.join(REPO_DIR, "Munki"))
+    # pylint: disable=import-error,import-outside-toplevel
+    import MakeCatalogsProcessor as processor_module
+
+    processor_module.get_pref = lambda key: cache_dir if key == "CACHE_DIR" else None
+    env = {"MUNKI_REPO": repo_path, "incremental": True, "force_rebuild": True}
+    if workers:
+        env["catalog_workers"] = str(workers)
+    processor = processor_module.MakeCatalogsProcessor(env)
+    processor.output = lambda msg, verbose_level=1: None
+    start = time.perf_counter()
+    processor.main()
+    elapsed = time.perf_counter() - start
+    parse = processor.env["makecatalogs_timings"]["phases"]["parse"]
+    print("%f %f %f" % (elapsed, parse, peak_rss_mb()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000])
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 0])
+    parser.add_argument("--build", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.build:
+        repo_path, cache_dir, workers = args.build
+        build(repo_path, cache_dir, int(workers))
+        return
+
+    print("%d CPUs" % os.cpu_count())
+    print(
+        "%8s %8s %10s %10s %10s"
+        % ("pkginfos", "workers", "wall s", "parse s", "peak MB")
+    )
+    for size in args.sizes:
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            repo_path = os.path.join(tmp_dir, "repo")
+            make_repo(repo_path, size)
+            for workers in args.workers:
+                cache_dir = os.path.join(tmp_dir, "cache-%d" % workers)
+                output = subprocess.check_output(
+                    [
+                        sys.executable,
+                        os.path.abspath(__file__),
+                        "--build",
+                        repo_path,
+                        cache_dir,
+                        str(workers),
+                    ]
+                )
+                elapsed, parse, peak = (float(value) for value in output.split())
+                print(
+                    "%8d %8d %10.2f %10.2f %10.1f"
+                    % (size, workers, elapsed, parse, peak)
+                )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the time and peak memory of reading MAU feeds with the streaming
+parser of MSOfficeMacURLandUpdateInfoProvider against the plistlib.loads path
+it replaced, and against reading the entries cached for an unchanged feed.
+
+Usage: bench_mau_feed_parsing.py [feed.xml ...]
+
+Without arguments, a synthetic feed with a long history and localized text
+is generated, similar to the AutoUpdate, Edge and Teams feeds. Set AUTOPKG_DIR
+if autopkglib isn't installed in /Library/AutoPkg."""
+
+import argparse
+import datetime
+import os
+import plistlib
+import sys
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.environ.get("AUTOPKG_DIR", "/Library/AutoPkg"))
+sys.path.insert(0, os.path.join(REPO_DIR, "MSOfficeUpdates"))
+
+from MSOfficeMacURLandUpdateInfoProvider import (  # noqa: E402
+    MSOfficeMacURLandUpdateInfoProvider,
+)
+
+CDN = "https://officecdnmac.microsoft.com/pr/C1297A47-86C4-4C1F-97FA-950631F94777/MacAutoupdate/"
+LOCALES = ["%04X" % locale_id for locale_id in range(1025, 1045)]
+
+
+def synthetic_feed(releases=200):
+    """Returns a feed of releases full updaters with a delta each, newest
+    first, every entry carrying release notes in 20 locales."""
+    entries = []
+    for i in range(releases, 0, -1):
+        version = "16.%d.%d" % (i, 23000000 + i)
+        previous = "16.%d.%d" % (i - 1, 23000000 + i - 1)
+        localized = {
+            locale: {
+                "Title": "Microsoft AutoUpdate %s" % version,
+                "Short Description": "Update %s for %s. " % (version, locale) * 4,
+                "Release Notes": "Fixes and improvements. " * 60,
+            }
+            for locale in LOCALES
+        }
+        common = {
+            "Title": "Microsoft AutoUpdate %s" % version,
+            "Update Version": version,
+            "Minimum OS": "12.0",
+            "Date": datetime.datetime(2023, 1, 1),
+            "Trigger Condition": ["and", "Registered File"],
+            "Localized": localized,
+            "Release Notes": "Fixes and improvements. " * 200,
+        }
+        entries.append(
+            dict(
+                common,
+                Location="\n%sMAU_%s_to_%s_Delta.pkg\n" % (CDN, previous, version),
+                FullUpdaterLocation="%sMAU_%s_Updater.pkg" % (CDN, version),
+                Size="40000000",
+                Triggers={
+                    "Registered File": {
+                        "VersionsRelative": [">= %s" % previous, "< %s" % version]
+                    }
+                },
+            )
+        )
+        entries.append(
+            dict(
+                common,
+                Location="%sMAU_%s_Updater.pkg" % (CDN, version),
+                Size="150000000",
+                Triggers={"Registered File": {"VersionsRelative": ["< %s" % version]}},
+            )
+        )
+    return plistlib.dumps(entries)
+
+
+def plistlib_path(data, version):
+    """The original parse path: load the whole feed, strip every string,
+    filter, and keep the first match."""
+    metadata = plistlib.loads(data)
+    metadata = [
+        {k: v.strip() if isinstance(v, str) else v for k, v in entry.items()}
+        for entry in metadata
+        if isinstance(entry, dict)
+    ]
+    if version == "latest":
+        items = [u for u in metadata if not u.get("FullUpdaterLocation")]
+    else:
+        items = [u for u in metadata if u.get("FullUpdaterLocation")]
+    return items[0]
+
+
+def cached_path(cached, version):
+    """The path of a 304 response: load the cached entries and select from
+    them, without parsing the feed."""
+    provider = MSOfficeMacURLandUpdateInfoProvider({})
+    provider.output = lambda msg, verbose_level=1: None
+    return provider.select_update(plistlib.loads(cached)["entries"], version)
+
+
+def measure(function, *args):
+    """Returns the wall time in ms and the traced peak memory in MB of a
+    call. Tracing slows down allocations, so the time is taken from a
+    separate untraced call."""
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("feeds", nargs="*", help="Recorded feed files")
+    args = parser.parse_args()
+
+    provider = MSOfficeMacURLandUpdateInfoProvider({})
+    provider.output = lambda msg, verbose_level=1: None
+    feeds = [(path, open(path, "rb").read()) for path in args.feeds]
+    if not feeds:
+        feeds = [("synthetic", synthetic_feed())]
+
+    cases = [
+        ("plistlib 'latest'", lambda data: plistlib_path(data, "latest")),
+        ("plistlib 'latest-delta'", lambda data: plistlib_path(data, "latest-delta")),
+        (
+            "streamed 'latest'",
+            lambda data: provider.select_update(provider.iter_feed(data), "latest"),
+        ),
+        (
+            "streamed 'latest-delta'",
+            lambda data: provider.select_update(
+                provider.iter_feed(data), "latest-delta"
+            ),
+        ),
+        ("streamed, every entry", provider.parse_feed),
+    ]
+    for name, data in feeds:
+        print("%s: %.1f MB" % (name, len(data) / 1024 / 1024))
+        for case, function in cases:
+            elapsed, peak = measure(function, data)
+            print("  %-26s %8.1f ms %8.1f MB peak" % (case, elapsed, peak))
+        cached = plistlib.dumps(
+            {"entries": provider.parse_feed(data)}, fmt=plistlib.FMT_BINARY
+        )
+        for version in ("latest", "latest-delta"):
+            elapsed, peak = measure(cached_path, cached, version)
+            case = "cached '%s'" % version
+            print("  %-26s %8.1f ms %8.1f MB peak" % (case, elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Shared setup for the processor tests.
+
+The processors import autopkglib, which comes with AutoPkg rather than as a
+Python package. It is looked for in AUTOPKG_DIR, which defaults to where the
+AutoPkg installer puts it."""
+
+import hashlib
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTOPKG_DIR = os.environ.get("AUTOPKG_DIR", "/Library/AutoPkg")
+
+if AUTOPKG_DIR not in sys.path:
+    sys.path.append(AUTOPKG_DIR)
+# Processors are imported by module name, the way AutoPkg loads them
+for processor_dir in [
+    "AdobeAcrobatPro",
+    "AdobeReader",
+    "MSOfficeUpdates",
+    "Mozilla",
+    "Munki",
+]:
+    sys.path.insert(0, os.path.join(REPO_DIR, processor_dir))
+
+
+class FileServer(ThreadingHTTPServer):
+    """Serves the bytes in files, keyed by path, with an ETag and
+    Last-Modified header, answering conditional requests with 304. Every
+    request is logged in requests as a (path, headers) tuple."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FileRequestHandler)
+        self.files = {}
+        self.requests = []
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server_address[1], path)
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        data = self.server.files[self.path]
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Tue, 12 Dec 2023 17:00:00 GMT")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def file_server():
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
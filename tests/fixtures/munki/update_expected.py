@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Runs makecatalogs from the Munki tools on a copy of the fixture repo and
+writes its catalogs, icon hashes and errors to expected.plist, which the
+incremental build tests of MakeCatalogsProcessor compare against.
+
+The expected.plist in the tree was written by hand from makecatalogslib's
+rules and hasn't been checked against a makecatalogs run yet. Running this
+on a Mac with the Munki tools, and committing any difference, does that.
+
+Usage: update_expected.py [path/to/makecatalogs]
+
+The fixture repo has catalogs whose names differ only by case, so TMPDIR
+must be on a case-sensitive volume."""
+
+import os
+import plistlib
+import shutil
+import subprocess
+import sys
+import tempfile
+
+FIXTURES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    makecatalogs = sys.argv[1] if len(sys.argv) > 1 else "/usr/local/munki/makecatalogs"
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        if os.path.exists(tmp_dir.upper()):
+            sys.exit("%s is on a case-insensitive volume" % tmp_dir)
+        repo_path = os.path.join(tmp_dir, "repo")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "repo"), repo_path)
+        proc = subprocess.run(
+            [makecatalogs, repo_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        catalogs = {}
+        for name in sorted(os.listdir(os.path.join(repo_path, "catalogs"))):
+            with open(os.path.join(repo_path, "catalogs", name), "rb") as f:
+                catalogs[name] = plistlib.load(f)
+        with open(os.path.join(repo_path, "icons", "_icon_hashes.plist"), "rb") as f:
+            icon_hashes = plistlib.load(f)
+    finally:
+        shutil.rmtree(tmp_dir)
+    expected = {
+        "catalogs": catalogs,
+        "icon_hashes": icon_hashes,
+        "errors": [
+            line for line in proc.stderr.decode("utf-8").splitlines() if line.strip()
+        ],
+    }
+    with open(os.path.join(FIXTURES_DIR, "expected.plist"), "wb") as f:
+        plistlib.dump(expected, f, sort_keys=False)
+
+
+if __name__ == "__main__":
+    main()
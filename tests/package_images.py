@@ -0,0 +1,368 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Builds the flat packages, HFS+ volumes and UDIF disk images the
+AdobeReaderRepackager tests read.
+
+Flat packages and cpio archives are written by bsdtar, so they don't come
+from the code under test. HFS+ volumes and UDIF images are laid out here,
+following Apple's TN1150 and the UDIF "koly"/"mish" structures, with just
+the parts the reader uses."""
+
+import bz2
+import gzip
+import lzma
+import os
+import plistlib
+import shutil
+import struct
+import subprocess
+import sys
+import zlib
+
+DISTRIBUTION = (
+    b'<?xml version="1.0" encoding="utf-8"?>\n'
+    b'<installer-gui-script minSpecVersion="1"><title>Reader</title>'
+    b'<domains enable_anywhere="false" enable_localSystem="true"/>'
+    b'<choices-outline><line choice="app"/></choices-outline>'
+    b"</installer-gui-script>\n"
+)
+PREINSTALL = b"#!/bin/sh\necho original preinstall doing lots of things\n" * 20
+POSTINSTALL = b"#!/bin/sh\necho post\n"
+
+
+def find_bsdtar():
+    """Returns the path of a bsdtar that can write xar archives, or None."""
+    candidates = [os.environ.get("BSDTAR"), shutil.which("bsdtar")]
+    if sys.platform == "darwin":
+        candidates.append("/usr/bin/tar")
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            proc = subprocess.run(
+                [candidate, "--format", "xar", "-cf", os.devnull, "-T", os.devnull],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError:
+            continue
+        if proc.returncode == 0:
+            return candidate
+    return None
+
+
+def write_files(root, files):
+    """Writes the dict of relative path -> data under root."""
+    for path, data in files.items():
+        full_path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(data)
+
+
+def build_cpio(bsdtar, root, files):
+    """Returns an odc cpio archive, as pkgbuild writes Scripts archives, of
+    the dict of name -> data, written under root first. The files are
+    executable."""
+    write_files(root, files)
+    for name in files:
+        os.chmod(os.path.join(root, name), 0o755)
+    return subprocess.run(
+        [bsdtar, "--format", "odc", "-cf", "-", "-C", root] + ["./" + n for n in files],
+        stdout=subprocess.PIPE,
+        check=True,
+    ).stdout
+
+
+def build_flat_pkg(bsdtar, work_dir, path, compression="gzip"):
+    """Writes a distribution package shaped like the Reader installer to
+    path, with its files stored with compression ("gzip", "bzip2" or
+    "none"). Returns the dict of path -> contents of the files in it."""
+    scripts = build_cpio(
+        bsdtar,
+        os.path.join(work_dir, "scripts"),
+        {"preinstall": PREINSTALL, "postinstall": POSTINSTALL},
+    )
+    files = {
+        "Distribution": DISTRIBUTION,
+        "application_mini_7z.pkg/Payload": os.urandom(256 * 1024),
+        "application_mini_7z.pkg/PackageInfo": b"<pkg-info/>",
+        "application_mini_7z.pkg/Scripts": gzip.compress(scripts),
+        "other.pkg/Payload": os.urandom(128 * 1024),
+        "other.pkg/PackageInfo": b"<pkg-info/>",
+    }
+    src = os.path.join(work_dir, "src")
+    write_files(src, files)
+    subprocess.run(
+        [bsdtar, "--format", "xar", "--options", "xar:compression=" + compression]
+        + ["-cf", path, "-C", src, "Distribution", "application_mini_7z.pkg"]
+        + ["other.pkg"],
+        check=True,
+    )
+    return files
+
+
+HFS_BLOCK_SIZE = 4096
+# Blocks 1-3 hold the extents overflow B-tree, 4-15 the catalog B-tree
+HFS_EXTENTS_START = 1
+HFS_CATALOG_START = 4
+HFS_FIRST_FILE_BLOCK = 16
+HFS_EXTENTS_NODE_SIZE = 4096
+UF_COMPRESSED = 0x20
+
+
+def hfs_fork(size, extents):
+    """Returns an HFSPlusForkData of size bytes in extents, of which only
+    the first eight fit."""
+    blocks = sum(count for _, count in extents)
+    slots = extents[:8] + [(0, 0)] * (8 - len(extents[:8]))
+    return struct.pack(">QII", size, 0, blocks) + b"".join(
+        struct.pack(">II", *extent) for extent in slots
+    )
+
+
+def btree_node(kind, records, node_size, next_node=0, height=1):
+    """Returns a B-tree node holding records, with the record offsets at
+    its end."""
+    body = bytearray(
+        struct.pack(">IIbBHH", next_node, 0, kind, height, len(records), 0)
+    )
+    offsets = []
+    for record in records:
+        offsets.append(len(body))
+        body += record
+    offsets.append(len(body))
+    tail = b"".join(struct.pack(">H", offset) for offset in reversed(offsets))
+    assert len(body) + len(tail) <= node_size
+    return bytes(body) + bytes(node_size - len(body) - len(tail)) + tail
+
+
+def btree_header_node(node_size, first_leaf, last_leaf, total_nodes, leaf_records):
+    """Returns the header node of a B-tree."""
+    header = struct.pack(
+        ">HIIIIHHII",
+        1 if first_leaf else 0,
+        first_leaf,
+        leaf_records,
+        first_leaf,
+        last_leaf,
+        node_size,
+        516,
+        total_nodes,
+        0,
+    )
+    header += bytes(106 - len(header))
+    user_data = bytes(128)
+    bitmap = bytes(node_size - 14 - len(header) - len(user_data) - 8)
+    return btree_node(1, [header, user_data, bitmap], node_size, height=0)
+
+
+def catalog_key(parent_id, name):
+    encoded = name.encode("utf-16-be")
+    key = struct.pack(">IH", parent_id, len(name)) + encoded
+    return struct.pack(">H", len(key)) + key
+
+
+def catalog_file(file_id, size, extents, owner_flags=0):
+    """Returns an HFSPlusCatalogFile record."""
+    record = struct.pack(">hHII", 2, 0, 0, file_id) + bytes(20)
+    record += struct.pack(">IIBBHI", 0, 0, 0, owner_flags, 0o100644, 0)
+    record += bytes(32) + bytes(8)
+    record += hfs_fork(size, extents) + hfs_fork(0, [])
+    return record
+
+
+def catalog_folder(folder_id):
+    """Returns an HFSPlusCatalogFolder record."""
+    return struct.pack(">hHII", 1, 0, 1, folder_id) + bytes(76)
+
+
+def catalog_thread(kind, parent_id, name):
+    encoded = name.encode("utf-16-be")
+    return struct.pack(">hhIH", kind, 0, parent_id, len(name)) + encoded
+
+
+def build_hfs(files, folders=(), fragmented=None, compressed=(), catalog_node_size=512):
+    """Returns an HFS+ volume with the (name, data) files and the empty
+    folders in its root folder. The file named fragmented is spread over
+    one block extents with gaps between them, so that more than eight of
+    them end up in the extents overflow file. Files named in compressed
+    are flagged as HFS+ compressed."""
+    next_block = HFS_FIRST_FILE_BLOCK
+    blocks = {}
+    layout = {}
+    for name, data in files:
+        block_count = (len(data) + HFS_BLOCK_SIZE - 1) // HFS_BLOCK_SIZE
+        extents = []
+        if name == fragmented:
+            for _ in range(block_count):
+                extents.append((next_block, 1))
+                next_block += 2
+        elif block_count:
+            extents.append((next_block, block_count))
+            next_block += block_count
+        layout[name] = extents
+        pos = 0
+        for start, count in extents:
+            for block in range(start, start + count):
+                blocks[block] = data[pos : pos + HFS_BLOCK_SIZE]
+                pos += HFS_BLOCK_SIZE
+
+    # Catalog records are sorted by parent ID, then name
+    records = [
+        (1, "Volume", catalog_folder(2)),
+        (2, "", catalog_thread(3, 1, "Volume")),
+    ]
+    overflow = []
+    node_id = 100
+    for name, data in sorted(files):
+        extents = layout[name]
+        owner_flags = UF_COMPRESSED if name in compressed else 0
+        records.append(
+            (2, name, catalog_file(node_id, len(data), extents, owner_flags))
+        )
+        records.append((node_id, "", catalog_thread(4, 2, name)))
+        for i in range(8, len(extents), 8):
+            start_block = sum(count for _, count in extents[:i])
+            key = struct.pack(">HBBII", 10, 0, 0, node_id, start_block)
+            more = extents[i : i + 8] + [(0, 0)] * (8 - len(extents[i : i + 8]))
+            overflow.append(
+                key + b"".join(struct.pack(">II", *extent) for extent in more)
+            )
+        node_id += 1
+    for name in folders:
+        records.append((2, name, catalog_folder(node_id)))
+        records.append((node_id, "", catalog_thread(3, 2, name)))
+        node_id += 1
+    records.sort(key=lambda record: record[:2])
+    records = [catalog_key(parent, name) + data for parent, name, data in records]
+
+    leaves = [[]]
+    for record in records:
+        used = sum(len(r) for r in leaves[-1]) + 14 + 2 * (len(leaves[-1]) + 2)
+        if used + len(record) > catalog_node_size:
+            leaves.append([])
+        leaves[-1].append(record)
+    catalog = btree_header_node(
+        catalog_node_size, 1, len(leaves), len(leaves) + 1, len(records)
+    )
+    for i, leaf in enumerate(leaves):
+        next_node = i + 2 if i + 1 < len(leaves) else 0
+        catalog += btree_node(-1, leaf, catalog_node_size, next_node)
+    if overflow:
+        extents_file = btree_header_node(
+            HFS_EXTENTS_NODE_SIZE, 1, 1, 2, len(overflow)
+        ) + btree_node(-1, overflow, HFS_EXTENTS_NODE_SIZE)
+    else:
+        extents_file = btree_header_node(HFS_EXTENTS_NODE_SIZE, 0, 0, 1, 0)
+    catalog_blocks = (len(catalog) + HFS_BLOCK_SIZE - 1) // HFS_BLOCK_SIZE
+    assert HFS_CATALOG_START + catalog_blocks <= HFS_FIRST_FILE_BLOCK
+    assert len(extents_file) <= (HFS_CATALOG_START - HFS_EXTENTS_START) * HFS_BLOCK_SIZE
+
+    total_blocks = next_block + 4
+    volume = bytearray(total_blocks * HFS_BLOCK_SIZE)
+    offset = HFS_EXTENTS_START * HFS_BLOCK_SIZE
+    volume[offset : offset + len(extents_file)] = extents_file
+    offset = HFS_CATALOG_START * HFS_BLOCK_SIZE
+    volume[offset : offset + len(catalog)] = catalog
+    for block, data in blocks.items():
+        offset = block * HFS_BLOCK_SIZE
+        volume[offset : offset + len(data)] = data
+    header = bytearray(512)
+    struct.pack_into(">2sH", header, 0, b"H+", 4)
+    struct.pack_into(">II", header, 40, HFS_BLOCK_SIZE, total_blocks)
+    header[192:272] = hfs_fork(
+        len(extents_file),
+        [
+            (
+                HFS_EXTENTS_START,
+                (len(extents_file) + HFS_BLOCK_SIZE - 1) // HFS_BLOCK_SIZE,
+            )
+        ],
+    )
+    header[272:352] = hfs_fork(len(catalog), [(HFS_CATALOG_START, catalog_blocks)])
+    volume[1024:1536] = header
+    return bytes(volume)
+
+
+UDIF_CODECS = {
+    "raw": (0x00000001, lambda data: data),
+    "zlib": (0x80000005, zlib.compress),
+    "bzip2": (0x80000006, bz2.compress),
+    "lzma": (0x80000008, lzma.compress),
+}
+UDIF_ZERO_FILL = 0x00000002
+UDIF_TERMINATOR = 0xFFFFFFFF
+
+
+def block_map(first_sector, chunks, sector_count):
+    """Returns a "mish" block map of (type, comment, sector, sector count,
+    offset, length) chunks."""
+    header = struct.pack(
+        ">4sIQQQII", b"mish", 1, first_sector, sector_count, 0, 0, len(chunks)
+    )
+    header += bytes(24) + bytes(136) + struct.pack(">I", len(chunks))
+    return header + b"".join(struct.pack(">IIQQQQ", *chunk) for chunk in chunks)
+
+
+def build_udif(volume, codecs=("zlib", "raw", "bzip2", "lzma"), chunk_sectors=2048):
+    """Returns a UDIF image with a one sector protective MBR partition and
+    volume as its Apple_HFS partition, split into chunks of chunk_sectors
+    stored with each of codecs in turn. All zero chunks are stored as zero
+    fill."""
+    data = bytearray(512)
+    partitions = [
+        (
+            "Protective Master Boot Record (MBR : 0)",
+            block_map(
+                0,
+                [(1, 0, 0, 1, 0, 512), (UDIF_TERMINATOR, 0, 1, 0, 512, 0)],
+                1,
+            ),
+        )
+    ]
+    chunks = []
+    sector_count = len(volume) // 512
+    for i, offset in enumerate(range(0, len(volume), chunk_sectors * 512)):
+        piece = volume[offset : offset + chunk_sectors * 512]
+        if not any(piece):
+            chunks.append((UDIF_ZERO_FILL, 0, offset // 512, len(piece) // 512, 0, 0))
+            continue
+        kind, compress = UDIF_CODECS[codecs[i % len(codecs)]]
+        stored = compress(piece)
+        chunks.append(
+            (kind, 0, offset // 512, len(piece) // 512, len(data), len(stored))
+        )
+        data += stored
+    chunks.append((UDIF_TERMINATOR, 0, sector_count, 0, len(data), 0))
+    partitions.append(
+        ("disk image (Apple_HFS : 1)", block_map(1, chunks, sector_count))
+    )
+    xml = plistlib.dumps(
+        {
+            "resource-fork": {
+                "blkx": [
+                    {"Name": name, "Data": block_data, "ID": str(i)}
+                    for i, (name, block_data) in enumerate(partitions)
+                ]
+            }
+        }
+    )
+    trailer = bytearray(512)
+    struct.pack_into(">4sIII", trailer, 0, b"koly", 4, 512, 1)
+    struct.pack_into(">QQ", trailer, 24, 0, len(data))
+    struct.pack_into(">QQ", trailer, 216, len(data), len(xml))
+    struct.pack_into(">Q", trailer, 492, sector_count + 1)
+    return bytes(data) + xml + bytes(trailer)
@@ -0,0 +1,162 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the update chains, manifest cache and major_versions of
+AdobeAcrobatProUpdateInfoProvider"""
+
+import plistlib
+import threading
+
+import AdobeAcrobatProUpdateInfoProvider as provider_module
+import pytest
+from autopkglib import ProcessorError
+
+PLIST_PATH = "/{MAJREV}/%s/{PROD}_{PROD_ARCH}.plist"
+
+
+class ManifestServer:
+    """Serves manifest_url_template.txt and the manifests of the releases
+    of each major version, and counts the downloads."""
+
+    def __init__(self):
+        self.files = {}
+        self.downloads = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def manifest_url(major_version, version):
+        path = PLIST_PATH % version
+        url_vars = dict(provider_module.URL_VARS_DEFAULT, MAJREV=major_version)
+        for var, value in url_vars.items():
+            path = path.replace("{%s}" % var, value)
+        return provider_module.META_BASE_URL + path
+
+    def add_major_version(self, major_version, chain):
+        """Adds the releases of major_version in chain, newest first, each
+        requiring the next one."""
+        template_url = provider_module.MANIFEST_URL_TEMPLATE.replace(
+            "{MAJREV}", major_version
+        )
+        self.files[template_url] = PLIST_PATH % chain[0]
+        for index, version in enumerate(chain):
+            manifest = {
+                "BuildNumber": version,
+                "PatchURL": "/pub/%s/AcrobatUpd%s.dmg" % (major_version, version),
+            }
+            if index + 1 < len(chain):
+                manifest["PreviousURLTemplate"] = PLIST_PATH % chain[index + 1]
+            self.files[self.manifest_url(major_version, version)] = plistlib.dumps(
+                manifest
+            )
+
+    def download(self, url):
+        with self.lock:
+            self.downloads.append(url)
+        if url not in self.files:
+            raise ProcessorError("Not found: %s" % url)
+        return self.files[url]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    server = ManifestServer()
+    monkeypatch.setattr(
+        provider_module,
+        "get_pref",
+        lambda key: str(tmp_path) if key == "CACHE_DIR" else None,
+    )
+    monkeypatch.setattr(
+        provider_module.AdobeAcrobatProUpdateInfoProvider,
+        "download",
+        lambda self, url, text=False: server.download(url),
+    )
+    return server
+
+
+def run(**env):
+    processor = provider_module.AdobeAcrobatProUpdateInfoProvider(env)
+    processor.output = lambda msg, verbose_level=1: None
+    processor.main()
+    return processor.env
+
+
+def test_chain_down_to_base_release(server):
+    # 11.0.03 ends in '.0.03', not in a base release's '.0.00'
+    server.add_major_version("11", ["11.0.10", "11.0.09", "11.0.03", "11.0.00"])
+    env = run(major_version="11")
+
+    assert env["version"] == "11.0.10"
+    assert env["url"] == "http://armdl.adobe.com/pub/11/AcrobatUpd11.0.10.dmg"
+    assert env["requires_chain"] == [
+        {
+            "name": "AdobeAcrobatPro11_Update-%s" % version,
+            "version": version,
+            "url": "http://armdl.adobe.com/pub/11/AcrobatUpd%s.dmg" % version,
+        }
+        for version in ("11.0.03", "11.0.09")
+    ]
+    assert env["additional_pkginfo"]["requires"] == ["AdobeAcrobatPro11_Update-11.0.09"]
+
+
+def test_base_version_re():
+    for version in ("10.0.0", "11.0.00", "9.00.00"):
+        assert provider_module.BASE_VERSION_RE.search(version)
+    for version in ("11.0.03", "10.1.0", "11.0.10", "9.0.01"):
+        assert not provider_module.BASE_VERSION_RE.search(version)
+
+
+def test_update_chain_loop(server):
+    server.add_major_version("10", ["10.1.3", "10.1.2", "10.1.1"])
+    # 10.1.1 requires 10.1.2 again
+    url = server.manifest_url("10", "10.1.1")
+    manifest = plistlib.loads(server.files[url])
+    manifest["PreviousURLTemplate"] = PLIST_PATH % "10.1.2"
+    server.files[url] = plistlib.dumps(manifest)
+
+    with pytest.raises(ProcessorError, match="doesn't reach a base release"):
+        run(major_version="10")
+
+
+def test_cached_manifests_are_not_downloaded_again(server):
+    server.add_major_version("11", ["11.0.10", "11.0.09", "11.0.00"])
+    first = run(major_version="11")
+    assert len(server.downloads) == 4
+
+    server.downloads = []
+    second = run(major_version="11")
+    # Only the unversioned template is downloaded again
+    assert server.downloads == [
+        provider_module.MANIFEST_URL_TEMPLATE.replace("{MAJREV}", "11")
+    ]
+    assert second["requires_chain"] == first["requires_chain"]
+
+
+def test_major_versions(server):
+    server.add_major_version("9", ["9.5.5", "9.5.4", "9.0.0"])
+    server.add_major_version("10", ["10.1.3", "10.1.2", "10.1.1", "10.0.0"])
+    server.add_major_version("11", ["11.0.10", "11.0.00"])
+    env = run(major_versions="9, 10,11", version="10.1.2")
+
+    updates = env["major_version_updates"]
+    assert sorted(updates) == ["10", "11", "9"]
+    # The explicit version only applies to major version 10
+    assert updates["10"] == {
+        "url": "http://armdl.adobe.com/pub/10/AcrobatUpd10.1.2.dmg",
+        "version": "10.1.2",
+        "prev_version": "10.1.1",
+    }
+    assert updates["9"]["version"] == "9.5.5"
+    assert updates["9"]["prev_version"] == "9.5.4"
+    assert updates["11"]["version"] == "11.0.10"
+    assert updates["11"]["prev_version"] == "11.0.00"
@@ -0,0 +1,351 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for patching Adobe Reader packages in place and for copying them
+out of disk images without mounting with AdobeReaderRepackager"""
+
+import gzip
+import os
+import shutil
+import subprocess
+
+import AdobeReaderRepackager as processor_module
+import package_images
+import pytest
+
+SCRIPTS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "AdobeReader",
+    "package_resources",
+    "scripts",
+)
+
+
+@pytest.fixture(scope="module")
+def bsdtar():
+    path = package_images.find_bsdtar()
+    if not path:
+        pytest.skip("needs a bsdtar that can write xar archives")
+    return path
+
+
+def make_processor(**env):
+    processor = processor_module.AdobeReaderRepackager(env)
+    processor.output = lambda msg, verbose_level=1: None
+    return processor
+
+
+def extract(bsdtar, archive, dest_dir, stdin=None):
+    """Extracts archive with bsdtar, which also checks the checksums of a
+    xar archive, and returns the dict of path -> contents of its files."""
+    os.makedirs(dest_dir)
+    subprocess.run([bsdtar, "-xf", archive, "-C", dest_dir], input=stdin, check=True)
+    files = {}
+    for dirpath, _, filenames in os.walk(dest_dir):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, "rb") as f:
+                files[os.path.relpath(path, dest_dir)] = f.read()
+    return files
+
+
+def test_replace_cpio_member(bsdtar, tmp_path):
+    archive = package_images.build_cpio(
+        bsdtar,
+        str(tmp_path / "scripts"),
+        {"preinstall": b"old\n", "postinstall": b"post\n", "tool": b"x" * 1000},
+    )
+    patched = processor_module.replace_cpio_member(archive, "preinstall", b"new!\n")
+    files = extract(bsdtar, "-", str(tmp_path / "out"), stdin=patched)
+    assert files == {
+        "preinstall": b"new!\n",
+        "postinstall": b"post\n",
+        "tool": b"x" * 1000,
+    }
+    assert os.stat(tmp_path / "out" / "preinstall").st_mode & 0o777 == 0o755
+
+    with pytest.raises(processor_module.XarError, match="not found"):
+        processor_module.replace_cpio_member(archive, "missing", b"")
+    with pytest.raises(processor_module.XarError, match="Not an odc cpio"):
+        processor_module.replace_cpio_member(gzip.compress(archive), "preinstall", b"")
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bzip2", "none"])
+def test_xar_archive_round_trip(bsdtar, tmp_path, compression):
+    pkg = str(tmp_path / "in.pkg")
+    files = package_images.build_flat_pkg(bsdtar, str(tmp_path), pkg, compression)
+    archive = processor_module.XarArchive(pkg)
+    for path, data in files.items():
+        assert archive.read(path) == data
+
+    out = str(tmp_path / "out.pkg")
+    archive.write(out, {"other.pkg/PackageInfo": b"<pkg-info changed/>"})
+    expected = dict(files, **{"other.pkg/PackageInfo": b"<pkg-info changed/>"})
+    assert extract(bsdtar, out, str(tmp_path / "out")) == expected
+    assert processor_module.XarArchive(out).read("other.pkg/Payload") == (
+        files["other.pkg/Payload"]
+    )
+
+
+def test_not_a_xar_archive(tmp_path):
+    path = tmp_path / "not.pkg"
+    path.write_bytes(os.urandom(4096))
+    with pytest.raises(processor_module.XarError):
+        processor_module.XarArchive(str(path))
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bzip2", "none"])
+def test_patch_pkg(bsdtar, tmp_path, compression):
+    pkg = str(tmp_path / "AcroRdrDC_2300120064_MUI.pkg")
+    files = package_images.build_flat_pkg(bsdtar, str(tmp_path), pkg, compression)
+    out = str(tmp_path / "patched.pkg")
+    make_processor().patch_pkg(pkg, out)
+
+    patched = extract(bsdtar, out, str(tmp_path / "out"))
+    assert set(patched) == set(files)
+    for path in ("application_mini_7z.pkg/Payload", "other.pkg/Payload"):
+        assert patched[path] == files[path]
+    assert b"<domains" not in patched["Distribution"]
+    assert b"<choices-outline>" in patched["Distribution"]
+
+    scripts = extract(
+        bsdtar,
+        "-",
+        str(tmp_path / "scripts_out"),
+        stdin=gzip.decompress(patched["application_mini_7z.pkg/Scripts"]),
+    )
+    with open(os.path.join(SCRIPTS_DIR, "readerdc_preinstall"), "rb") as f:
+        assert scripts["preinstall"] == f.read()
+    assert scripts["postinstall"] == package_images.POSTINSTALL
+
+
+def write_dmg(path, files, chunk_sectors=64, **kwargs):
+    image = package_images.build_udif(
+        package_images.build_hfs(files, **kwargs), chunk_sectors=chunk_sectors
+    )
+    with open(path, "wb") as f:
+        f.write(image)
+
+
+def test_read_hfs_volume(tmp_path):
+    files = {
+        "AcroRdrDC_2300120064_MUI.pkg": os.urandom(300000),
+        "Read Me.txt": os.urandom(40000),
+        # 13 extents, five of them in the extents overflow file
+        "fragmented.bin": os.urandom(12 * package_images.HFS_BLOCK_SIZE + 100),
+        "empty": b"",
+        "compressed.bin": b"data",
+    }
+    dmg = str(tmp_path / "Reader.dmg")
+    write_dmg(
+        dmg,
+        sorted(files.items()),
+        folders=["Sub"],
+        fragmented="fragmented.bin",
+        compressed=["compressed.bin"],
+    )
+
+    with processor_module.UDIFImage(dmg) as image:
+        assert image.partition_names() == [
+            "Protective Master Boot Record (MBR : 0)",
+            "disk image (Apple_HFS : 1)",
+        ]
+        image.select_partition(1)
+        volume = processor_module.HFSPlusVolume(image)
+        assert volume.list_root() == sorted(list(files) + ["Sub"])
+        for name in ("AcroRdrDC_2300120064_MUI.pkg", "Read Me.txt"):
+            volume.copy_file(name, str(tmp_path / "copy"))
+            assert (tmp_path / "copy").read_bytes() == files[name]
+        volume.copy_file("fragmented.bin", str(tmp_path / "copy"))
+        assert (tmp_path / "copy").read_bytes() == files["fragmented.bin"]
+        assert len(volume.get_data_fork("fragmented.bin")[1]) == 13
+        volume.copy_file("empty", str(tmp_path / "copy"))
+        assert (tmp_path / "copy").read_bytes() == b""
+        with pytest.raises(processor_module.DiskImageError, match="is a folder"):
+            volume.get_data_fork("Sub")
+        with pytest.raises(processor_module.DiskImageError, match="compressed"):
+            volume.get_data_fork("compressed.bin")
+
+
+def test_not_a_udif_image(tmp_path):
+    path = tmp_path / "garbage.dmg"
+    path.write_bytes(os.urandom(1 << 16))
+    with pytest.raises(processor_module.DiskImageError):
+        processor_module.UDIFImage(str(path))
+    with pytest.raises(processor_module.DiskImageError):
+        make_processor().copy_pkg_from_dmg(str(path), str(tmp_path))
+
+
+class MountingRepackager(processor_module.AdobeReaderRepackager):
+    """Mounts by copying the pkg into a folder, and records the mounts."""
+
+    def __init__(self, env, pkg):
+        super().__init__(env)
+        self.pkg = pkg
+        self.mounts = []
+        self.output = lambda msg, verbose_level=1: None
+
+    def mount(self, pathname):
+        self.mounts.append(pathname)
+        mount_point = os.path.join(self.env["RECIPE_CACHE_DIR"], "mount")
+        os.makedirs(mount_point, exist_ok=True)
+        shutil.copy(self.pkg, mount_point)
+        return mount_point
+
+    def unmount(self, pathname):
+        shutil.rmtree(os.path.join(self.env["RECIPE_CACHE_DIR"], "mount"))
+
+
+def test_repackage_without_mounting(bsdtar, tmp_path):
+    pkg = str(tmp_path / "AcroRdrDC_2300120064_MUI.pkg")
+    files = package_images.build_flat_pkg(bsdtar, str(tmp_path), pkg)
+    with open(pkg, "rb") as f:
+        pkg_data = f.read()
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    dmg = str(tmp_path / "Reader.dmg")
+    write_dmg(dmg, [(os.path.basename(pkg), pkg_data), ("Read Me.txt", b"hi")])
+
+    def run():
+        processor = MountingRepackager(
+            {"dmg_path": dmg, "RECIPE_CACHE_DIR": str(cache_dir)}, pkg
+        )
+        processor.main()
+        return processor
+
+    processor = run()
+    assert processor.mounts == []
+    assert processor.env["pkg_path"] == str(cache_dir / os.path.basename(pkg))
+    patched = extract(bsdtar, processor.env["pkg_path"], str(tmp_path / "out"))
+    assert patched["other.pkg/Payload"] == files["other.pkg/Payload"]
+    assert b"<domains" not in patched["Distribution"]
+
+    # A flat pkg bundle in a folder can only be read from the mounted dmg
+    write_dmg(dmg, [("Read Me.txt", b"hi")], folders=[os.path.basename(pkg)])
+    assert run().mounts == [dmg]
+    (tmp_path / "Reader.dmg").write_bytes(os.urandom(1 << 16))
+    assert run().mounts == [dmg]
+
+
+@pytest.fixture
+def mounted_dmg(bsdtar, tmp_path, monkeypatch):
+    """Returns a function that repackages a dmg that can only be read by
+    mounting it, with copies of our preinstall scripts in scripts_dir."""
+    pkg = str(tmp_path / "AcroRdrDC_2300120064_MUI.pkg")
+    package_images.build_flat_pkg(bsdtar, str(tmp_path), pkg)
+    dmg = str(tmp_path / "Reader.dmg")
+    write_dmg(dmg, [("Read Me.txt", b"hi")], folders=[os.path.basename(pkg)])
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    scripts_dir = tmp_path / "our_scripts"
+    shutil.copytree(SCRIPTS_DIR, scripts_dir)
+    monkeypatch.setattr(
+        processor_module.AdobeReaderRepackager,
+        "get_script_path",
+        lambda self, name: str(scripts_dir / name),
+    )
+
+    def run():
+        processor = MountingRepackager(
+            {"dmg_path": dmg, "RECIPE_CACHE_DIR": str(cache_dir)}, pkg
+        )
+        processor.main()
+        return processor
+
+    run.dmg = dmg
+    run.scripts_dir = scripts_dir
+    run.cache_path = cache_dir / processor_module.REPACKAGE_CACHE_NAME
+    return run
+
+
+def test_cache_hit_does_not_mount(mounted_dmg):
+    processor = mounted_dmg()
+    assert processor.mounts == [mounted_dmg.dmg]
+    pkg_path = processor.env["pkg_path"]
+    processor = mounted_dmg()
+    assert processor.mounts == []
+    assert processor.env["pkg_path"] == pkg_path
+
+
+def test_cache_key_changes(mounted_dmg, monkeypatch):
+    mounted_dmg()
+    with open(mounted_dmg.scripts_dir / "readerdc_preinstall", "ab") as f:
+        f.write(b"# changed\n")
+    assert mounted_dmg().mounts == [mounted_dmg.dmg]
+    assert mounted_dmg().mounts == []
+
+    monkeypatch.setattr(
+        processor_module,
+        "REPACKAGE_RULES_VERSION",
+        processor_module.REPACKAGE_RULES_VERSION + 1,
+    )
+    assert mounted_dmg().mounts == [mounted_dmg.dmg]
+    assert mounted_dmg().mounts == []
+
+
+def test_cache_checks_size_and_mtime(mounted_dmg, monkeypatch):
+    pkg_path = mounted_dmg().env["pkg_path"]
+    hashed = []
+    file_digest = processor_module.AdobeReaderRepackager.file_digest
+
+    def counting_file_digest(self, path, record=None):
+        result = file_digest(self, path, record)
+        if result is not record:
+            hashed.append(path)
+        return result
+
+    monkeypatch.setattr(
+        processor_module.AdobeReaderRepackager, "file_digest", counting_file_digest
+    )
+    # An unchanged dmg isn't hashed again
+    assert mounted_dmg().mounts == []
+    assert hashed == []
+
+    # A touched dmg with the same content is hashed, but still a hit, and
+    # its new mtime is remembered
+    stat = os.stat(mounted_dmg.dmg)
+    os.utime(mounted_dmg.dmg, (stat.st_atime, stat.st_mtime + 10))
+    assert mounted_dmg().mounts == []
+    assert hashed == [mounted_dmg.dmg]
+    assert mounted_dmg().mounts == []
+    assert hashed == [mounted_dmg.dmg]
+
+    # A repackaged pkg that changed since is made again
+    with open(pkg_path, "ab") as f:
+        f.write(b"x")
+    assert mounted_dmg().mounts == [mounted_dmg.dmg]
+    os.unlink(pkg_path)
+    assert mounted_dmg().mounts == [mounted_dmg.dmg]
+
+
+def test_cache_is_written_atomically(mounted_dmg, monkeypatch):
+    mounted_dmg()
+    with open(mounted_dmg.cache_path, "rb") as f:
+        cache = f.read()
+
+    def interrupted_dump(value, fp, **kwargs):
+        fp.write(b"<?xml")
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(processor_module.plistlib, "dump", interrupted_dump)
+    processor = MountingRepackager(
+        {"RECIPE_CACHE_DIR": os.path.dirname(mounted_dmg.cache_path)}, None
+    )
+    processor.write_repackage_cache({"key": "other"})
+    with open(mounted_dmg.cache_path, "rb") as f:
+        assert f.read() == cache
+    assert sorted(os.listdir(os.path.dirname(mounted_dmg.cache_path))) == [
+        processor_module.REPACKAGE_CACHE_NAME,
+        "AcroRdrDC_2300120064_MUI.pkg",
+    ]
@@ -0,0 +1,362 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the incremental mode of MakeCatalogsProcessor"""
+
+import json
+import os
+import plistlib
+import shutil
+import sys
+
+import MakeCatalogsProcessor as processor_module
+import pytest
+from autopkglib import ProcessorError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "munki")
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(
+        processor_module,
+        "get_pref",
+        lambda key: str(cache_dir) if key == "CACHE_DIR" else None,
+    )
+    return cache_dir
+
+
+def make_catalogs(repo_path, expect_errors=False, **env):
+    processor = processor_module.MakeCatalogsProcessor(
+        dict(env, MUNKI_REPO=str(repo_path), incremental=True)
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    if expect_errors:
+        with pytest.raises(ProcessorError, match="makecatalogs failed"):
+            processor.main()
+    else:
+        processor.main()
+    return processor.env
+
+
+@pytest.fixture
+def fixture_repo(tmp_path):
+    repo_path = tmp_path / "repo"
+    shutil.copytree(os.path.join(FIXTURES_DIR, "repo"), repo_path)
+    return repo_path
+
+
+@pytest.fixture
+def expected():
+    # Written by hand from makecatalogslib's rules, as Munki's tools don't
+    # run here; update_expected.py replaces it with what a real makecatalogs
+    # run gives.
+    with open(os.path.join(FIXTURES_DIR, "expected.plist"), "rb") as f:
+        return plistlib.load(f)
+
+
+def record_import(cache_dir, pkginfo_path):
+    """Writes autopkg results saying pkginfo_path was imported."""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, "autopkg_results.plist"), "wb") as f:
+        plistlib.dump(
+            [
+                [
+                    {
+                        "Output": {
+                            "munki_repo_changed": True,
+                            "pkginfo_repo_path": pkginfo_path,
+                        }
+                    }
+                ]
+            ],
+            f,
+        )
+
+
+def normalize_errors(errors):
+    """Drops the parser's message from read errors, which differs between
+    Python versions."""
+    return [
+        error.partition(": ")[0] if error.startswith("Unexpected error") else error
+        for error in errors
+    ]
+
+
+def check_catalogs(repo_path, env, expected):
+    """Asserts that the repo holds the catalogs and icon hashes in expected,
+    and that the same errors were reported."""
+    names = set(expected["catalogs"])
+    if os.path.exists(str(repo_path).upper()):
+        # Catalogs differing only by case overwrite each other here
+        names = {name for name in names if name.lower() != "testing"}
+    for name in names:
+        assert read_catalog(repo_path, name) == expected["catalogs"][name], name
+    catalog_files = os.listdir(os.path.join(repo_path, "catalogs"))
+    assert {name.lower() for name in catalog_files} == {
+        name.lower() for name in expected["catalogs"]
+    }
+    with open(os.path.join(repo_path, "icons", "_icon_hashes.plist"), "rb") as f:
+        assert plistlib.load(f) == expected["icon_hashes"]
+    assert normalize_errors(env["makecatalogs_stderr"].split("\n")) == (
+        normalize_errors(expected["errors"])
+    )
+    # makecatalogs exits with -1 when there were errors
+    assert env["makecatalogs_resultcode"] == 255
+
+
+def read_catalog(repo_path, name):
+    with open(os.path.join(repo_path, "catalogs", name), "rb") as f:
+        return plistlib.load(f)
+
+
+def write_pkginfo(repo_path, name, version):
+    path = os.path.join(repo_path, "pkgsinfo", "%s-%s.plist" % (name, version))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        plistlib.dump(
+            {
+                "name": name,
+                "version": version,
+                "catalogs": ["testing"],
+                "installer_type": "nopkg",
+            },
+            f,
+        )
+    return path
+
+
+def test_force_rebuild_ignores_the_index(tmp_path, cache_dir):
+    repo_path = tmp_path / "repo"
+    path = write_pkginfo(repo_path, "Tool", "1.0")
+    make_catalogs(repo_path, force_rebuild=True)
+    assert read_catalog(repo_path, "all")[0]["version"] == "1.0"
+
+    # Same size and mtime, different content
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read().replace(b"<string>1.0</string>", b"<string>1.1</string>")
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    env = make_catalogs(repo_path, force_rebuild=True)
+    assert read_catalog(repo_path, "all")[0]["version"] == "1.1"
+    assert env["makecatalogs_timings"]["counts"]["pkginfos_read"] == 1
+    assert env["makecatalogs_timings"]["counts"]["pkginfos_parsed"] == 1
+
+
+def test_touched_pkginfo_is_not_parsed(tmp_path, cache_dir, monkeypatch):
+    repo_path = tmp_path / "repo"
+    path = write_pkginfo(repo_path, "Tool", "1.0")
+    make_catalogs(repo_path, force_rebuild=True)
+
+    parsed = []
+    parse_pkginfo = processor_module.parse_pkginfo
+    monkeypatch.setattr(
+        processor_module,
+        "parse_pkginfo",
+        lambda data, *args: parsed.append(data) or parse_pkginfo(data, *args),
+    )
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    record_import(cache_dir, path)
+    env = make_catalogs(repo_path)
+    assert parsed == []
+    assert env["makecatalogs_timings"]["counts"]["pkginfos_read"] == 1
+    assert env["makecatalogs_timings"]["counts"]["pkginfos_parsed"] == 0
+    assert read_catalog(repo_path, "all")[0]["version"] == "1.0"
+
+
+def test_catalogs_match_expected(fixture_repo, cache_dir, expected):
+    catalogs_dir = fixture_repo / "catalogs"
+    catalogs_dir.mkdir()
+    (catalogs_dir / "retired").write_bytes(plistlib.dumps([{"name": "Old"}]))
+    (catalogs_dir / "production").write_bytes(plistlib.dumps([]))
+
+    env = make_catalogs(fixture_repo, expect_errors=True, force_rebuild=True)
+    check_catalogs(fixture_repo, env, expected)
+    assert not (catalogs_dir / "retired").exists()
+
+
+def test_indexed_rebuild_matches_expected(fixture_repo, cache_dir, expected):
+    make_catalogs(fixture_repo, expect_errors=True, force_rebuild=True)
+    shutil.rmtree(fixture_repo / "catalogs")
+    record_import(
+        cache_dir, str(fixture_repo / "pkgsinfo" / "apps" / "Zoom-5.16.plist")
+    )
+
+    env = make_catalogs(fixture_repo, expect_errors=True)
+    assert env["makecatalogs_timings"]["counts"]["pkginfos_parsed"] == 0
+    check_catalogs(fixture_repo, env, expected)
+
+
+def test_journal_run_sees_changes_made_outside_autopkg(tmp_path, cache_dir):
+    repo_path = tmp_path / "repo"
+    removed = write_pkginfo(repo_path, "Removed", "1.0")
+    promoted = write_pkginfo(repo_path, "Promoted", "1.0")
+    make_catalogs(repo_path, force_rebuild=True)
+
+    # Edits by hand, which the journal doesn't know about
+    os.unlink(removed)
+    with open(promoted, "rb") as f:
+        pkginfo = plistlib.load(f)
+    pkginfo["catalogs"].append("production")
+    with open(promoted, "wb") as f:
+        plistlib.dump(pkginfo, f)
+    # And an import the journal does know about
+    write_pkginfo(repo_path, "Imported", "1.0")
+    journal = cache_dir / "makecatalogs" / "import_journal.jsonl"
+    journal.write_text(
+        json.dumps({"repo": str(repo_path), "pkginfo": "Imported-1.0.plist"}) + "\n"
+    )
+
+    env = make_catalogs(repo_path)
+    assert [item["name"] for item in read_catalog(repo_path, "all")] == [
+        "Imported",
+        "Promoted",
+    ]
+    assert [item["name"] for item in read_catalog(repo_path, "production")] == [
+        "Promoted"
+    ]
+    assert env["journal_changes"][0]["pkginfo"] == "Imported-1.0.plist"
+
+
+def test_parse_workers_default_to_cpu_count(tmp_path, cache_dir, monkeypatch):
+    monkeypatch.setattr(processor_module.os, "cpu_count", lambda: 8)
+    assert processor_module.MakeCatalogsProcessor({}).get_worker_count() == 8
+    processor = processor_module.MakeCatalogsProcessor({"catalog_workers": "1"})
+    assert processor.get_worker_count() == 1
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("started worker processes")
+
+    # Too few pkginfos to be worth starting worker processes for
+    monkeypatch.setattr(processor_module, "ProcessPoolExecutor", no_pool)
+    repo_path = tmp_path / "repo"
+    for i in range(processor_module.MIN_PARALLEL_PARSE - 1):
+        write_pkginfo(repo_path, "Tool%04d" % i, "1.0")
+    processor = processor_module.MakeCatalogsProcessor(
+        {"MUNKI_REPO": str(repo_path), "incremental": True, "force_rebuild": True}
+    )
+    messages = []
+    processor.output = lambda msg, verbose_level=1: messages.append(msg)
+    processor.main()
+    assert not [msg for msg in messages if "Parallel parsing failed" in msg]
+    assert (
+        len(read_catalog(repo_path, "all")) == processor_module.MIN_PARALLEL_PARSE - 1
+    )
+
+
+def test_parallel_parse(tmp_path, cache_dir):
+    repo_path = tmp_path / "repo"
+    for i in range(processor_module.MIN_PARALLEL_PARSE * 2):
+        write_pkginfo(repo_path, "Tool%04d" % i, "1.0")
+    processor = processor_module.MakeCatalogsProcessor(
+        {
+            "MUNKI_REPO": str(repo_path),
+            "incremental": True,
+            "force_rebuild": True,
+            "catalog_workers": "2",
+        }
+    )
+    messages = []
+    processor.output = lambda msg, verbose_level=1: messages.append(msg)
+    sys_path = list(sys.path)
+
+    processor.main()
+    assert not [msg for msg in messages if "Parallel parsing failed" in msg]
+    assert sys.path == sys_path
+    items = read_catalog(repo_path, "all")
+    assert [item["name"] for item in items] == sorted(item["name"] for item in items)
+    assert len(items) == processor_module.MIN_PARALLEL_PARSE * 2
+
+
+class MemoryRepo:
+    """Stands in for a munkilib repo plugin connection."""
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = []
+        self.gets = []
+
+    def itemlist(self, kind):
+        prefix = kind + "/"
+        return sorted(
+            ref[len(prefix) :] for ref in self.files if ref.startswith(prefix)
+        )
+
+    def get(self, ref):
+        self.gets.append(ref)
+        return self.files[ref]
+
+    def put(self, ref, data):
+        self.files[ref] = data
+        self.uploads.append(ref)
+
+    def delete(self, ref):
+        del self.files[ref]
+
+
+def test_publish_compares_with_published_digests(cache_dir, monkeypatch):
+    repo = MemoryRepo()
+    monkeypatch.setattr(
+        processor_module.MakeCatalogsProcessor, "connect_repo", lambda self: repo
+    )
+    repo.files["pkgsinfo/Tool-1.0.plist"] = plistlib.dumps(
+        {
+            "name": "Tool",
+            "version": "1.0",
+            "catalogs": ["testing"],
+            "installer_type": "nopkg",
+        }
+    )
+    repo.files["catalogs/retired"] = plistlib.dumps([])
+    url = "https://munki.example.com/repo"
+
+    make_catalogs(url, force_rebuild=True, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert repo.uploads == ["catalogs/all", "catalogs/testing"]
+    assert "catalogs/retired" not in repo.files
+
+    # Unchanged catalogs are not fetched from the repo to compare with
+    repo.uploads = []
+    repo.gets = []
+    record_import(cache_dir, "pkgsinfo/Tool-1.0.plist")
+    make_catalogs(url, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert repo.uploads == []
+    assert not [ref for ref in repo.gets if ref.startswith("catalogs/")]
+
+    # A catalog removed from the repo is uploaded again
+    del repo.files["catalogs/all"]
+    record_import(cache_dir, "pkgsinfo/Tool-1.0.plist")
+    env = make_catalogs(url, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert repo.uploads == ["catalogs/all"]
+    assert [upload["catalog"] for upload in env["catalog_uploads"]] == repo.uploads
+
+    # Changed in the repo by someone else, which only a forced run notices
+    repo.uploads = []
+    repo.files["catalogs/testing"] = plistlib.dumps([])
+    record_import(cache_dir, "pkgsinfo/Tool-1.0.plist")
+    make_catalogs(url, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert repo.uploads == []
+    repo.gets = []
+    make_catalogs(url, force_rebuild=True, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert "catalogs/testing" in repo.gets
+    assert repo.uploads == ["catalogs/testing"]
+    assert plistlib.loads(repo.files["catalogs/testing"])[0]["name"] == "Tool"
+
+    repo.uploads = []
+    make_catalogs(url, force_rebuild=True, MUNKI_REPO_PLUGIN="MemoryRepo")
+    assert repo.uploads == []
@@ -0,0 +1,176 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the SHA-512 lookup of MozillaURLProvider and for
+MozillaVerifiedDownloader"""
+
+import hashlib
+import json
+import os
+import plistlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from autopkglib import ProcessorError
+from MozillaURLProvider import MozillaURLProvider
+from MozillaVerifiedDownloader import MozillaVerifiedDownloader
+from MSOfficeUpdateDownloader import MSOfficeUpdateDownloader
+
+DMG_PATH = "/pub/firefox/releases/120.0/mac/en-US/Firefox%20120.0.dmg"
+DMG = os.urandom(200_000)
+
+
+@pytest.fixture
+def release(file_server):
+    """Serves product details naming 120.0 as the latest release, and its
+    SHA512SUMS and installer."""
+    file_server.files["/firefox_versions.json"] = json.dumps(
+        {"LATEST_FIREFOX_VERSION": "120.0"}
+    ).encode()
+    sums = [
+        "%s  mac/de/Firefox 120.0.dmg" % ("0" * 128),
+        "%s  mac/en-US/Firefox 120.0.dmg" % hashlib.sha512(DMG).hexdigest(),
+        "%s  win64/en-US/Firefox Setup 120.0.exe" % ("1" * 128),
+    ]
+    file_server.files["/pub/firefox/releases/120.0/SHA512SUMS"] = "\n".join(
+        sums
+    ).encode()
+    file_server.files[DMG_PATH] = DMG
+    return file_server
+
+
+def provide(file_server, **env):
+    processor = MozillaURLProvider(
+        {
+            **env,
+            "product_name": "firefox",
+            "versions_base_url": file_server.url("/{product}_versions.json"),
+            "versions_cache_ttl": "0",
+            "sha512sums": True,
+            "sha512sums_url": file_server.url(
+                "/pub/{product}/releases/{version}/SHA512SUMS"
+            ),
+        }
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    processor.main()
+    return processor.env
+
+
+def download(tmp_path, **env):
+    processor = MozillaVerifiedDownloader(dict(env, RECIPE_CACHE_DIR=str(tmp_path)))
+    processor.output = lambda msg, verbose_level=1: None
+    processor.main()
+    return processor.env
+
+
+def test_url_is_the_installer_the_digest_is_for(release):
+    env = provide(release)
+    # Not the download.mozilla.org redirect, which may lead to a newer release
+    assert env["url"] == release.url(DMG_PATH)
+    assert env["moz_sha512"] == hashlib.sha512(DMG).hexdigest()
+
+
+def test_bouncer_url_with_sha512sums(release, monkeypatch):
+    resolved = []
+
+    def resolve_redirects(self, urls):
+        resolved.extend(urls)
+        return [{"http_result_code": "200", "final_url": url} for url in urls]
+
+    monkeypatch.setattr(MozillaURLProvider, "resolve_redirects", resolve_redirects)
+    env = provide(release, resolve_redirects=True)
+    assert resolved == [release.url(DMG_PATH)]
+    assert env["url"] == release.url(DMG_PATH)
+    assert env["moz_bouncer_url"] == (
+        "https://download.mozilla.org/?product=firefox-latest-ssl&os=osx&lang=en-US"
+    )
+
+
+def test_verified_download_is_not_requested_again(tmp_path, release):
+    env = download(tmp_path, **provide(release))
+    assert env["download_changed"]
+    assert os.path.basename(env["pathname"]) == "Firefox 120.0.dmg"
+    with open(env["pathname"], "rb") as f:
+        assert f.read() == DMG
+    with open(tmp_path / "downloads" / ".mozilla_verified_downloads.plist", "rb") as f:
+        record = plistlib.load(f)["Firefox 120.0.dmg"]
+    assert record["digest"] == hashlib.sha512(DMG).hexdigest()
+    assert record["size"] == len(DMG)
+
+    requests = len(release.requests)
+    env = download(tmp_path, **provide(release))
+    assert not env["download_changed"]
+    assert DMG_PATH not in [path for path, _ in release.requests[requests:]]
+
+
+def test_changed_file_is_downloaded_again(tmp_path, release):
+    env = download(tmp_path, **provide(release))
+    with open(env["pathname"], "ab") as f:
+        f.write(b"x")
+    assert download(tmp_path, **provide(release))["download_changed"]
+
+
+def test_size_mismatch(tmp_path, release):
+    env = provide(release)
+    with pytest.raises(ProcessorError, match="server announced"):
+        download(tmp_path, expected_size=str(len(DMG) + 1), **env)
+    # curl itself refuses a file announced larger than --max-filesize
+    with pytest.raises(ProcessorError, match="exit code 63"):
+        download(tmp_path, content_length=str(len(DMG) - 1), **env)
+    assert os.listdir(tmp_path / "downloads") == []
+
+
+def test_digest_mismatch(tmp_path, release):
+    env = dict(provide(release), moz_sha512="0" * 128)
+    with pytest.raises(ProcessorError, match="SHA-512 mismatch"):
+        download(tmp_path, **env)
+    assert os.listdir(tmp_path / "downloads") == []
+
+
+def test_registry_is_not_shared_with_msoffice(tmp_path, release):
+    office_pkg = "/pr/Microsoft_Excel_16.80.23121017_Updater.pkg"
+    release.files[office_pkg] = b"pkg"
+    processor = MSOfficeUpdateDownloader(
+        {"url": release.url(office_pkg), "RECIPE_CACHE_DIR": str(tmp_path)}
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    processor.main()
+    download(tmp_path, **provide(release))
+    with open(tmp_path / "downloads" / ".verified_downloads.plist", "rb") as f:
+        assert list(plistlib.load(f)) == [os.path.basename(office_pkg)]
+    assert (
+        "etag"
+        in processor.get_verified_downloads(str(tmp_path / "downloads"))[
+            os.path.basename(office_pkg)
+        ]
+    )
+
+
+def test_concurrent_records_are_kept(tmp_path):
+    download_dir = str(tmp_path)
+    processor = MozillaVerifiedDownloader({})
+    names = ["Firefox %d.dmg" % i for i in range(32)]
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+
+    def record(name):
+        processor.record_verified_download(
+            download_dir, os.path.join(download_dir, name), name
+        )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(record, names))
+    verified = processor.get_verified_downloads(download_dir)
+    assert sorted(verified) == sorted(names)
@@ -0,0 +1,110 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the streaming feed parser of MSOfficeMacURLandUpdateInfoProvider"""
+
+import datetime
+import os
+import plistlib
+
+import MSOfficeMacURLandUpdateInfoProvider as provider_module
+import pytest
+from autopkglib import ProcessorError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "mau")
+FEED_URL = "https://officecdnmac.microsoft.com/pr/test/MacAutoupdate/0409XCEL2019.xml"
+
+
+@pytest.fixture
+def provider(tmp_path):
+    processor = provider_module.MSOfficeMacURLandUpdateInfoProvider(
+        {
+            "RECIPE_CACHE_DIR": str(tmp_path),
+            "feed_cache_hits": 0,
+            "feed_cache_misses": 0,
+        }
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    return processor
+
+
+@pytest.fixture
+def feed():
+    with open(os.path.join(FIXTURES_DIR, "0409XCEL2019-delta.xml"), "rb") as f:
+        return f.read()
+
+
+def test_only_read_keys_are_kept(provider):
+    data = plistlib.dumps(
+        [
+            {
+                "Title": "Excel",
+                "Update Version": "16.80.23121017",
+                "Location": "\nhttps://example.com/Excel_Updater.pkg\n",
+                "Release Notes": "long text",
+                "Date": datetime.datetime(2023, 12, 12),
+                "Localized": {
+                    "1036": {"Short Description": " Mise à jour ", "Notes": "x"},
+                },
+            }
+        ]
+    )
+    (entry,) = provider.parse_feed(data)
+    assert entry == {
+        "Title": "Excel",
+        "Update Version": "16.80.23121017",
+        "Location": "https://example.com/Excel_Updater.pkg",
+        "Localized": {"1036": {"Short Description": " Mise à jour "}},
+    }
+
+
+def test_latest_stops_at_first_full_updater(provider, feed):
+    # Cut the feed off in the middle of the last entry; 'latest' never gets
+    # that far.
+    truncated = feed[: feed.rindex(b"<dict>") + 20]
+    item = provider.select_update(provider.iter_feed(truncated), "latest")
+    assert item["Update Version"] == "16.80.23121017"
+    assert not item.get("FullUpdaterLocation")
+    with pytest.raises(ProcessorError):
+        provider.select_update(provider.iter_feed(truncated), "latest-delta")
+
+
+def test_unchanged_feed_is_not_parsed_again(provider, feed, monkeypatch):
+    responses = [
+        ({"http_result_code": "200", "etag": '"abc"'}, feed),
+        ({"http_result_code": "304"}, b""),
+    ]
+    requests = []
+
+    def fetch_feeds(feed_requests):
+        requests.extend(feed_requests)
+        return [responses.pop(0)]
+
+    monkeypatch.setattr(provider, "fetch_feeds", fetch_feeds)
+
+    first = provider.get_feed_metadata([FEED_URL])[FEED_URL]
+    assert first == provider.parse_feed(feed)
+
+    def iter_feed(data):
+        raise AssertionError("parsed a cached feed")
+
+    monkeypatch.setattr(provider, "iter_feed", iter_feed)
+    second = provider.get_feed_metadata([FEED_URL])[FEED_URL]
+    assert requests[1][1]["If-None-Match"] == '"abc"'
+    assert provider.env["feed_cache_misses"] == 1
+    assert provider.env["feed_cache_hits"] == 1
+    assert second == first
+    assert provider.select_update(second, "latest-delta")["Location"].endswith(
+        "16.76.23081101_to_16.80.23121017_Delta.pkg"
+    )
@@ -0,0 +1,95 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for MSOfficeUpdateDownloader"""
+
+import hashlib
+import os
+
+import pytest
+from autopkglib import ProcessorError
+from MSOfficeUpdateDownloader import MSOfficeUpdateDownloader
+
+PKG_PATH = "/pr/Microsoft_Excel_16.80.23121017_Updater.pkg"
+PKG = os.urandom(300_000)
+
+
+def run(tmp_path, url, **env):
+    processor = MSOfficeUpdateDownloader(
+        dict(env, url=url, RECIPE_CACHE_DIR=str(tmp_path))
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    processor.main()
+    return processor.env
+
+
+def test_verified_download_is_not_requested_again(tmp_path, file_server):
+    file_server.files[PKG_PATH] = PKG
+    url = file_server.url(PKG_PATH)
+    digest = hashlib.sha256(PKG).hexdigest()
+
+    env = run(tmp_path, url, expected_hash=digest, expected_size=str(len(PKG)))
+    assert env["download_changed"]
+    with open(env["pathname"], "rb") as f:
+        assert f.read() == PKG
+    env = run(tmp_path, url, expected_hash=digest, expected_size=str(len(PKG)))
+    assert not env["download_changed"]
+    assert len(file_server.requests) == 1
+
+
+def test_conditional_request_without_digest(tmp_path, file_server):
+    file_server.files[PKG_PATH] = PKG
+    url = file_server.url(PKG_PATH)
+
+    assert run(tmp_path, url)["download_changed"]
+    env = run(tmp_path, url)
+    assert not env["download_changed"]
+    assert file_server.requests[1][1]["If-None-Match"]
+    with open(env["pathname"], "rb") as f:
+        assert f.read() == PKG
+
+    file_server.files[PKG_PATH] = PKG[::-1]
+    env = run(tmp_path, url)
+    assert env["download_changed"]
+    with open(env["pathname"], "rb") as f:
+        assert f.read() == PKG[::-1]
+
+
+def test_changed_file_is_downloaded_again(tmp_path, file_server):
+    file_server.files[PKG_PATH] = PKG
+    url = file_server.url(PKG_PATH)
+    env = run(tmp_path, url)
+    with open(env["pathname"], "ab") as f:
+        f.write(b"x")
+
+    assert run(tmp_path, url)["download_changed"]
+    assert "If-None-Match" not in file_server.requests[1][1]
+
+
+def test_announced_size_mismatch(tmp_path, file_server):
+    file_server.files[PKG_PATH] = PKG
+    url = file_server.url(PKG_PATH)
+    with pytest.raises(ProcessorError, match="server announced"):
+        run(tmp_path, url, expected_size=str(len(PKG) + 1))
+    # curl itself refuses a file announced larger than --max-filesize
+    with pytest.raises(ProcessorError, match="exit code 63"):
+        run(tmp_path, url, expected_size=str(len(PKG) - 1))
+    assert os.listdir(tmp_path / "downloads") == []
+
+
+def test_digest_mismatch(tmp_path, file_server):
+    file_server.files[PKG_PATH] = PKG
+    with pytest.raises(ProcessorError, match="sha256 mismatch"):
+        run(tmp_path, file_server.url(PKG_PATH), expected_hash="0" * 64)
+    assert os.listdir(tmp_path / "downloads") == []
@@ -0,0 +1,124 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the fleet update planner of MSOfficeMacURLandUpdateInfoProvider"""
+
+import os
+
+import MSOfficeMacURLandUpdateInfoProvider as provider_module
+import pytest
+from autopkglib import ProcessorError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "mau")
+TARGET = "16.80.23121017"
+DELTA_URL = (
+    "https://officecdnmac.microsoft.com/pr/C1297A47-86C4-4C1F-97FA-950631F94777/"
+    "MacAutoupdate/Microsoft_Excel_%s_to_16.80.23121017_Delta.pkg"
+)
+FULL_URL = (
+    "https://officecdnmac.microsoft.com/pr/C1297A47-86C4-4C1F-97FA-950631F94777/"
+    "MacAutoupdate/Microsoft_Excel_16.80.23121017_Updater.pkg"
+)
+INSTALLED = {
+    "16.75.23071500": 5,
+    "16.76.23081101": 10,
+    "16.77.23091003": 20,
+    "16.78.23100802": 30,
+    "16.79.23111019": 40,
+    TARGET: 100,
+}
+
+
+@pytest.fixture
+def provider():
+    processor = provider_module.MSOfficeMacURLandUpdateInfoProvider({})
+    processor.output = lambda msg, verbose_level=1: None
+    return processor
+
+
+@pytest.fixture
+def metadata(provider):
+    with open(os.path.join(FIXTURES_DIR, "0409XCEL2019-delta.xml"), "rb") as f:
+        return provider.parse_feed(f.read())
+
+
+def packages_by_url(plan):
+    return {package["url"]: package for package in plan["packages"]}
+
+
+def test_exact_cover_picks_fewest_deltas(provider, metadata):
+    plan = provider.plan_fleet_updates(metadata, INSTALLED)
+
+    assert plan["target_version"] == TARGET
+    assert plan["up_to_date"] == [TARGET]
+    packages = packages_by_url(plan)
+    # Two deltas cover 16.76-16.79; the narrower 16.77 delta isn't needed.
+    assert sorted(packages) == sorted(
+        [FULL_URL, DELTA_URL % "16.76.23081101", DELTA_URL % "16.78.23100802"]
+    )
+    assert packages[DELTA_URL % "16.76.23081101"]["covers"] == [
+        "16.76.23081101",
+        "16.77.23091003",
+    ]
+    assert packages[DELTA_URL % "16.78.23100802"]["covers"] == [
+        "16.78.23100802",
+        "16.79.23111019",
+    ]
+    assert plan["package_bytes"] == 1_150_000_000 + 420_000_000 + 400_000_000
+    assert plan["fleet_bytes"] == (
+        1_150_000_000 * 5 + 420_000_000 * 30 + 400_000_000 * 70
+    )
+
+
+def test_greedy_cover_when_too_many_deltas(provider, metadata, monkeypatch):
+    monkeypatch.setattr(provider_module, "MAX_EXACT_COVER_DELTAS", 0)
+    plan = provider.plan_fleet_updates(metadata, INSTALLED)
+
+    packages = packages_by_url(plan)
+    # Greedy takes the smallest of the equally wide deltas first and then
+    # needs both of the others as well.
+    assert len(packages) == 4
+    assert packages[DELTA_URL % "16.77.23091003"]["covers"] == [
+        "16.77.23091003",
+        "16.78.23100802",
+    ]
+    assert packages[DELTA_URL % "16.76.23081101"]["covers"] == ["16.76.23081101"]
+    assert packages[DELTA_URL % "16.78.23100802"]["covers"] == ["16.79.23111019"]
+    covered = [v for package in plan["packages"] for v in package["covers"]]
+    assert sorted(covered) == sorted(v for v in INSTALLED if v != TARGET)
+
+
+def test_full_updater_covers_versions_without_a_delta(provider, metadata):
+    plan = provider.plan_fleet_updates(metadata, INSTALLED)
+
+    full = packages_by_url(plan)[FULL_URL]
+    assert full["type"] == "full"
+    assert full["covers"] == ["16.75.23071500"]
+    assert full["machines"] == 5
+
+
+def test_full_updater_is_always_planned(provider, metadata):
+    plan = provider.plan_fleet_updates(metadata, {"16.79.23111019": 3})
+
+    packages = packages_by_url(plan)
+    assert packages[FULL_URL]["covers"] == []
+    assert packages[FULL_URL]["machines"] == 0
+    assert packages[DELTA_URL % "16.78.23100802"]["machines"] == 3
+    assert plan["fleet_bytes"] == 400_000_000 * 3
+
+
+def test_feed_without_full_updater(provider, metadata):
+    deltas_only = [item for item in metadata if item.get("FullUpdaterLocation")]
+    with pytest.raises(ProcessorError):
+        provider.plan_fleet_updates(deltas_only, INSTALLED)
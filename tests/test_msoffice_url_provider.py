@@ -0,0 +1,195 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the batch, latest-delta, multi-channel and localized description
+modes of MSOfficeMacURLandUpdateInfoProvider"""
+
+import os
+import plistlib
+
+import MSOfficeMacURLandUpdateInfoProvider as provider_module
+import pytest
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "mau")
+PRODUCTION = provider_module.CHANNELS["Production"]
+INSIDER_SLOW = provider_module.CHANNELS["InsiderSlow"]
+
+
+def load_fixture():
+    with open(os.path.join(FIXTURES_DIR, "0409XCEL2019-delta.xml"), "rb") as f:
+        return plistlib.load(f)
+
+
+@pytest.fixture
+def feeds():
+    """The dict of url -> feed data that fetch_feeds serves from."""
+    return {}
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch, feeds):
+    monkeypatch.setattr(
+        provider_module,
+        "get_pref",
+        lambda key: str(tmp_path) if key == "CACHE_DIR" else None,
+    )
+    processor = provider_module.MSOfficeMacURLandUpdateInfoProvider(
+        {
+            "version": "latest",
+            "channel": "Production",
+            "NAME": "Excel",
+            "munki_required_update_name": "",
+            "locale_id": "1033",
+        }
+    )
+    processor.output = lambda msg, verbose_level=1: None
+    processor.requested = []
+
+    def fetch_feeds(feed_requests):
+        processor.requested.extend(url for url, _ in feed_requests)
+        return [({"http_result_code": "200"}, feeds[url]) for url, _ in feed_requests]
+
+    monkeypatch.setattr(processor, "fetch_feeds", fetch_feeds)
+    return processor
+
+
+def serve(provider, feeds, product, channel_id, entries, culture_code="0409"):
+    feeds[provider.get_feed_url(product, channel_id, culture_code)] = plistlib.dumps(
+        entries
+    )
+
+
+def test_batch_mode(provider, feeds):
+    entries = load_fixture()
+    serve(provider, feeds, "Excel2019", PRODUCTION, entries)
+    serve(
+        provider,
+        feeds,
+        "Word2019",
+        PRODUCTION,
+        [
+            dict(
+                entry,
+                Location=entry["Location"].replace("Excel", "Word"),
+                Title=entry["Title"].replace("Excel", "Word"),
+            )
+            for entry in entries
+        ],
+    )
+    provider.env.update({"products": "Excel2019, Word2019", "version": "latest-delta"})
+    provider.main()
+
+    updates = provider.env["office_updates"]
+    assert sorted(updates) == ["Excel2019", "Word2019"]
+    assert len(provider.requested) == 2
+    for product, name in (("Excel2019", "Excel"), ("Word2019", "Word")):
+        assert updates[product]["version"] == "16.80.23121017"
+        assert updates[product]["url"].endswith(
+            "Microsoft_%s_16.76.23081101_to_16.80.23121017_Delta.pkg" % name
+        )
+        # Without a single NAME, deltas require the product itself
+        assert updates[product]["additional_pkginfo"]["requires"] == [
+            "%s-16.76.23081101" % product
+        ]
+
+
+def test_latest_delta(provider, feeds):
+    entries = load_fixture()
+    # Put the delta to 16.79 first: feed order says nothing about which
+    # delta is newest
+    entries.sort(key=lambda entry: entry["Update Version"])
+    serve(provider, feeds, "Excel2019", PRODUCTION, entries)
+    provider.env.update({"product": "Excel2019", "version": "latest-delta"})
+    provider.main()
+
+    assert provider.env["version"] == "16.80.23121017"
+    # Of the deltas to the newest version, the one from the oldest version
+    assert provider.env["url"].endswith(
+        "Microsoft_Excel_16.76.23081101_to_16.80.23121017_Delta.pkg"
+    )
+    assert provider.env["minimum_version_for_delta"] == "16.76.23081101"
+    pkginfo = provider.env["additional_pkginfo"]
+    assert pkginfo["requires"] == ["Excel-16.76.23081101"]
+    assert pkginfo["installs"][0]["minimum_update_version"] == "16.76.23081101"
+    assert provider.env["expected_size"] == "420000000"
+
+
+def test_channels(provider, feeds):
+    entries = load_fixture()
+    serve(provider, feeds, "Excel2019", PRODUCTION, entries)
+    serve(
+        provider,
+        feeds,
+        "Excel2019",
+        INSIDER_SLOW,
+        [entry for entry in entries if entry["Update Version"] == "16.79.23111019"],
+    )
+    # Production by name and by UUID is the same feed
+    provider.env.update(
+        {"product": "Excel2019", "channels": ["Production", "InsiderSlow", PRODUCTION]}
+    )
+    provider.main()
+
+    assert len(provider.requested) == 2
+    updates = provider.env["channel_updates"]
+    assert sorted(updates) == ["InsiderSlow", "Production"]
+    assert updates["Production"]["version"] == "16.80.23121017"
+    assert updates["InsiderSlow"]["version"] == "16.79.23111019"
+    assert provider.env["channel_diff"] == {
+        "newest_version": "16.80.23121017",
+        "newest_channels": ["Production"],
+        "ahead_of": {"Production": ["InsiderSlow"], "InsiderSlow": []},
+    }
+
+
+def test_diff_channels_without_version(provider):
+    diff = provider.diff_channels(
+        {"Production": {"version": "16.80"}, "InsiderSlow": {"version": None}}
+    )
+    assert diff == {
+        "newest_version": "16.80",
+        "newest_channels": ["Production"],
+        "ahead_of": {"Production": [], "InsiderSlow": []},
+    }
+    diff = provider.diff_channels({"InsiderSlow": {"version": None}})
+    assert diff["newest_version"] == ""
+    assert diff["newest_channels"] == []
+
+
+def test_localized_descriptions(provider, feeds):
+    entries = load_fixture()
+    serve(provider, feeds, "Excel2019", PRODUCTION, entries)
+    german = [
+        dict(
+            entry,
+            Localized={
+                "1031": {
+                    "Short Description": "Microsoft Excel für Mac %s"
+                    % entry["Update Version"]
+                }
+            },
+        )
+        for entry in entries
+    ]
+    serve(provider, feeds, "Excel2019", PRODUCTION, german, culture_code="0407")
+    provider.env.update({"product": "Excel2019", "locale_ids": "1033, 1031"})
+    provider.main()
+
+    assert provider.env["description"] == "Microsoft Excel for Mac 16.80.23121017"
+    # The default locale's feed is only fetched once
+    assert len(provider.requested) == 2
+    assert provider.env["additional_pkginfo"]["localized_descriptions"] == {
+        "1033": "Microsoft Excel for Mac 16.80.23121017",
+        "1031": "Microsoft Excel für Mac 16.80.23121017",
+    }
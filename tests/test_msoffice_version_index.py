@@ -0,0 +1,117 @@
+#
+# Copyright 2026 The AutoPkg Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the local version index of MSOfficeMacURLandUpdateInfoProvider"""
+
+import os
+import plistlib
+
+import MSOfficeMacURLandUpdateInfoProvider as provider_module
+import pytest
+from autopkglib import ProcessorError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "mau")
+CHANNEL = "C1297A47-86C4-4C1F-97FA-950631F94777"
+
+
+@pytest.fixture
+def provider(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        provider_module,
+        "get_pref",
+        lambda key: str(tmp_path) if key == "CACHE_DIR" else None,
+    )
+    processor = provider_module.MSOfficeMacURLandUpdateInfoProvider({})
+    processor.output = lambda msg, verbose_level=1: None
+    return processor
+
+
+@pytest.fixture
+def metadata(provider):
+    with open(os.path.join(FIXTURES_DIR, "0409XCEL2019-delta.xml"), "rb") as f:
+        return provider.parse_feed(f.read())
+
+
+def test_lookup_indexed_versions(provider, metadata):
+    provider.index_feed("Excel2019", CHANNEL, metadata)
+    provider.save_version_index()
+
+    full = provider.lookup_version("Excel2019", CHANNEL, "16.80.23121017")
+    assert full["Location"].endswith("Microsoft_Excel_16.80.23121017_Updater.pkg")
+    assert full["Size"] == "1150000000"
+
+
+def test_full_updater_from_delta_record(provider, metadata):
+    deltas = [item for item in metadata if item.get("FullUpdaterLocation")]
+    provider.index_feed("Excel2019", CHANNEL, deltas)
+    provider.save_version_index()
+
+    full = provider.lookup_version("Excel2019", CHANNEL, "16.80.23121017")
+    assert full["Location"].endswith("Microsoft_Excel_16.80.23121017_Updater.pkg")
+    assert full["Size"] == "1150000000"
+    assert "FullUpdaterLocation" not in full
+
+
+def test_delta_without_source_version_is_not_indexed(provider, metadata):
+    delta = dict(metadata[0], Triggers={"Registered File": {}})
+    provider.index_entry("Excel2019", CHANNEL, delta)
+    assert provider.new_index_entries == {}
+
+    with pytest.raises(ProcessorError, match="not in the local version index"):
+        provider.lookup_version("Excel2019", CHANNEL, "16.80.23121017")
+
+
+def test_every_feed_entry_is_indexed(provider, tmp_path, monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, "0409XCEL2019-delta.xml"), "rb") as f:
+        feed = f.read()
+    monkeypatch.setattr(
+        provider,
+        "fetch_feeds",
+        lambda feed_requests: [({"http_result_code": "200"}, feed)],
+    )
+    provider.env.update(
+        {
+            "product": "Excel2019",
+            "version": "latest",
+            "channel": "Production",
+            "NAME": "Excel",
+            "munki_required_update_name": "",
+            "locale_id": "1033",
+            "feed_cache_hits": 0,
+            "feed_cache_misses": 0,
+        }
+    )
+    provider.main()
+    assert provider.env["version"] == "16.80.23121017"
+
+    with open(provider.get_version_index_path(), "rb") as f:
+        index = plistlib.load(f)["Excel2019"][CHANNEL]
+    assert sorted(index) == ["16.79.23111019", "16.80.23121017"]
+    # 'latest' stops at the first full updater, but the rest is indexed too
+    assert index["16.79.23111019"]["full"]["Location"].endswith(
+        "Microsoft_Excel_16.79.23111019_Updater.pkg"
+    )
+    assert sorted(index["16.79.23111019"]["deltas"]) == ["16.78.23100802"]
+    assert sorted(index["16.80.23121017"]["deltas"]) == [
+        "16.76.23081101",
+        "16.77.23091003",
+        "16.78.23100802",
+    ]
+    assert index["16.80.23121017"]["full"]["Size"] == "1150000000"
+
+
+def test_entries_are_per_instance(provider, metadata):
+    provider.index_feed("Excel2019", CHANNEL, metadata)
+    other = provider_module.MSOfficeMacURLandUpdateInfoProvider({})
+    assert other.new_index_entries == {}